@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+aggregate.py
+
+Rollups of the speedtest time series by room, hour-of-day and day-of-week. The rollups summarize each group of samples
+(mean, median and percentiles of download and upload Mbps, ping jitter, packet loss and sample count) and make weak
+Wi-Fi rooms, and the times of day they are weak, stand out without reading a raw line per address.
+
+Rollups are computed with vectorized pandas group-bys and cached. As new samples arrive only the groups those samples
+fall into are recomputed.
+
+Command line usage (prints a report)..
+
+    aggregate.py -f speedtest.log [--by room|hour|weekday] [--tz America/New_York]
+"""
+
+import argparse
+import logging
+import pandas as pd
+from pandas.core.frame import DataFrame
+from typing import Dict, Iterable, List, Union
+from ingest import read_jsonl_files
+from loggingrmb import LoggingRmb
+from model import MainObject
+from samples import SampleArray
+
+logger = logging.getLogger()
+
+# Rollup name -> group-by keys
+ROLLUPS = {
+    'room': ['address'],
+    'hour': ['address', 'hour'],
+    'weekday': ['address', 'weekday'],
+}
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+QUANTILES = {'p5': 0.05, 'p25': 0.25, 'p75': 0.75, 'p95': 0.95}
+
+SAMPLE_COLUMNS = ['timestamp', 'address', 'hour', 'weekday', 'download_mbps', 'upload_mbps', 'jitter', 'packet_loss']
+
+
+def samples_frame(data_objects: Union[Iterable[MainObject], SampleArray], tz: str = 'UTC') -> DataFrame:
+    """
+    One row per sample with only the columns needed for the rollups. Hour and weekday are taken in timezone tz.
+    """
+
+    if isinstance(data_objects, SampleArray):
+        samples = data_objects
+        df = samples.to_frame()[['timestamp', 'address', 'download_mbps', 'upload_mbps']]
+        df['timestamp'] = df['timestamp'].dt.tz_localize('UTC')
+        df['jitter'] = samples.column('ping_jitter').astype(float)
+        df['packet_loss'] = samples.column('packet_loss').astype(float)
+    else:
+        rows = [(
+            data_object.timestamp,
+            f'{data_object.address.address}_{data_object.address.room}',
+            data_object.download.mbps,
+            data_object.upload.mbps,
+            data_object.ping.jitter,
+            data_object.packetLoss,
+        ) for data_object in data_objects]
+        df = pd.DataFrame(rows, columns=['timestamp', 'address', 'download_mbps', 'upload_mbps', 'jitter',
+                                         'packet_loss'])
+        df['timestamp'] = pd.to_datetime(df['timestamp'], format='%Y-%m-%dT%H:%M:%SZ', utc=True)
+
+    df['timestamp'] = df['timestamp'].dt.tz_convert(tz)
+    df['packet_loss'] = df['packet_loss'].astype(float)
+
+    # Zero-valued throughput is a failed measurement, not a slow one (same convention as plot-mbps.py)
+    for column in ['download_mbps', 'upload_mbps']:
+        df[column] = df[column].where(df[column] > 0.)
+
+    df['hour'] = df['timestamp'].dt.hour
+    df['weekday'] = pd.Categorical.from_codes(df['timestamp'].dt.weekday, categories=WEEKDAYS, ordered=True)
+
+    return df[SAMPLE_COLUMNS]
+
+
+def compute_rollup(samples: DataFrame, keys: List[str]) -> DataFrame:
+    grouped = samples.groupby(keys, observed=True, sort=True)
+
+    stats = grouped.agg(
+        samples=('timestamp', 'size'),
+        download_mean=('download_mbps', 'mean'),
+        download_median=('download_mbps', 'median'),
+        upload_mean=('upload_mbps', 'mean'),
+        upload_median=('upload_mbps', 'median'),
+        jitter_mean=('jitter', 'mean'),
+        packet_loss_mean=('packet_loss', 'mean'),
+    )
+
+    quantiles = grouped[['download_mbps', 'upload_mbps']].quantile(list(QUANTILES.values())).unstack()
+    names = {value: name for name, value in QUANTILES.items()}
+    quantiles.columns = [f"{column.split('_')[0]}_{names[q]}" for column, q in quantiles.columns]
+
+    return stats.join(quantiles)
+
+
+class RollupCache:
+    """
+    Holds the samples seen so far and the rollups computed over them.
+
+    add() appends new samples and recomputes only the groups touched by them; every other row of each cached rollup is
+    reused as-is. (Medians and percentiles can't be merged from partial results, so a touched group is recomputed over
+    all of its samples.)
+    """
+
+    def __init__(self, tz: str = 'UTC'):
+        self.tz = tz
+        self.samples = None
+        self.rollups: Dict[str, DataFrame] = {}
+
+    def add(self, data_objects: Union[Iterable[MainObject], SampleArray]) -> int:
+        new_samples = samples_frame(data_objects, self.tz)
+        if len(new_samples) == 0:
+            return 0
+
+        if self.samples is None:
+            self.samples = new_samples
+            self.rollups = {name: compute_rollup(self.samples, keys) for name, keys in ROLLUPS.items()}
+            return len(new_samples)
+
+        self.samples = pd.concat([self.samples, new_samples], ignore_index=True)
+
+        for name, keys in ROLLUPS.items():
+            touched = pd.MultiIndex.from_frame(new_samples[keys].drop_duplicates())
+            in_touched = pd.MultiIndex.from_frame(self.samples[keys]).isin(touched)
+            updated = compute_rollup(self.samples[in_touched], keys)
+
+            rollup = self.rollups[name]
+            rollup = rollup[~rollup.index.isin(updated.index)]
+            self.rollups[name] = pd.concat([rollup, updated]).sort_index()
+
+        logger.debug(f"Rollups updated with {len(new_samples)} new samples")
+        return len(new_samples)
+
+    def rollup(self, name: str) -> DataFrame:
+        if name not in ROLLUPS:
+            raise ValueError(f"Unknown rollup '{name}' (expected one of {', '.join(ROLLUPS)})")
+        if self.samples is None:
+            return pd.DataFrame()
+        return self.rollups[name]
+
+
+def heatmap_matrix(cache: RollupCache, column: str = 'download_mean') -> DataFrame:
+    """
+    Rooms (rows) by hour-of-day (columns), for a heatmap of one rollup statistic
+    """
+    hourly = cache.rollup('hour')
+    if len(hourly) == 0:
+        return hourly
+    return hourly[column].unstack('hour').reindex(columns=range(24))
+
+
+def print_report(cache: RollupCache, name: str) -> None:
+    columns = ['samples', 'download_mean', 'download_median', 'download_p5', 'download_p95',
+               'upload_mean', 'upload_median', 'upload_p5', 'upload_p95', 'jitter_mean', 'packet_loss_mean']
+    with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', 200):
+        print(cache.rollup(name)[columns].round(2))
+
+
+if __name__ == "__main__":
+
+    LoggingRmb(console_level=logging.INFO).setup()
+
+    parser = argparse.ArgumentParser(description='Speedtest rollups by room, hour-of-day and day-of-week')
+    parser.add_argument('-f', '--file', nargs='+', default=['speedtest-example.json'],
+                        help='JSON lines input file(s), directories or glob patterns')
+    parser.add_argument('--by', choices=list(ROLLUPS), default='room')
+    parser.add_argument('--tz', default='UTC', help='Timezone used for hour-of-day and day-of-week (default: UTC)')
+    args = parser.parse_args()
+
+    rollups = RollupCache(tz=args.tz)
+    rollups.add(read_jsonl_files(args.file, compact=True)[0])
+    print_report(rollups, args.by)
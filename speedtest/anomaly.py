@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+anomaly.py
+
+Detection of degradations in the speedtest series (download and upload Mbps, ping latency and packet loss), per address
+and room, so that a Wi-Fi problem raises an alert rather than waiting to be noticed on the chart.
+
+Each value is scored against the history of its series before it is added to it, by three detectors..
+
+    mad    Robust z-score against the median and MAD (median absolute deviation) of the last `window` values. Catches
+           single bad results.
+    ewma   Deviation from an exponentially weighted moving average, in units of its exponentially weighted standard
+           deviation.
+    cusum  One-sided CUSUM of the EWMA deviations (change-point detection). Catches a sustained shift which is too small
+           for the other two to flag any single result, e.g. a laptop moved to a room with a weaker signal.
+
+Only degradations are flagged: lower Mbps, higher latency or packet loss. No series is scored until it has min_samples
+values. Each metric's scale has an absolute floor (METRICS) and a relative one (relative_floor, a fraction of the
+baseline), which keep a series which hardly varies (e.g. packet loss of 0, or a wired link's steady 94 Mbps) from
+flagging trivial changes: with the defaults, a result is flagged by mad or ewma only if it is at least 60% below the
+baseline (Mbps), both 30 ms and 60% above it (latency), or 12 points above it (packet loss, %).
+
+The defaults are calibrated on speedtest-example.json (1733 results from 6 address/rooms, over two and a half weeks):
+they flag 98 results (about 6%, with 142 anomalies between them), among them 17 of the 26 failed tests (0 Mbps); most of
+the others are latency spikes of 2-4 times the baseline, and uploads well below it. Lower the thresholds for more
+sensitive alerting.
+
+AnomalyDetector works incrementally, one result at a time, as results are appended by speedtest-runner.py or the
+collector; its state is kept in a JSON file between runs. detect_batch computes the same scores for a whole SampleArray
+with vectorized numpy/pandas operations, to backfill history (and to seed the incremental state).
+
+Alerts (one Anomaly per flagged value and detector) are appended as JSON lines to alerts_file and/or POSTed to
+webhook_url.
+
+Command line usage (backfill; prints the anomalies found, and optionally writes the alerts and the state)..
+
+    anomaly.py -f speedtest.log [--alerts speedtest-alerts.log] [--state speedtest-anomaly.json]
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import urllib.error
+import urllib.request
+from collections import deque
+from statistics import median
+from typing import Dict, List, Optional, Tuple, Union
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from pandas.core.frame import DataFrame
+from pydantic import BaseModel, Field, ValidationError
+from appendwriter import AppendWriter
+from ingest import read_jsonl_files
+from loggingrmb import LoggingRmb
+from model import MainObject
+from samples import Sample, SampleArray
+
+logger = logging.getLogger()
+
+# metric -> (direction of a degradation, floor of the scale used for scoring)
+METRICS = {
+    'download_mbps': (-1, 1.0),
+    'upload_mbps': (-1, 1.0),
+    'ping_latency': (1, 5.0),
+    'packet_loss': (1, 2.0),
+}
+
+MAD_TO_SIGMA = 1.4826  # (MAD of normally distributed values, to their standard deviation)
+
+BATCH_ROWS = 65536  # (rows of the sliding window matrix processed at a time by detect_batch)
+
+
+class DetectorConfig(BaseModel):
+    window: int = Field(default=48, gt=1, description='Values in the rolling median/MAD window')
+    min_samples: int = Field(default=12, gt=1, description='Values in a series before it is scored')
+    mad_threshold: float = Field(default=6.0, gt=0)
+    ewma_alpha: float = Field(default=0.1, gt=0, lt=1)
+    ewma_threshold: float = Field(default=6.0, gt=0)
+    cusum_drift: float = Field(default=0.5, ge=0)
+    cusum_threshold: float = Field(default=15.0, gt=0)
+    relative_floor: float = Field(default=0.1, ge=0, description='Floor of the scale, as a fraction of the baseline')
+    state_file: str = Field(default=None, description='Incremental state, kept between runs')
+    alerts_file: str = Field(default=None, description='Alerts are appended to this file (JSON lines)')
+    webhook_url: str = Field(default=None, description='Alerts are POSTed (as JSON) to this URL')
+
+
+class Anomaly(BaseModel):
+    timestamp: str
+    address: str
+    room: str
+    metric: str
+    detector: str
+    value: float
+    baseline: float
+    score: float
+
+
+class SeriesState(BaseModel):
+    address: str
+    room: str
+    metric: str
+    window: List[float] = []
+    count: int = 0
+    mean: float = 0.
+    var: float = 0.
+    cusum: float = 0.
+
+
+class DetectorState(BaseModel):
+    series: List[SeriesState] = []
+
+
+def format_timestamp(timestamp: int) -> str:
+    return pd.Timestamp(timestamp, unit='s').strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class SeriesDetector:
+    """
+    The streaming detectors for one metric of one address/room
+    """
+
+    def __init__(self, config: DetectorConfig, state: SeriesState):
+        self.config = config
+        self.state = state
+        self.window = deque(state.window, maxlen=config.window)
+        self.direction, self.floor = METRICS[state.metric]
+
+    def update(self, timestamp: int, value: float) -> List[Anomaly]:
+        config, state = self.config, self.state
+        anomalies = []
+
+        def flag(detector: str, baseline: float, score: float) -> None:
+            anomalies.append(Anomaly(timestamp=format_timestamp(timestamp), address=state.address, room=state.room,
+                                     metric=state.metric, detector=detector, value=value, baseline=baseline,
+                                     score=score))
+
+        if state.count >= config.min_samples:
+            window_median = median(self.window)
+            mad = median(abs(v - window_median) for v in self.window)
+            score = self.direction * (value - window_median) / max(MAD_TO_SIGMA * mad, self.floor,
+                                                                   config.relative_floor * abs(window_median))
+            if score > config.mad_threshold:
+                flag('mad', window_median, score)
+
+            deviation = self.direction * (value - state.mean) / max(math.sqrt(state.var), self.floor,
+                                                                    config.relative_floor * abs(state.mean))
+            if deviation > config.ewma_threshold:
+                flag('ewma', state.mean, deviation)
+
+            state.cusum = max(0., state.cusum + deviation - config.cusum_drift)
+            if state.cusum > config.cusum_threshold:
+                flag('cusum', state.mean, state.cusum)
+                state.cusum = 0.
+
+        # (West's incremental update of the exponentially weighted mean and variance)
+        if state.count == 0:
+            state.mean = value
+        else:
+            diff = value - state.mean
+            increment = config.ewma_alpha * diff
+            state.mean += increment
+            state.var = (1 - config.ewma_alpha) * (state.var + diff * increment)
+        self.window.append(value)
+        state.count += 1
+        return anomalies
+
+
+class AnomalyDetector:
+
+    def __init__(self, config: DetectorConfig):
+        self.config = config
+        self.series: Dict[Tuple[str, str, str], SeriesDetector] = {}
+        self.alerts_writer = AppendWriter(config.alerts_file) if config.alerts_file else None
+        if config.state_file and os.path.exists(config.state_file):
+            try:
+                with open(config.state_file) as f:
+                    self.set_state(DetectorState(**json.load(f)))
+            except (OSError, json.JSONDecodeError, ValidationError) as e:
+                logger.warning(f"Unable to load anomaly detector state from {config.state_file}, starting afresh: {e}")
+
+    def set_state(self, state: DetectorState) -> None:
+        self.series = {(s.address, s.room, s.metric): SeriesDetector(self.config, s) for s in state.series}
+
+    def get_state(self) -> DetectorState:
+        series = []
+        for detector in self.series.values():
+            detector.state.window = list(detector.window)
+            series.append(detector.state)
+        return DetectorState(series=series)
+
+    def save_state(self) -> None:
+        if not self.config.state_file:
+            return
+        temp_file = f"{self.config.state_file}.tmp"
+        with open(temp_file, 'w') as f:
+            f.write(self.get_state().model_dump_json())
+        os.replace(temp_file, self.config.state_file)
+
+    def update(self, sample: Sample) -> List[Anomaly]:
+        """
+        Scores one result against its series (and adds it to them). Returns (and sends) any anomalies.
+        """
+        anomalies = []
+        for metric in METRICS:
+            value = getattr(sample, metric)
+            if value is None or math.isnan(value):
+                continue
+            key = (sample.address, sample.room, metric)
+            if key not in self.series:
+                self.series[key] = SeriesDetector(self.config,
+                                                  SeriesState(address=sample.address, room=sample.room, metric=metric))
+            anomalies += self.series[key].update(sample.timestamp, value)
+        for anomaly in anomalies:
+            self.alert(anomaly)
+        return anomalies
+
+    def update_line(self, line: str) -> List[Anomaly]:
+        """
+        As update, for one line of speedtest JSON output (lines which aren't results are ignored)
+        """
+        try:
+            sample = Sample.from_json(json.loads(line))
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError, AttributeError):
+            return []
+        return self.update(sample)
+
+    def alert(self, anomaly: Anomaly) -> None:
+        logger.warning(f"Anomaly: {anomaly.address} {anomaly.room} {anomaly.metric}={anomaly.value:.2f} at "
+                       f"{anomaly.timestamp} ({anomaly.detector}, baseline {anomaly.baseline:.2f}, "
+                       f"score {anomaly.score:.1f})")
+        if self.alerts_writer is not None:
+            self.alerts_writer.write(anomaly.model_dump_json())
+        if self.config.webhook_url:
+            post_webhook(self.config.webhook_url, anomaly)
+
+
+def post_webhook(url: str, anomaly: Anomaly, timeout: float = 5.) -> bool:
+    """
+    POSTs an anomaly as JSON. Failures are logged rather than raised: an alert must never stop data collection.
+    """
+    request = urllib.request.Request(url, data=anomaly.model_dump_json().encode('utf-8'), method='POST',
+                                     headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return 200 <= response.status < 300
+    except (urllib.error.URLError, OSError) as e:
+        logger.warning(f"Unable to post anomaly to {url}: {e}")
+        return False
+
+
+def rolling_median_mad(values: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The median and MAD of the (up to) `window` values preceding each value (NaN for the first value)
+    """
+    padded = np.concatenate([np.full(window, np.nan), values])
+    windows = sliding_window_view(padded, window)[1:len(values)]  # (the first value has no preceding values)
+    medians = np.full(len(values), np.nan)
+    mads = np.full(len(values), np.nan)
+    for start in range(0, len(windows), BATCH_ROWS):
+        block = windows[start:start + BATCH_ROWS]
+        block_medians = np.nanmedian(block, axis=1)
+        medians[start + 1:start + 1 + len(block)] = block_medians
+        mads[start + 1:start + 1 + len(block)] = np.nanmedian(np.abs(block - block_medians[:, None]), axis=1)
+    return medians, mads
+
+
+def detect_series(config: DetectorConfig, timestamps: np.ndarray, values: np.ndarray, metric: str,
+                  address: str, room: str) -> Tuple[List[dict], SeriesState]:
+    """
+    The batch equivalent of feeding one series (in time order, without NaNs) through a SeriesDetector. Returns the
+    anomalies and the state the SeriesDetector would have after the last value.
+    """
+    direction, floor = METRICS[metric]
+    n = len(values)
+    scored = np.arange(n) >= config.min_samples
+
+    with np.errstate(all='ignore'):
+        medians, mads = rolling_median_mad(values, config.window)
+        mad_scores = direction * (values - medians) / np.maximum(
+            np.maximum(MAD_TO_SIGMA * mads, floor), config.relative_floor * np.abs(medians))
+
+        # EWMA mean and variance after each value (the recursions of SeriesDetector.update, via pandas' ewm)
+        alpha = config.ewma_alpha
+        means = pd.Series(values).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+        prev_means = np.concatenate([values[:1], means[:-1]])
+        diffs = values - prev_means
+        variances = pd.Series((1 - alpha) * diffs ** 2).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+        prev_variances = np.concatenate([[0.], variances[:-1]])
+        deviations = direction * diffs / np.maximum(
+            np.maximum(np.sqrt(prev_variances), floor), config.relative_floor * np.abs(prev_means))
+
+    anomalies = []
+
+    def flag(i: int, detector: str, baseline: float, score: float) -> None:
+        anomalies.append(dict(timestamp=int(timestamps[i]), address=address, room=room, metric=metric,
+                              detector=detector, value=float(values[i]), baseline=float(baseline), score=float(score)))
+
+    mad_flags = scored & (mad_scores > config.mad_threshold)
+    ewma_flags = scored & (deviations > config.ewma_threshold)
+
+    # (the CUSUM resets when it fires, so it is the one sequential step)
+    cusum = 0.
+    for i in np.flatnonzero(scored).tolist():
+        if mad_flags[i]:
+            flag(i, 'mad', medians[i], mad_scores[i])
+        if ewma_flags[i]:
+            flag(i, 'ewma', prev_means[i], deviations[i])
+        cusum = max(0., cusum + float(deviations[i]) - config.cusum_drift)
+        if cusum > config.cusum_threshold:
+            flag(i, 'cusum', prev_means[i], cusum)
+            cusum = 0.
+
+    state = SeriesState(address=address, room=room, metric=metric, window=values[-config.window:].tolist(), count=n,
+                        mean=float(means[-1]) if n else 0., var=float(variances[-1]) if n else 0., cusum=cusum)
+    return anomalies, state
+
+
+def detect_batch(samples: Union[List[MainObject], SampleArray],
+                 config: Optional[DetectorConfig] = None) -> Tuple[DataFrame, DetectorState]:
+    """
+    Anomalies in a whole history (e.g. to backfill alerts, or to overlay on the plot), as a dataframe with the fields
+    of Anomaly (timestamp as a datetime), and the detector state at the end of the history
+    """
+    config = config or DetectorConfig()
+    if not isinstance(samples, SampleArray):
+        samples = SampleArray.from_main_objects(samples)
+
+    order = np.argsort(samples.column('timestamp'), kind='stable')
+    timestamps = samples.column('timestamp')[order]
+    locations = samples.column('location')[order]
+
+    anomalies, series = [], []
+    for code, (address, room) in enumerate(samples.locations):
+        in_location = locations == code
+        for metric in METRICS:
+            values = samples.column(metric)[order][in_location].astype(np.float64)
+            valid = ~np.isnan(values)
+            if not valid.any():
+                continue
+            found, state = detect_series(config, timestamps[in_location][valid], values[valid], metric, address, room)
+            anomalies += found
+            series.append(state)
+
+    df = pd.DataFrame(anomalies, columns=list(Anomaly.model_fields))
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='s')
+    df = df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+    return df, DetectorState(series=series)
+
+
+if __name__ == "__main__":
+
+    LoggingRmb(console_level=logging.INFO).setup()
+
+    parser = argparse.ArgumentParser(description='Find anomalies in speedtest history')
+    parser.add_argument('-f', '--file', nargs='+', required=True,
+                        help='JSON lines input file(s), directories or glob patterns (.gz files are decompressed)')
+    parser.add_argument('--alerts', help='Append the anomalies found to this alerts file')
+    parser.add_argument('--state', help='Write the detector state (to continue incrementally from the end of the '
+                                        'history) to this file')
+    args = parser.parse_args()
+
+    data, _ = read_jsonl_files(args.file, compact=True)
+    anomalies_df, detector_state = detect_batch(data)
+
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(anomalies_df.to_string(index=False) if len(anomalies_df) else 'No anomalies')
+
+    if args.alerts:
+        with AppendWriter(args.alerts, batch_size=1000) as writer:
+            for record in anomalies_df.to_dict('records'):
+                record['timestamp'] = record['timestamp'].strftime('%Y-%m-%dT%H:%M:%SZ')
+                writer.write(Anomaly(**record).model_dump_json())
+    if args.state:
+        backfilled = AnomalyDetector(DetectorConfig(state_file=args.state))
+        backfilled.set_state(detector_state)
+        backfilled.save_state()
@@ -0,0 +1,141 @@
+"""
+appendwriter.py
+
+Crash-safe appends to the speedtest output file (JSON lines), and a PID lockfile for keeping a single instance of a data
+collection tool running.
+
+Each flush of AppendWriter is one os.write() of complete lines to a file opened with O_APPEND, made while holding an
+exclusive fcntl lock on the file, so records from concurrent writers are never interleaved and a reader never sees half
+of a record from a well-behaved writer. If a previous writer crashed part-way through a line, the partial line is
+terminated before the next records are written, so the damage is limited to that one (unparseable) line.
+
+Records can optionally be batched (group commit): they are buffered until batch_size records are waiting, or the oldest
+has waited max_delay seconds (checked as records are written, or by calling flush_if_due), and are then written and
+fsync'ed together. fsync can be turned off where durability matters less than write cost.
+"""
+
+import fcntl
+import logging
+import os
+import time
+from typing import Iterable, List, Optional
+
+logger = logging.getLogger()
+
+
+class AppendWriter:
+
+    def __init__(self, file_path: str, batch_size: int = 1, max_delay: Optional[float] = None, fsync: bool = True):
+        self.file_path = file_path
+        self.batch_size = max(1, batch_size)
+        self.max_delay = max_delay
+        self.fsync = fsync
+        self.pending: List[str] = []
+        self.oldest_pending = None
+        self.records_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, record: str) -> None:
+        """
+        Queues one record (a line, without its newline) and flushes if the batch is full or overdue
+        """
+        record = record.strip()
+        if record == '':
+            return
+        if '\n' in record:
+            raise ValueError("A record must be a single line")
+        if not self.pending:
+            self.oldest_pending = time.monotonic()
+        self.pending.append(record)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+    def write_many(self, records: Iterable[str]) -> None:
+        for record in records:
+            self.write(record)
+
+    def flush_if_due(self) -> None:
+        if self.max_delay is None or not self.pending:
+            return
+        if time.monotonic() - self.oldest_pending >= self.max_delay:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+
+        data = ''.join(f"{record}\n" for record in self.pending).encode('utf-8')
+
+        fd = os.open(self.file_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+
+            # Terminate a partial line left behind by a writer which crashed mid-record
+            size = os.fstat(fd).st_size
+            if size > 0 and os.pread(fd, 1, size - 1) != b'\n':
+                logger.warning(f"{self.file_path} does not end with a newline (partial record?), terminating it")
+                data = b'\n' + data
+
+            written = 0
+            while written < len(data):
+                written += os.write(fd, data[written:])
+
+            if self.fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)  # (also releases the lock)
+
+        self.records_written += len(self.pending)
+        self.pending = []
+        self.oldest_pending = None
+
+    def close(self) -> None:
+        self.flush()
+
+
+class AlreadyRunning(Exception):
+    pass
+
+
+class PidLock:
+    """
+    An exclusive lock on a PID file, held for the life of the process (or until released).
+
+    The lock is an flock() on the file rather than the file's existence, so it is released by the kernel if the process
+    dies, and a stale PID file left behind by a crash never blocks the next run.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.fd = None
+
+    def acquire(self) -> None:
+        fd = os.open(self.file_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            holder = os.read(fd, 32).decode('utf-8', errors='replace').strip()
+            os.close(fd)
+            raise AlreadyRunning(f"{self.file_path} is locked by PID {holder or '(unknown)'}")
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode('utf-8'))
+        self.fd = fd
+
+    def release(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
@@ -0,0 +1,152 @@
+"""
+bench_pipeline.py
+
+pytest-benchmark suite for the speedtest pipeline: loading and validating a log, building the plot's DataFrame,
+aggregation, anomaly detection and figure construction (the work behind plot-mbps.py's update_graph callback).
+
+Each benchmark runs on a synthetic log (see synthetic.py) generated once per session, of SPEEDTEST_BENCH_LINES lines
+(default 10k; e.g. 1M for a representative history). Time is reported by pytest-benchmark; the peak memory allocated by
+one run of each benchmarked function (measured with tracemalloc) is reported as extra_info peak_mib.
+
+Command line usage (from the speedtest directory; the file is named so that a plain pytest run doesn't collect it)..
+
+    SPEEDTEST_BENCH_LINES=1M python -m pytest benchmarks/bench_pipeline.py [--benchmark-autosave]
+    python -m pytest benchmarks/bench_pipeline.py --benchmark-compare    # (against the last saved run)
+"""
+
+import gc
+import json
+import os
+import sys
+import tracemalloc
+from importlib import import_module
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from aggregate import RollupCache  # noqa: E402
+from anomaly import detect_batch  # noqa: E402
+from ingest import read_jsonl_file, read_samples  # noqa: E402
+from synthetic import parse_count, write_synthetic_log  # noqa: E402
+
+plot_mbps = import_module('plot-mbps')
+
+BENCH_LINES = parse_count(os.environ.get('SPEEDTEST_BENCH_LINES', '10k'))
+
+
+def run_with_peak(benchmark, function, *args):
+    """
+    Benchmarks function(*args) and records the peak memory of one (separate, traced) call
+    """
+    gc.collect()
+    tracemalloc.start()
+    function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    benchmark.extra_info['peak_mib'] = round(peak / 2**20, 1)
+    benchmark.extra_info['lines'] = BENCH_LINES
+    return benchmark(function, *args)
+
+
+@pytest.fixture(scope='session')
+def log_file(tmp_path_factory):
+    file_path = tmp_path_factory.mktemp('speedtest') / f'speedtest-{BENCH_LINES}.log'
+    with open(file_path, 'w') as f:
+        write_synthetic_log(f, BENCH_LINES)
+    return str(file_path)
+
+
+@pytest.fixture(scope='session')
+def log_lines(log_file):
+    with open(log_file) as f:
+        return f.readlines()
+
+
+@pytest.fixture(scope='session')
+def main_objects(log_file):
+    return read_jsonl_file(log_file)
+
+
+@pytest.fixture(scope='session')
+def sample_array(log_file):
+    return read_samples(log_file)
+
+
+@pytest.fixture(scope='session')
+def dataframe(sample_array):
+    return sample_array.to_frame()
+
+
+def parse_json(lines: list) -> list:
+    parsed = []
+    for line in lines:
+        try:
+            parsed.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    return parsed
+
+
+def test_load_json(benchmark, log_lines):
+    run_with_peak(benchmark, parse_json, log_lines)
+
+
+def test_load_validate_main_objects(benchmark, log_file):
+    run_with_peak(benchmark, read_jsonl_file, log_file)
+
+
+def test_load_validate_samples(benchmark, log_file):
+    run_with_peak(benchmark, read_samples, log_file)
+
+
+def test_create_dataframe(benchmark, main_objects):
+    run_with_peak(benchmark, plot_mbps.create_dataframe, main_objects)
+
+
+def test_sample_array_to_frame(benchmark, sample_array):
+    run_with_peak(benchmark, sample_array.to_frame)
+
+
+def build_rollups(samples) -> RollupCache:
+    rollups = RollupCache()
+    rollups.add(samples)
+    return rollups
+
+
+def test_aggregate_rollups(benchmark, sample_array):
+    run_with_peak(benchmark, build_rollups, sample_array)
+
+
+def test_detect_anomalies(benchmark, sample_array):
+    run_with_peak(benchmark, detect_batch, sample_array)
+
+
+def build_traces(dataframe) -> dict:
+    traces = plot_mbps.TraceCache()
+    traces.refresh(dataframe, plot_mbps.dataframe_version(dataframe))
+    return traces.figure(list(traces.traces))
+
+
+def test_build_figure(benchmark, dataframe):
+    run_with_peak(benchmark, build_traces, dataframe)
+
+
+def test_update_graph(benchmark, dataframe):
+    """
+    A checklist toggle: a figure for a new selection of addresses, from the trace cache
+    """
+    traces = plot_mbps.TraceCache()
+    traces.refresh(dataframe, plot_mbps.dataframe_version(dataframe))
+    addresses = list(traces.traces)
+    run_with_peak(benchmark, traces.figure, addresses[:-1])
+
+
+def test_rollup_views(benchmark, sample_array):
+    rollups = build_rollups(sample_array)
+    addresses = list(rollups.rollup('room').index)
+    run_with_peak(benchmark, lambda: (plot_mbps.heatmap_figure(rollups, addresses),
+                                      plot_mbps.box_figure(rollups, addresses)))
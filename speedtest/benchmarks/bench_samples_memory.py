@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+bench_samples_memory.py
+
+Memory benchmark of the in-memory representations of speedtest samples: a list of pydantic MainObjects (as held by
+plot-mbps.py by default), a list of __slots__ Samples and a SampleArray (see samples.py).
+
+Synthetic Ookla-shaped results are generated in memory. Memory is measured with tracemalloc as the bytes still allocated
+after each representation has been built; build time is measured in a separate run (tracemalloc slows allocation).
+Building a million MainObjects takes several GB, so MainObjects are measured on a smaller count (--main-samples) and
+scaled up to --samples.
+
+Command line usage (from the speedtest directory)..
+
+    benchmarks/bench_samples_memory.py [--samples 1000000] [--main-samples 20000]
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from importlib import import_module
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from model import MainObject  # noqa: E402
+from samples import Sample, SampleArray  # noqa: E402
+
+fake_speedtest = import_module('fake-speedtest')
+
+ROOMS = [('Lowell St', 'Kitchen'), ('Lowell St', 'Family Room'), ('Village Rd', 'Dining Room'),
+         ('Village Rd', 'Master Bedroom')]
+
+
+def synthetic_lines(count: int) -> list:
+    template = fake_speedtest.fake_result()
+    lines = []
+    for i in range(count):
+        template['timestamp'] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(1700000000 + 600 * i))
+        template['download']['bytes'] = 5_000_000 + (i * 7919) % 100_000_000
+        template['address'] = dict(zip(['address', 'room'], ROOMS[i % len(ROOMS)]))
+        lines.append(json.dumps(template))
+    return lines
+
+
+def measure(label: str, build, lines: list, scale_to: int) -> None:
+    gc.collect()
+    t0 = time.perf_counter()
+    held = build(lines)
+    elapsed = time.perf_counter() - t0
+    del held
+
+    gc.collect()
+    tracemalloc.start()
+    held = build(lines)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    factor = scale_to / len(lines)
+    note = f" (measured on {len(lines):,}, scaled x{factor:g})" if factor != 1 else ''
+    print(f"{label:<24} {current * factor / 2**20:10.1f} MiB held {peak * factor / 2**20:10.1f} MiB peak "
+          f"{current / len(lines):8.0f} B/sample {elapsed * factor:8.1f} s{note}")
+    del held
+
+
+def build_main_objects(lines: list) -> list:
+    return [MainObject(**json.loads(line)) for line in lines]
+
+
+def build_samples(lines: list) -> list:
+    return [Sample.from_json(json.loads(line)) for line in lines]
+
+
+def build_sample_array(lines: list) -> SampleArray:
+    samples = SampleArray()
+    for line in lines:
+        samples.append(Sample.from_json(json.loads(line)))
+    return samples
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Memory benchmark of speedtest sample representations')
+    parser.add_argument('--samples', type=int, default=1_000_000)
+    parser.add_argument('--main-samples', type=int, default=20_000)
+    args = parser.parse_args()
+
+    all_lines = synthetic_lines(args.samples)
+    print(f"{args.samples:,} samples")
+    measure('list of MainObject', build_main_objects, all_lines[:args.main_samples], args.samples)
+    measure('list of Sample', build_samples, all_lines, args.samples)
+    measure('SampleArray', build_sample_array, all_lines, args.samples)
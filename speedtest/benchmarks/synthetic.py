@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+synthetic.py
+
+A generator of realistic speedtest logs (JSON lines, as appended by speedtest-runner.py) of any length, for benchmarks.
+
+The mix follows the real logs (see speedtest-example.json): results from several houses and rooms, each room with its
+own typical speeds and a daily cycle, tagged with the address info; roughly 1 line in 20 is an error object from the
+CLI ({"error": "Cannot open socket"}), with the odd blank line, a line truncated mid-record and a result that fails
+validation (e.g. a negative byte count); and some results lack the download/upload latency objects, as the CLI omits
+them when it couldn't measure them. Output is deterministic for a given seed.
+
+Command line usage (sizes accept k/M suffixes)..
+
+    benchmarks/synthetic.py --lines 1M -o /tmp/speedtest-1M.log [--seed 0]
+"""
+
+import argparse
+import json
+import random
+import sys
+import uuid
+from calendar import timegm
+from time import gmtime, strftime
+from typing import Iterator, TextIO
+
+# (address, room, weight, typical download Mbps, typical upload Mbps)
+ROOMS = [
+    ('Lowell St', 'Kitchen', 60, 55., 25.),
+    ('Lowell St', 'Family Room', 5, 35., 18.),
+    ('Lowell St', 'Master Bedroom', 3, 12., 6.),
+    ('Village Rd', 'Dining Room', 22, 28., 12.),
+    ('Village Rd', 'Family Room', 6, 20., 10.),
+    ('Village Rd', 'Den', 3, 8., 4.),
+    ('Barnes and Noble', 'Cafe', 1, 90., 40.),
+]
+
+SERVERS = [
+    {"id": 8319, "host": "speedtest.ottcommunications.com", "port": 8080, "name": "Otelco", "location": "Bangor, ME",
+     "country": "United States", "ip": "216.220.230.2"},
+    {"id": 43546, "host": "oak-speedtest.otelco.com", "port": 8080, "name": "Otelco", "location": "Oakland, ME",
+     "country": "United States", "ip": "216.220.231.2"},
+]
+
+ERROR_RATE = 0.045
+BLANK_RATE = 0.015
+TRUNCATED_RATE = 0.001
+INVALID_RATE = 0.002
+MISSING_LATENCY_RATE = 0.01
+INTERVAL = 600  # (seconds between tests)
+
+SIZES = {'k': 1_000, 'm': 1_000_000}
+
+
+def parse_count(text: str) -> int:
+    """
+    10k -> 10000, 1M -> 1000000
+    """
+    suffix = text[-1:].lower()
+    if suffix in SIZES:
+        return int(float(text[:-1]) * SIZES[suffix])
+    return int(text)
+
+
+def latency_object(rng: random.Random, base: float) -> dict:
+    iqm = round(base * rng.uniform(1., 8.), 3)
+    return {"iqm": iqm, "low": round(iqm * 0.3, 3), "high": round(iqm * 2.5, 3), "jitter": round(iqm * 0.1, 3)}
+
+
+def transfer_object(rng: random.Random, mbps: float, latency: float, missing_latency: bool) -> dict:
+    elapsed = rng.randint(5000, 15000)
+    nbytes = int(mbps * 1_000_000 / 8 * elapsed / 1000)
+    transfer = {"bandwidth": nbytes * 1000 // elapsed, "bytes": nbytes, "elapsed": elapsed}
+    if not missing_latency:
+        transfer["latency"] = latency_object(rng, latency)
+    return transfer
+
+
+def result(rng: random.Random, timestamp: int, room: tuple) -> dict:
+    address, room_name, _, download, upload = room
+    hour = gmtime(timestamp).tm_hour
+    evening = 0.7 if 18 <= hour <= 23 else 1.  # (the evening slowdown of a shared uplink)
+    download_mbps = max(0.5, rng.gauss(download * evening, download * 0.15))
+    upload_mbps = max(0.2, rng.gauss(upload * evening, upload * 0.15))
+    latency = round(rng.uniform(15., 60.), 3)
+    missing_latency = rng.random() < MISSING_LATENCY_RATE
+    result_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+    return {
+        "type": "result",
+        "timestamp": strftime("%Y-%m-%dT%H:%M:%SZ", gmtime(timestamp)),
+        "ping": {"jitter": round(rng.uniform(0.5, 10.), 3), "latency": latency, "low": round(latency * 0.9, 3),
+                 "high": round(latency * 1.3, 3)},
+        "download": transfer_object(rng, download_mbps, latency, missing_latency),
+        "upload": transfer_object(rng, upload_mbps, latency, missing_latency),
+        "packetLoss": 0 if rng.random() < 0.8 else rng.uniform(0., 3.),
+        "isp": "Spectrum",
+        "interface": {"internalIp": "192.168.1.78", "name": "wlp1s0", "macAddr": "2C:6F:C9:53:FC:75",
+                      "isVpn": False, "externalIp": "66.24.146.88"},
+        "server": rng.choice(SERVERS),
+        "result": {"id": result_id, "url": f"https://www.speedtest.net/result/c/{result_id}", "persisted": True},
+        "address": {"address": address, "room": room_name},
+    }
+
+
+def synthetic_lines(count: int, seed: int = 0, start: str = '2024-08-01T00:00:00Z') -> Iterator[str]:
+    """
+    count lines of log (each ending with a newline), one test every INTERVAL seconds from start
+    """
+    rng = random.Random(seed)
+    weights = [room[2] for room in ROOMS]
+    timestamp = timegm((int(start[0:4]), int(start[5:7]), int(start[8:10]), int(start[11:13]), int(start[14:16]),
+                        int(start[17:19])))
+    for _ in range(count):
+        timestamp += INTERVAL
+        draw = rng.random()
+        if draw < ERROR_RATE:
+            yield '{"error":"Cannot open socket"}\n'
+        elif draw < ERROR_RATE + BLANK_RATE:
+            yield '\n'
+        else:
+            line = json.dumps(result(rng, timestamp, rng.choices(ROOMS, weights)[0]), separators=(',', ':'))
+            draw -= ERROR_RATE + BLANK_RATE
+            if draw < TRUNCATED_RATE:
+                line = line[:len(line) // 2]
+            elif draw < TRUNCATED_RATE + INVALID_RATE:
+                line = line.replace('"bytes":', '"bytes":-', 1)
+            yield f"{line}\n"
+
+
+def write_synthetic_log(f: TextIO, count: int, seed: int = 0) -> None:
+    batch = []
+    for line in synthetic_lines(count, seed):
+        batch.append(line)
+        if len(batch) >= 10000:
+            f.write(''.join(batch))
+            batch = []
+    f.write(''.join(batch))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Generate a synthetic speedtest log')
+    parser.add_argument('--lines', default='10k', help='Number of lines, e.g. 10k, 1M, 10M (default: 10k)')
+    parser.add_argument('-o', '--output', help='Output file (default: standard output)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            write_synthetic_log(output, parse_count(args.lines), args.seed)
+    else:
+        write_synthetic_log(sys.stdout, parse_count(args.lines), args.seed)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+collector.py
+
+A data collection daemon which runs Ookla's speedtest CLI for many probes (one probe per room and house) concurrently
+and appends the results, tagged with each probe's address and room, to a shared JSON lines file. This is the multi-probe
+counterpart of speedtest-runner.py, which runs a single test for a single hard-coded room on each cron tick.
+
+Tests are spawned as asyncio subprocesses (see ookla.py), with results appended as soon as they are printed. Two
+limits keep them from skewing each other: max_concurrent caps the total number of tests in flight, and max_per_uplink
+caps the number of tests sharing one uplink (a house's internet connection) at the same time. With the default
+max_per_uplink of 1, probes on the same uplink take turns while probes in different houses run in parallel. Failed tests
+are retried with exponential backoff; a probe waiting to retry doesn't hold its uplink.
+
+Results go through an AppendWriter (see appendwriter.py): locked single-write appends, optionally batched (batch_size,
+max_delay) with one fsync per batch. A PID lockfile keeps a second collector from running against the same output.
+With sqlite_file set, results are also stored in a SQLite database (see storage.py). With an "anomaly" section (a
+DetectorConfig, see anomaly.py), each result is also checked for degradations as it is appended, and alerts are written
+to the configured alerts file and/or webhook.
+
+Probes are defined in a JSON config file (see collector-example.json, which uses fake-speedtest.py so the collector can
+be tried locally)..
+
+{
+    "output_file": "~/var/log/speedtest.log",
+    "interval": 600,
+    "max_concurrent": 4,
+    "max_per_uplink": 1,
+    "probes": [
+        {"name": "kitchen", "address": "Lowell St", "room": "Kitchen", "uplink": "lowell"},
+        {"name": "den", "address": "Village Rd", "room": "Den", "uplink": "village",
+         "command": ["ssh", "den-pi", "speedtest", "--format=jsonl", "--progress=yes"]}
+    ]
+}
+
+A probe without a command runs the local speedtest_exe.
+
+Command line usage..
+
+    collector.py -c collector.json [--once]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import List
+from pydantic import BaseModel, Field
+from anomaly import AnomalyDetector, DetectorConfig
+from appendwriter import AlreadyRunning, AppendWriter, PidLock
+from jsonl_index import update_index
+from loggingrmb import LoggingRmb
+from ookla import add_address_info, backoff_delays, run_speedtest_with_retries
+from storage import SqliteStore
+
+logger = logging.getLogger()
+
+home = os.environ.get("HOME")
+
+
+class ProbeConfig(BaseModel):
+    name: str
+    address: str = Field(max_length=32, default="")
+    room: str = Field(max_length=32, default="")
+    uplink: str = Field(default='default', description='Probes sharing an uplink are limited by max_per_uplink')
+    command: List[str] = Field(default=None, description='Command which prints speedtest JSON (default: speedtest_exe)')
+    interval: int = Field(default=None, gt=0, description='Seconds between tests (default: the collector interval)')
+
+    @property
+    def addr_info(self) -> dict:
+        return {'address': self.address, 'room': self.room}
+
+
+class CollectorConfig(BaseModel):
+    output_file: str = Field(default=f"{home}/var/log/speedtest.log")
+    speedtest_exe: str = Field(default=f"{home}/.local/bin/speedtest")
+    interval: int = Field(default=600, gt=0)
+    timeout: int = Field(default=60, gt=0)
+    max_attempts: int = Field(default=3, gt=0)
+    retry_delay: float = Field(default=15., ge=0, description='Base of the exponential backoff between retries')
+    max_concurrent: int = Field(default=4, gt=0)
+    max_per_uplink: int = Field(default=1, gt=0)
+    batch_size: int = Field(default=1, gt=0, description='Records per group commit to the output file')
+    max_delay: float = Field(default=None, ge=0, description='Seconds a record may wait for its batch to fill')
+    fsync: bool = True
+    pid_file: str = Field(default=None, description='Default: collector.pid next to the output file')
+    sqlite_file: str = Field(default=None, description='Also store results in this SQLite database (see storage.py)')
+    anomaly: DetectorConfig = Field(default=None, description='Detect anomalies in the results (see anomaly.py)')
+    probes: List[ProbeConfig]
+
+
+def load_config(file_path: str) -> CollectorConfig:
+    with open(file_path) as f:
+        config = CollectorConfig(**json.load(f))
+    config.output_file = os.path.expanduser(config.output_file)
+    config.speedtest_exe = os.path.expanduser(config.speedtest_exe)
+    if config.pid_file is None:
+        config.pid_file = os.path.join(os.path.dirname(config.output_file), 'collector.pid')
+    config.pid_file = os.path.expanduser(config.pid_file)
+    if config.sqlite_file is not None:
+        config.sqlite_file = os.path.expanduser(config.sqlite_file)
+    if config.anomaly is not None:
+        for name in ['state_file', 'alerts_file']:
+            if getattr(config.anomaly, name) is not None:
+                setattr(config.anomaly, name, os.path.expanduser(getattr(config.anomaly, name)))
+    return config
+
+
+class Collector:
+    """
+    Schedules speedtests for every configured probe and appends their results to the output file
+    """
+
+    def __init__(self, config: CollectorConfig):
+        self.config = config
+        self.writer = AppendWriter(config.output_file, batch_size=config.batch_size, max_delay=config.max_delay,
+                                   fsync=config.fsync)
+        self.sqlite_store = SqliteStore(config.sqlite_file) if config.sqlite_file else None
+        self.anomaly_detector = AnomalyDetector(config.anomaly) if config.anomaly else None
+        self.runs = 0
+        self.lines_written = 0
+        self.failures = 0
+
+    def probe_command(self, probe: ProbeConfig) -> List[str]:
+        if probe.command:
+            return [os.path.expanduser(arg) for arg in probe.command]
+        return [self.config.speedtest_exe, "--format=jsonl", "--progress=yes"]
+
+    @asynccontextmanager
+    async def slot(self, probe: ProbeConfig):
+        """
+        Holds a slot on the probe's uplink and one of the max_concurrent slots while a test runs
+        """
+        async with self.uplink_limits[probe.uplink], self.limit:
+            yield
+
+    async def run_probe_once(self, probe: ProbeConfig) -> int:
+        """
+        Runs one test for one probe (retrying with backoff on errors). Output lines are appended to the output file as
+        they are printed. Returns the number of lines appended.
+        """
+
+        outcome = await run_speedtest_with_retries(
+            self.probe_command(probe), max_attempts=self.config.max_attempts, timeout=self.config.timeout,
+            delays=backoff_delays(base=self.config.retry_delay),
+            on_line=lambda line: self.append([add_address_info(line, probe.addr_info).strip()]),
+            limiter=lambda: self.slot(probe), label=probe.name)
+
+        self.runs += 1
+        if not outcome.ok:
+            logger.warning(f"[{probe.name}] speedtest failed: {outcome.lines}")
+            self.failures += 1
+
+        return len(outcome.lines)
+
+    def append(self, lines: List[str]) -> None:
+        self.writer.write_many(lines)
+        self.lines_written += len(lines)
+        update_index(self.config.output_file)  # (indexes whatever the writer has flushed so far)
+        if self.sqlite_store is not None:
+            for line in lines:
+                self.sqlite_store.insert_line(line)
+        if self.anomaly_detector is not None:
+            for line in lines:
+                self.anomaly_detector.update_line(line)
+            self.anomaly_detector.save_state()
+
+    async def probe_loop(self, probe: ProbeConfig) -> None:
+        interval = probe.interval or self.config.interval
+        while True:
+            started = time.monotonic()
+            try:
+                await self.run_probe_once(probe)
+            except OSError as ex:
+                logger.warning(f"[{probe.name}] unable to run speedtest: {ex}")
+                self.failures += 1
+            self.writer.flush_if_due()
+            await asyncio.sleep(max(0., interval - (time.monotonic() - started)))
+
+    async def run(self, once: bool = False) -> None:
+        self.limit = asyncio.Semaphore(self.config.max_concurrent)
+        self.uplink_limits = defaultdict(lambda: asyncio.Semaphore(self.config.max_per_uplink))
+
+        os.makedirs(os.path.dirname(self.config.output_file) or '.', exist_ok=True)
+        logger.info(f"Collecting from {len(self.config.probes)} probes. "
+                    f"Output is appended to: {self.config.output_file}")
+
+        try:
+            if once:
+                results = await asyncio.gather(*[self.run_probe_once(probe) for probe in self.config.probes],
+                                               return_exceptions=True)
+                for probe, result in zip(self.config.probes, results):
+                    if isinstance(result, Exception):
+                        logger.warning(f"[{probe.name}] unable to run speedtest: {result}")
+                        self.failures += 1
+            else:
+                await asyncio.gather(*[self.probe_loop(probe) for probe in self.config.probes])
+        finally:
+            self.writer.close()
+            update_index(self.config.output_file)
+
+        logger.info(f"{self.runs} runs, {self.lines_written} lines written, {self.failures} failures")
+
+
+if __name__ == "__main__":
+
+    LoggingRmb(name='collector', console_level=logging.INFO, queued=True).setup()
+
+    parser = argparse.ArgumentParser(description='Run speedtests for many probes concurrently')
+    parser.add_argument('-c', '--config', required=True, help='JSON file with the probe definitions')
+    parser.add_argument('--once', action='store_true', help='Run one test per probe, then exit')
+    args = parser.parse_args()
+
+    collector_config = load_config(args.config)
+
+    try:
+        with PidLock(collector_config.pid_file):
+            asyncio.run(Collector(collector_config).run(once=args.once))
+    except AlreadyRunning as ex:
+        logger.warning(f"Another collector is still running, exiting ({ex})")
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,250 @@
+"""
+dedup.py
+
+Identity of speedtest results, so that each result is loaded once however many times it appears in the input: rotated
+logs which overlap, the same log passed twice, or an import re-run over files which were already imported.
+
+A result is identified by its result.id (a UUID, assigned when the result is uploaded to speedtest.net). Results which
+weren't uploaded have an id of '0'; they are identified by timestamp and probe (address and room) instead, for
+MainObjects and SampleArrays alike (SampleArrays don't keep the interface's MAC address).
+
+SeenSet remembers the keys of results already ingested, on disk and in bounded space: a Bloom filter holds every key
+ever added, and an exact set holds the most recent keys (where repeats almost always are). A key in the recent set is
+certainly a duplicate and a key the Bloom filter has never seen is certainly new. An older key which the filter may
+have seen is only probably a duplicate (it isn't with probability error_rate, one result in a million by default, more
+once the filter is past capacity), so the store decides (see storage.import_jsonl_files). A filter past capacity is
+reported when the set is closed.
+
+IngestCheckpoint records how far into each log ingestion has got, by device and inode (so a log renamed by rotation
+keeps its place) and a hash of the log's first bytes (so a new log which reuses a deleted log's inode starts afresh),
+so that re-running an import parses only the lines appended since the last run.
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+from collections import deque
+from typing import Iterable, List, Optional, Tuple, Union
+import numpy as np
+from model import MainObject
+from samples import NO_RESULT_ID, SampleArray
+
+logger = logging.getLogger()
+
+NO_RESULT_IDS = {'', '0'}
+
+HEAD_BYTES = 4096  # (bytes of a log hashed by IngestCheckpoint to recognize it)
+
+
+def result_key(result_id: Optional[str], timestamp: str, address: str, room: str) -> str:
+    if result_id is None or result_id in NO_RESULT_IDS:
+        return f"{timestamp}/{address}/{room}"
+    return result_id
+
+
+def object_key(obj: MainObject) -> str:
+    return result_key(obj.result.id, obj.timestamp, obj.address.address, obj.address.room)
+
+
+def drop_duplicates(data: Union[list, SampleArray]) -> Union[list, SampleArray]:
+    """
+    The first occurrence of each result (MainObjects, or samples), in their original order
+    """
+    if not isinstance(data, SampleArray):
+        seen, unique = set(), []
+        for obj in data:
+            key = object_key(obj)
+            if key not in seen:
+                seen.add(key)
+                unique.append(obj)
+        return unique
+
+    # (one key per sample: the result id, or for results without one the timestamp and location, as in object_key)
+    result_ids = data.column('result_id')
+    no_id = result_ids == NO_RESULT_ID
+    keys = np.zeros(len(data), dtype=[('result_id', 'S16'), ('timestamp', '<i8'), ('location', '<i4')])
+    keys['result_id'] = result_ids
+    keys['timestamp'] = np.where(no_id, data.column('timestamp'), 0)
+    keys['location'] = np.where(no_id, data.column('location'), -1)
+    _, first = np.unique(keys, return_index=True)
+    if len(first) == len(data):
+        return data
+    return data.take(np.sort(first))
+
+
+class BloomFilter:
+    """
+    A Bloom filter in a memory-mapped file (created, sized for capacity keys at error_rate, if it doesn't exist)
+    """
+
+    HEADER = struct.Struct('<8sQQ')  # magic, number of bits, number of hashes
+    MAGIC = b'STBLOOM1'
+    POPCOUNT = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)  # (bits set in each byte)
+
+    def __init__(self, file_path: str, capacity: int = 1_000_000, error_rate: float = 1e-6):
+        if not os.path.exists(file_path):
+            bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2 / 8) * 8
+            hashes = max(1, round(bits / capacity * math.log(2)))
+            with open(file_path, 'wb') as f:
+                f.write(self.HEADER.pack(self.MAGIC, bits, hashes))
+                f.truncate(self.HEADER.size + bits // 8)
+
+        self.file = open(file_path, 'r+b')
+        magic, self.bits, self.hashes = self.HEADER.unpack(self.file.read(self.HEADER.size))
+        if magic != self.MAGIC:
+            raise ValueError(f"{file_path} is not a Bloom filter")
+        self.map = mmap.mmap(self.file.fileno(), 0)
+
+    def positions(self, key: str) -> list:
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def __contains__(self, key: str) -> bool:
+        offset = self.HEADER.size
+        return all(self.map[offset + (p >> 3)] & (1 << (p & 7)) for p in self.positions(key))
+
+    def add(self, key: str) -> None:
+        offset = self.HEADER.size
+        for p in self.positions(key):
+            self.map[offset + (p >> 3)] |= 1 << (p & 7)
+
+    def fill(self) -> float:
+        """
+        The fraction of the bits which are set: half of them at capacity, more past it
+        """
+        bits = np.frombuffer(self.map, dtype=np.uint8, offset=self.HEADER.size)
+        fill = int(self.POPCOUNT[bits].sum(dtype=np.int64)) / self.bits
+        del bits  # (the mmap can't be closed while an array refers to it)
+        return fill
+
+    def close(self) -> None:
+        self.map.flush()
+        self.map.close()
+        self.file.close()
+
+
+class SeenSet:
+    """
+    Keys of the results already ingested: <file_path>.bloom (every key) and <file_path>.recent (the last recent_size
+    keys, one per line). The files are locked while the set is open, so concurrent imports take turns.
+    """
+
+    def __init__(self, file_path: str, recent_size: int = 100_000, capacity: int = 1_000_000,
+                 error_rate: float = 1e-6):
+        self.recent_path = f"{file_path}.recent"
+        self.recent_size = recent_size
+        self.lock = open(f"{file_path}.lock", 'w')
+        fcntl.flock(self.lock.fileno(), fcntl.LOCK_EX)
+
+        self.bloom = BloomFilter(f"{file_path}.bloom", capacity, error_rate)
+        self.recent = deque(maxlen=recent_size)
+        if os.path.exists(self.recent_path):
+            with open(self.recent_path) as f:
+                self.recent.extend(line.rstrip('\n') for line in f)
+        self.recent_set = set(self.recent)
+        self.recent_lines = len(self.recent)
+        self.recent_file = open(self.recent_path, 'a')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __contains__(self, key: str) -> bool:
+        """
+        Whether the key has probably been added (see the module's docstring)
+        """
+        return key in self.recent_set or key in self.bloom
+
+    def add(self, key: str) -> None:
+        if len(self.recent) == self.recent.maxlen:
+            self.recent_set.discard(self.recent[0])
+        self.recent.append(key)
+        self.recent_set.add(key)
+        self.bloom.add(key)
+        self.recent_file.write(f"{key}\n")
+        self.recent_lines += 1
+
+    def unseen(self, keys: Iterable[str]) -> Tuple[List[int], List[int]]:
+        """
+        The positions of the keys which are certainly not in the set, and of those which the Bloom filter has probably
+        seen (but not certainly: check them against the store), skipping keys seen earlier in keys. The keys are not
+        added: add them once their results have been stored.
+        """
+        new, maybe_seen, batch = [], [], set()
+        for i, key in enumerate(keys):
+            if key in batch or key in self.recent_set:
+                continue
+            batch.add(key)
+            (maybe_seen if key in self.bloom else new).append(i)
+        return new, maybe_seen
+
+    def close(self) -> None:
+        self.recent_file.close()
+        if self.recent_lines > 2 * self.recent_size:
+            # (the recent keys file only ever grows, so it's cut back to the keys still held)
+            temp_path = f"{self.recent_path}.tmp"
+            with open(temp_path, 'w') as f:
+                f.write(''.join(f"{key}\n" for key in self.recent))
+            os.replace(temp_path, self.recent_path)
+        fill = self.bloom.fill()
+        if fill > 0.5:
+            logger.warning(f"The Bloom filter {self.bloom.file.name} is past its capacity ({fill:.0%} of its bits "
+                           f"set), so its false positives are rising: delete it to start a larger one")
+        self.bloom.close()
+        self.lock.close()
+
+
+def head_hash(file_path: str, size: int) -> str:
+    """
+    The hash of the first min(size, HEAD_BYTES) bytes of a file (as stored, i.e. compressed for .gz files)
+    """
+    with open(file_path, 'rb') as f:
+        return hashlib.blake2b(f.read(min(size, HEAD_BYTES)), digest_size=16).hexdigest()
+
+
+class IngestCheckpoint:
+    """
+    How far into each input file ingestion has got: {"device:inode": {"file": path, "size": bytes, "offset": bytes,
+    "head": hash of the first bytes}}, in a JSON file
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.files = {}
+        if os.path.exists(file_path):
+            with open(file_path) as f:
+                self.files = json.load(f)
+
+    def start(self, file_path: str) -> Optional[int]:
+        """
+        The offset to resume reading file_path from. Compressed files are read whole, or not at all (None) if they are
+        unchanged since they were last read.
+        """
+        stat = os.stat(file_path)
+        entry = self.files.get(f"{stat.st_dev}:{stat.st_ino}")
+        if entry is None or entry['size'] > stat.st_size:
+            return 0  # (a new file, or a truncated one)
+        if entry.get('head') != head_hash(file_path, entry['size']):
+            return 0  # (the inode of a deleted file, reused by a new one)
+        if file_path.endswith('.gz'):
+            return None if entry['size'] == stat.st_size else 0
+        return entry['offset']
+
+    def update(self, file_path: str, offset: int, size: int) -> None:
+        stat = os.stat(file_path)
+        self.files[f"{stat.st_dev}:{stat.st_ino}"] = {'file': file_path, 'size': size, 'offset': offset,
+                                                       'head': head_hash(file_path, size)}
+
+    def save(self) -> None:
+        temp_path = f"{self.file_path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.files, f, indent=1)
+        os.replace(temp_path, self.file_path)
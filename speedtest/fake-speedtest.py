@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+fake-speedtest.py
+
+A stand-in for Ookla's speedtest CLI, for exercising the data collection tools locally (no network traffic, no Ookla
+license prompt). Prints one line of Ookla-shaped JSON result output, after an optional delay. With --format=jsonl,
+progress events (testStart, ping, download, upload) are printed during the delay, as the real CLI does.
+
+Command line usage..
+
+    fake-speedtest.py [--format=json|jsonl] [--delay SECONDS] [--fail-rate FRACTION] [--hang]
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+
+def fake_result() -> dict:
+    download_elapsed = random.randint(5000, 15000)
+    upload_elapsed = random.randint(5000, 15000)
+    download_bytes = random.randint(5_000_000, 120_000_000)
+    upload_bytes = random.randint(2_000_000, 60_000_000)
+    result_id = str(uuid.uuid4())
+    latency = round(random.uniform(10., 60.), 3)
+
+    return {
+        "type": "result",
+        "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "ping": {"jitter": round(random.uniform(0.5, 10.), 3), "latency": latency,
+                 "low": round(latency * 0.9, 3), "high": round(latency * 1.2, 3)},
+        "download": {"bandwidth": download_bytes * 1000 // download_elapsed, "bytes": download_bytes,
+                     "elapsed": download_elapsed},
+        "upload": {"bandwidth": upload_bytes * 1000 // upload_elapsed, "bytes": upload_bytes,
+                   "elapsed": upload_elapsed},
+        "packetLoss": random.choice([0, 0, 0, round(random.uniform(0., 2.), 3)]),
+        "isp": "Fake ISP",
+        "interface": {"internalIp": "192.168.1.10", "name": "wlan0", "macAddr": "00:00:00:00:00:00",
+                      "isVpn": False, "externalIp": "203.0.113.10"},
+        "server": {"id": 1, "host": "speedtest.example.com", "port": 8080, "name": "Example",
+                   "location": "Nowhere, ME", "country": "United States", "ip": "192.0.2.1"},
+        "result": {"id": result_id, "url": f"https://www.speedtest.net/result/c/{result_id}", "persisted": True},
+    }
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Fake Ookla speedtest CLI")
+    parser.add_argument('--format', default='json')
+    parser.add_argument('--delay', type=float, default=0., help='Seconds to wait before printing the result')
+    parser.add_argument('--fail-rate', type=float, default=0., help='Fraction of runs that print an error object')
+    parser.add_argument('--hang', action='store_true', help='Never finish (after printing any progress events)')
+    args, _ = parser.parse_known_args()
+
+    if args.format == 'jsonl':
+        for event in ['testStart', 'ping', 'download', 'upload']:
+            print(json.dumps({"type": event, "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                              event: {"progress": 1.0}}), flush=True)
+            time.sleep(args.delay / 4)
+    else:
+        time.sleep(args.delay)
+
+    while args.hang:
+        time.sleep(60)
+
+    if random.random() < args.fail_rate:
+        print(json.dumps({"error": "Configuration - Could not retrieve or read configuration (ConfigurationError)"}))
+        sys.exit(1)
+
+    print(json.dumps(fake_result()))
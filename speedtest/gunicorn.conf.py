@@ -0,0 +1,28 @@
+"""
+gunicorn.conf.py
+
+gunicorn settings for serving the speedtest dashboard (plot-mbps.py) to several users at once..
+
+    PLOT_MBPS_ARGS="--compact -f 'logs/speedtest.log*'" gunicorn -c gunicorn.conf.py
+
+PLOT_MBPS_ARGS holds plot-mbps.py's data options (see plot-mbps.py --help). The app is created once in the gunicorn
+master (preload_app) and the workers are forked from it, so the data are loaded once and their memory is shared by the
+workers (copy-on-write; with --compact the sample arrays are never written, so they stay shared). Each worker memoizes
+the figures it serves (see plot-mbps.py's Dashboard). Each worker starts its own log queue and listener thread
+(post_fork; see loggingrmb.py).
+"""
+
+import multiprocessing
+import os
+from loggingrmb import restart_after_fork
+
+wsgi_app = 'plot-mbps:create_server()'
+bind = os.environ.get('PLOT_MBPS_BIND', '127.0.0.1:8050')
+workers = int(os.environ.get('PLOT_MBPS_WORKERS', min(multiprocessing.cpu_count(), 4)))
+preload_app = True
+timeout = 120  # (loading a long history can take a while; callbacks are fast)
+accesslog = '-'
+
+
+def post_fork(server, worker):
+    restart_after_fork()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+ingest.py
+
+Loading of the speedtest time series (JSON lines, as appended by speedtest-runner.py) into MainObject instances, or
+into a compact SampleArray (see samples.py).
+
+Probes rotate their logs (speedtest.log, speedtest.log.1, speedtest.log.2.gz, ..), so read_jsonl_files accepts any mix
+of files, directories and glob patterns, including gzip-compressed rotations. Files are parsed in a process pool, one
+file per task, and the results are merged in timestamp order, with duplicates (e.g. from overlapping rotations)
+dropped. Each file's JSON, validation and other input errors are counted and reported per file, as read_jsonl_file
+reports them for a single file.
+
+Command line usage (prints a per-file summary)..
+
+    ingest.py [--workers N] [--compact] 'logs/speedtest.log*' [more files, directories or patterns ...]
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple, Union
+from pydantic import BaseModel, ValidationError
+from dedup import drop_duplicates
+from loggingrmb import LoggingRmb, timed
+from model import MainObject
+from samples import Sample, SampleArray, open_log
+
+logger = logging.getLogger()
+
+MAX_LOGGED_ERRORS = 100  # (per file; the rest are only counted)
+
+
+class FileSummary(BaseModel):
+    file_path: str
+    lines_input: int = 0
+    lines_processed: int = 0
+    json_errors: int = 0
+    validation_errors: int = 0
+    other_errors: int = 0
+    end_offset: int = 0  # (just past the last complete line read)
+    read_error: bool = False  # (the file couldn't be read to its end)
+    errors: List[str] = []
+
+    def error(self, message: str) -> None:
+        if len(self.errors) < MAX_LOGGED_ERRORS:
+            self.errors.append(message)
+
+
+def parse_file(file_path: str, compact: bool = False,
+               start: int = 0) -> Tuple[Union[List[MainObject], SampleArray], FileSummary]:
+    """
+    Parses one (possibly gzip'ed) JSON lines file into MainObjects, or a SampleArray if compact, from byte offset start
+    """
+    summary = FileSummary(file_path=file_path, end_offset=start)
+    data = SampleArray(source_file=file_path) if compact else []
+    # (Sample.from_json reports invalid lines with built-in exceptions rather than pydantic's ValidationError)
+    validation_errors = (ValidationError, KeyError, TypeError, ValueError, AttributeError) if compact \
+        else ValidationError
+    offset = start
+    with open_log(file_path) as f:
+        if start:
+            f.seek(start)
+        for line in f:
+            line_offset = offset
+            offset += len(line)
+            if line.endswith(b'\n'):
+                summary.end_offset = offset
+            summary.lines_input += 1
+            line_num = summary.lines_input
+            try:
+                json_data = json.loads(line)
+                if compact:
+                    data.append(Sample.from_json(json_data, offset=line_offset))
+                else:
+                    data.append(MainObject(**json_data))
+            except json.JSONDecodeError as e:
+                summary.json_errors += 1
+                summary.error(f"Line {line_num}: JSON decode error: {e}")
+                continue
+            except validation_errors as e:
+                summary.validation_errors += 1
+                summary.error(f"Line {line_num}: Validation error: {e}")
+                continue
+            except Exception as e:
+                summary.other_errors += 1
+                summary.error(f"Line {line_num}: Error: {e}")
+                continue
+            summary.lines_processed += 1
+
+    return data, summary
+
+
+def parse_file_or_report(file_path: str, compact: bool = False,
+                         start: int = 0) -> Tuple[Union[List[MainObject], SampleArray], FileSummary]:
+    """
+    As parse_file, but a file which can't be read is reported in its summary rather than failing the whole ingestion
+    """
+    try:
+        return parse_file(file_path, compact, start)
+    except (OSError, EOFError) as e:
+        summary = FileSummary(file_path=file_path, other_errors=1, end_offset=start, read_error=True)
+        summary.error(f"Unable to read file: {e}")
+        logger.warning(f"{file_path}: Unable to read file: {e}")
+        return SampleArray() if compact else [], summary
+
+
+def log_summary(summary: FileSummary, prefix: str = '') -> None:
+    for message in summary.errors:
+        logger.debug(f"{prefix}{message}")
+    logger.info(f"{prefix}Lines input: {summary.lines_input}")
+    logger.info(f"{prefix}Lines processed: {summary.lines_processed}")
+    if summary.lines_input != summary.lines_processed:
+        logger.info(f"{prefix}(see log file for JSON, validation and other input errors)")
+
+
+def read_jsonl_file(file_path: str) -> List[MainObject]:
+    data, summary = parse_file(file_path)
+    log_summary(summary)
+    return data
+
+
+def read_samples(file_path: str) -> SampleArray:
+    """
+    Reads a JSON lines file straight into a SampleArray, with the same error accounting as read_jsonl_file
+    """
+    data, summary = parse_file(file_path, compact=True)
+    log_summary(summary)
+    return data
+
+
+def expand_sources(sources: List[str]) -> List[str]:
+    """
+    Files for a list of file names, directories (every file in the directory) and glob patterns, without duplicates
+    """
+    files = []
+    for source in sources:
+        if os.path.isdir(source):
+            matches = [os.path.join(source, name) for name in sorted(os.listdir(source))]
+        else:
+            matches = sorted(glob.glob(source)) or [source]  # (a missing file is reported when it is opened)
+        files += [match for match in matches if not os.path.isdir(match)]
+    return list(dict.fromkeys(files))
+
+
+def read_jsonl_files(sources: List[str], workers: int = None,
+                     compact: bool = False) -> Tuple[Union[List[MainObject], SampleArray], List[FileSummary]]:
+    """
+    Parses every file of sources (see expand_sources) in a pool of worker processes (default: one per CPU). Returns the
+    merged data, in timestamp order and with each result once (see dedup.py), and a summary per file.
+    """
+    files = expand_sources(sources)
+    workers = min(workers or os.cpu_count() or 1, max(len(files), 1))
+
+    with timed('load_validate', files=len(files), workers=workers, compact=compact):
+        if workers == 1:
+            results = [parse_file_or_report(file_path, compact) for file_path in files]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(parse_file_or_report, files, [compact] * len(files)))
+
+    summaries = []
+    for _, summary in results:
+        log_summary(summary, prefix=f"{summary.file_path}: ")
+        summaries.append(summary)
+
+    if compact:
+        data = SampleArray.concatenate([data for data, _ in results]).sorted_by_time()
+    else:
+        data = sorted((obj for data, _ in results for obj in data), key=lambda obj: obj.timestamp)
+    processed = len(data)
+    data = drop_duplicates(data)
+
+    logger.info(f"{len(files)} files, {sum(s.lines_input for s in summaries)} lines input, {processed} processed, "
+                f"{processed - len(data)} duplicates dropped")
+    return data, summaries
+
+
+if __name__ == "__main__":
+
+    LoggingRmb(console_level=logging.WARNING).setup()
+
+    parser = argparse.ArgumentParser(description='Parse (rotated) speedtest logs in parallel')
+    parser.add_argument('sources', nargs='+', help='Files, directories or glob patterns (.gz files are decompressed)')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: one per CPU)')
+    parser.add_argument('--compact', action='store_true', help='Parse into a SampleArray rather than MainObjects')
+    args = parser.parse_args()
+
+    _, file_summaries = read_jsonl_files(args.sources, workers=args.workers, compact=args.compact)
+
+    print(f"{'file':<40} {'input':>9} {'processed':>9} {'json':>6} {'invalid':>7} {'other':>6}")
+    for s in file_summaries:
+        print(f"{s.file_path:<40} {s.lines_input:>9} {s.lines_processed:>9} {s.json_errors:>6} "
+              f"{s.validation_errors:>7} {s.other_errors:>6}")
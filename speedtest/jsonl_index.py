@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+jsonl_index.py
+
+A sidecar index for a speedtest JSON lines log, so a time range (and address/room) can be read without parsing the log
+from the start.
+
+The index (the log's file name plus '.idx') holds one fixed-size record per result line: its timestamp, byte offset
+and length in the log, and CRC32s of its address and room. A range query is a vectorized search over the (memory-mapped)
+index; only the matching lines are then read, from a memory map of the log, and parsed. Neither file is read into
+memory as a whole.
+
+The index is maintained incrementally: update() indexes only the lines appended since the last update (the header
+records how many bytes of the log are covered), so speedtest-runner.py and the collector can call it after every append.
+The header also identifies the log, by device, inode and a hash of its first bytes (as IngestCheckpoint does, see
+dedup.py): if the log is replaced or truncated (e.g. by log rotation, including a copy-truncate rotation after which the
+log has grown back past the bytes covered) the index is rebuilt.
+
+Command line usage (brings an index up to date and prints its size)..
+
+    jsonl_index.py speedtest.log
+"""
+
+import argparse
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import zlib
+from datetime import datetime, timezone
+from typing import List, Optional, Union
+import numpy as np
+from pydantic import ValidationError
+from dedup import head_hash
+from loggingrmb import LoggingRmb
+from model import MainObject
+from samples import Sample, SampleArray, parse_timestamp
+
+logger = logging.getLogger()
+
+MAGIC = b'STIDX002'
+# magic, log device and inode, bytes of the log covered, number of records, 1 if the records are in timestamp order, and
+# the hash of the log's first bytes (see dedup.head_hash, of the bytes covered)
+HEADER = struct.Struct('<8sQQQQQ16s')
+RECORD = np.dtype([('timestamp', '<i8'), ('offset', '<i8'), ('length', '<u4'), ('address', '<u4'), ('room', '<u4')])
+
+
+def crc(text: str) -> int:
+    return zlib.crc32(text.encode('utf-8'))
+
+
+def to_epoch(timestamp: str) -> int:
+    """
+    Seconds since the epoch for a UTC time given as YYYY-MM-DDTHH:MM:SSZ, or a prefix of it (e.g. 2024-08-13)
+    """
+    return int(datetime.fromisoformat(timestamp.rstrip('Z')).replace(tzinfo=timezone.utc).timestamp())
+
+
+class JsonlIndex:
+
+    def __init__(self, log_path: str, index_path: Optional[str] = None):
+        if log_path.endswith('.gz'):
+            raise ValueError(f"{log_path}: compressed logs can't be indexed (decompress it, or import it into SQLite)")
+        self.log_path = log_path
+        self.index_path = index_path or f"{log_path}.idx"
+
+    def read_header(self, f) -> Optional[tuple]:
+        f.seek(0)
+        header = f.read(HEADER.size)
+        if len(header) != HEADER.size or header[:8] != MAGIC:
+            return None
+        return HEADER.unpack(header)
+
+    def head(self, covered: int) -> bytes:
+        return bytes.fromhex(head_hash(self.log_path, covered))
+
+    def update(self) -> int:
+        """
+        Indexes the lines appended to the log since the last update. Returns the number of result lines indexed.
+        """
+        log_stat = os.stat(self.log_path)
+
+        with os.fdopen(os.open(self.index_path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+            header = self.read_header(f)
+            if header is not None and header[1:3] == (log_stat.st_dev, log_stat.st_ino) \
+                    and header[3] <= log_stat.st_size and header[6] == self.head(header[3]):
+                _, _, _, covered, count, in_order, _ = header
+                # (drops records written by an update which didn't get as far as rewriting the header)
+                f.truncate(HEADER.size + count * RECORD.itemsize)
+                last_timestamp = None
+                if count:
+                    f.seek(HEADER.size + (count - 1) * RECORD.itemsize)
+                    last_timestamp = int(np.frombuffer(f.read(RECORD.itemsize), dtype=RECORD)['timestamp'][0])
+            else:
+                if header is not None:
+                    logger.info(f"{self.log_path} was replaced or truncated, rebuilding {self.index_path}")
+                f.truncate(0)
+                covered, count, in_order, last_timestamp = 0, 0, 1, None
+
+            records = []
+            with open(self.log_path, 'rb') as log:
+                log.seek(covered)
+                for line in log:
+                    if not line.endswith(b'\n'):
+                        break  # (a partial line being written; it is indexed on the next update)
+                    offset = covered
+                    covered += len(line)
+                    try:
+                        line_json = json.loads(line)
+                        timestamp = parse_timestamp(line_json['timestamp'])
+                        address = line_json['address']
+                        records.append((timestamp, offset, len(line), crc(address.get('address', '')),
+                                        crc(address.get('room', ''))))
+                    except (json.JSONDecodeError, KeyError, TypeError, ValueError, AttributeError):
+                        continue  # (error lines, etc. aren't results, so aren't indexed)
+                    if last_timestamp is not None and timestamp < last_timestamp:
+                        in_order = 0
+                    last_timestamp = timestamp
+
+            f.seek(HEADER.size + count * RECORD.itemsize)
+            f.write(np.array(records, dtype=RECORD).tobytes())
+            f.flush()
+            # (the header is written last, so it never covers records which weren't written)
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, log_stat.st_dev, log_stat.st_ino, covered, count + len(records), in_order,
+                                self.head(covered)))
+
+        if records:
+            logger.debug(f"{self.index_path}: {len(records)} lines indexed")
+        return len(records)
+
+    def records(self) -> np.ndarray:
+        """
+        The index records (a read-only view of the memory-mapped index)
+        """
+        with open(self.index_path, 'rb') as f:
+            count = self.read_header(f)[4]
+        if count == 0:
+            return np.empty(0, dtype=RECORD)
+        return np.memmap(self.index_path, dtype=RECORD, mode='r', offset=HEADER.size, shape=(count,))
+
+    def lookup(self, start: Optional[str] = None, end: Optional[str] = None,
+               addresses: Optional[List[str]] = None, rooms: Optional[List[str]] = None) -> np.ndarray:
+        """
+        Index records of lines with start <= timestamp < end (UTC, see to_epoch), optionally only for the given
+        addresses (houses) and/or rooms
+        """
+        records = self.records()
+        with open(self.index_path, 'rb') as f:
+            in_order = self.read_header(f)[5]
+
+        if in_order:
+            timestamps = records['timestamp']
+            first = 0 if start is None else np.searchsorted(timestamps, to_epoch(start), side='left')
+            last = len(records) if end is None else np.searchsorted(timestamps, to_epoch(end), side='left')
+            selected = records[first:last]
+        else:
+            mask = np.ones(len(records), dtype=bool)
+            if start is not None:
+                mask &= records['timestamp'] >= to_epoch(start)
+            if end is not None:
+                mask &= records['timestamp'] < to_epoch(end)
+            selected = records[mask]
+
+        if addresses:
+            selected = selected[np.isin(selected['address'], [crc(address) for address in addresses])]
+        if rooms:
+            selected = selected[np.isin(selected['room'], [crc(room) for room in rooms])]
+        return selected
+
+    def read(self, start: Optional[str] = None, end: Optional[str] = None, addresses: Optional[List[str]] = None,
+             rooms: Optional[List[str]] = None, compact: bool = False) -> Union[List[MainObject], SampleArray]:
+        """
+        The results in a time range (and addresses/rooms), read from a memory map of the log via the index, in log
+        order. The index is brought up to date first.
+        """
+        self.update()
+        selected = self.lookup(start, end, addresses, rooms)
+        data = SampleArray(source_file=self.log_path) if compact else []
+        if len(selected) == 0:
+            return data
+
+        with open(self.log_path, 'rb') as log, mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for offset, length in zip(selected['offset'].tolist(), selected['length'].tolist()):
+                try:
+                    line_json = json.loads(mm[offset:offset + length])
+                    if compact:
+                        sample = Sample.from_json(line_json, offset=offset)
+                    else:
+                        sample = MainObject(**line_json)
+                except (ValidationError, KeyError, TypeError, ValueError, AttributeError) as e:
+                    logger.debug(f"{self.log_path} offset {offset}: Validation error: {e}")
+                    continue
+                # (CRC matches are confirmed, to rule out collisions)
+                address, room = (sample.address, sample.room) if compact else \
+                    (sample.address.address, sample.address.room)
+                if (addresses and address not in addresses) or (rooms and room not in rooms):
+                    continue
+                data.append(sample)
+
+        logger.info(f"{self.log_path}: {len(data)} results read via {self.index_path}")
+        return data
+
+
+def update_index(log_path: str) -> None:
+    """
+    Brings the log's index up to date, if it has one (for use by writers, which shouldn't create indexes nobody reads)
+    """
+    index = JsonlIndex(log_path)
+    if os.path.exists(index.index_path):
+        index.update()
+
+
+if __name__ == "__main__":
+
+    LoggingRmb(console_level=logging.INFO).setup()
+
+    parser = argparse.ArgumentParser(description='Create or update the offset index of a speedtest log')
+    parser.add_argument('log_file')
+    args = parser.parse_args()
+
+    jsonl_index = JsonlIndex(args.log_file)
+    jsonl_index.update()
+    logger.info(f"{jsonl_index.index_path}: {len(jsonl_index.records())} lines indexed")
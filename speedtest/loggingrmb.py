@@ -2,14 +2,170 @@
 loggingrmb.py
 
 A module for instantiating a logging object with my preferred configuration.
+
+Options beyond the two handlers (console and <program>.log)..
+
+    queued       Records are handed to a queue and written by a background thread (QueueHandler/QueueListener), so a
+                 slow disk or terminal never blocks the code doing the logging. A forked child (e.g. a
+                 ProcessPoolExecutor worker) has no listener thread, so it writes its records directly; a long-lived
+                 child (a gunicorn worker) calls restart_after_fork (see gunicorn.conf.py) for a queue and listener
+                 of its own.
+    file_format  'json' writes the log file as JSON lines, including any structured fields passed with extra=.
+
+Helpers for logging with (next to) no overhead when a level is off..
+
+    lazy(fn, *args)  A message argument which is only computed if the record is actually formatted, e.g.
+                     logger.log(TRACE, '%s', lazy(df.to_string)).
+    TRACE            A level below DEBUG for bulk data dumps; they are skipped unless file_level is TRACE.
+    timed(stage)     A context manager/decorator which logs the duration of a stage as a structured 'timing' event.
 """
 
+import atexit
+import functools
+import json
 import logging
+import logging.handlers
 import os
+import queue
 import re
 import sys
+import time
+from typing import Literal, Optional
 from pydantic import BaseModel, Field, ConfigDict
 
+TRACE = 5
+logging.addLevelName(TRACE, 'TRACE')
+
+FORMAT = '[%(asctime)s %(filename)-16.16s:%(lineno)-3.3s %(levelname)-5.5s] %(message)s'
+DATE_FORMAT = '%Y-%m%d-%H:%M:%S'
+
+# (attributes of every LogRecord; any others were passed with extra= and are written as structured fields)
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'taskName'}
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record, DATE_FORMAT),
+            'level': record.levelname,
+            'file': record.filename,
+            'line': record.lineno,
+            'message': record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class ForkAwareQueueHandler(logging.handlers.QueueHandler):
+    """
+    A QueueHandler which, in a forked child without a listener of its own, hands records straight to the listener's
+    handlers (the listener's thread isn't inherited by the child, so queued records would never be written)
+    """
+
+    def __init__(self, record_queue, listener: logging.handlers.QueueListener):
+        super().__init__(record_queue)
+        self.listener = listener
+        self.pid = os.getpid()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if os.getpid() == self.pid:
+            super().emit(record)
+        else:
+            try:
+                self.listener.handle(self.prepare(record))
+            except Exception:
+                self.handleError(record)
+
+
+def start_listener(record_queue, handlers) -> logging.handlers.QueueListener:
+    listener = logging.handlers.QueueListener(record_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)  # (writes out whatever is still queued)
+    return listener
+
+
+def restart_after_fork() -> None:
+    """
+    Gives a forked child its own queue and listener thread (for queued logging; otherwise does nothing). To be called
+    first thing in the child, e.g. from gunicorn's post_fork hook.
+    """
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, ForkAwareQueueHandler) and handler.pid != os.getpid():
+            handler.queue = queue.SimpleQueue()
+            handler.listener = start_listener(handler.queue, handler.listener.handlers)
+            handler.pid = os.getpid()
+
+
+class Lazy:
+    """
+    A log message argument which is computed only when (and if) it is formatted
+    """
+
+    __slots__ = ('fn', 'args')
+
+    def __init__(self, fn, *args):
+        self.fn = fn
+        self.args = args
+
+    def __str__(self):
+        return str(self.fn(*self.args))
+
+
+def lazy(fn, *args) -> Lazy:
+    return Lazy(fn, *args)
+
+
+class timed:
+    """
+    Logs how long a stage (a with block, or each call of a decorated function) took, as a 'timing' event with the
+    stage name, duration_ms and any other fields given (which JSON log files record as fields). The event is logged
+    with the location of the with block, or of the call of the decorated function.
+
+        with timed('load', files=len(files)):
+            ...
+
+        @timed('update_graph', level=logging.DEBUG)
+        def update_graph(...):
+    """
+
+    def __init__(self, stage: str, level: int = logging.INFO, logger: Optional[logging.Logger] = None, **fields):
+        self.stage = stage
+        self.level = level
+        self.logger = logger or logging.getLogger()
+        self.fields = fields
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.log_duration(self.started, exc_type is not None, stacklevel=3)  # (log_duration, __exit__, the with block)
+        return False
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def timed_fn(*args, **kwargs):
+            # (the start is local to each call, so calls may overlap or recurse)
+            started, failed = time.perf_counter(), True
+            try:
+                result = fn(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                self.log_duration(started, failed, stacklevel=3)  # (log_duration, timed_fn, the caller)
+        return timed_fn
+
+    def log_duration(self, started: float, failed: bool, stacklevel: int) -> None:
+        duration_ms = (time.perf_counter() - started) * 1000.
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, "%s took %.1f ms", self.stage, duration_ms, stacklevel=stacklevel,
+                            extra={'event': 'timing', 'stage': self.stage, 'duration_ms': round(duration_ms, 3),
+                                   'failed': failed, **self.fields})
+
 
 class LoggingRmb(BaseModel):
     model_config = ConfigDict(validate_default=True)
@@ -17,30 +173,37 @@ class LoggingRmb(BaseModel):
     name: str = Field(max_length=16, default='logging_rmb')
     console_level: int = Field(default=logging.WARNING)
     file_level: int = Field(default=logging.DEBUG)
+    file_format: Literal['text', 'json'] = 'text'
+    queued: bool = False
 
     def setup(self) -> logging.Logger:
 
         logger_rmb = logging.getLogger()
 
         c_handler = logging.StreamHandler()
-        c_formatter = logging.Formatter(
-                 '[%(asctime)s %(filename)-16.16s:%(lineno)-3.3s %(levelname)-5.5s] %(message)s',
-                 datefmt='%Y-%m%d-%H:%M:%S')
+        c_formatter = logging.Formatter(FORMAT, datefmt=DATE_FORMAT)
         c_handler.setFormatter(c_formatter)
 
         exe_file = os.path.basename(sys.argv[0])
         exe_base = re.sub(r'\.py$', '', exe_file)
         f_handler = logging.FileHandler(f'{exe_base}.log', mode='w')  # (default mode is 'a')
-        f_formatter = logging.Formatter(
-                 '[%(asctime)s %(filename)-16.16s:%(lineno)-3.3s %(levelname)-5.5s] %(message)s',
-                 datefmt='%Y-%m%d-%H:%M:%S')
+        if self.file_format == 'json':
+            f_formatter = JsonFormatter()
+        else:
+            f_formatter = logging.Formatter(FORMAT, datefmt=DATE_FORMAT)
         f_handler.setFormatter(f_formatter)
 
         if len(logger_rmb.handlers) == 0:
-            logger_rmb.addHandler(c_handler)
-            logger_rmb.addHandler(f_handler)
+            if self.queued:
+                record_queue = queue.SimpleQueue()
+                listener = start_listener(record_queue, [c_handler, f_handler])
+                logger_rmb.addHandler(ForkAwareQueueHandler(record_queue, listener))
+            else:
+                logger_rmb.addHandler(c_handler)
+                logger_rmb.addHandler(f_handler)
 
-        logging.getLogger().setLevel(logging.DEBUG)
+        # (records below both handlers' levels are dropped by the logger, before any message is formatted)
+        logging.getLogger().setLevel(min(self.console_level, self.file_level))
         c_handler.setLevel(self.console_level)
         f_handler.setLevel(self.file_level)
 
@@ -0,0 +1,205 @@
+"""
+ookla.py
+
+Helpers for running Ookla's speedtest CLI and handling its output, shared by the data collection tools.
+
+The CLI is run as an asyncio subprocess with its output streamed line by line (--format=jsonl --progress=yes prints
+progress events while the test runs, followed by the result), so many runs can be managed from one thread and nothing
+printed before a timeout is lost.
+"""
+
+import asyncio
+import json
+import logging
+import random
+import time
+from contextlib import nullcontext
+from json.decoder import JSONDecodeError
+from typing import AsyncContextManager, Callable, Iterator, List, Optional
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger()
+
+
+def line_contains_error(line: str) -> bool:
+    """
+    Checks an input line specifically for an error object (in JSON format). For example...
+
+        "{'error': 'description'}"
+
+    Looks only for the key name 'error' (i.e., 'error' in the description is not checked for)
+    """
+
+    try:
+        line_json = json.loads(line)
+    except JSONDecodeError:
+        return False
+    return True if 'error' in line_json.keys() else False
+
+
+def add_address_info(line: str, addr_info: dict) -> str:
+    """
+    Adds address info (in the form of an additional JSON object) to the end of a valid ookla cli output line
+    """
+    try:
+        line_json = json.loads(line)
+    except JSONDecodeError:
+        logger.warning(f'JSON decode error: {line}')
+        return line
+
+    # Must have all these keys. Otherwise, return the line unchanged.
+    for test in ['timestamp', 'upload', 'download', 'result']:
+        if test not in line_json.keys():
+            logger.warning(f'{test} key not found in: {line}')
+            return line
+
+    line_json['address'] = addr_info
+    line_updated = json.dumps(line_json)
+    return line_updated
+
+
+# Line types printed by the CLI with --format=jsonl while a test is in progress (the final line is of type 'result')
+PROGRESS_TYPES = {'testStart', 'ping', 'download', 'upload'}
+
+
+class SpeedtestOutcome(BaseModel):
+    """
+    Everything one run of the CLI produced. Output lines are recorded as they are streamed, so a run which is killed
+    (e.g., on timeout) keeps whatever it printed up to that point.
+    """
+    lines: List[str] = Field(default=[], description='Result, error and log lines (i.e., everything but progress)')
+    progress: List[dict] = Field(default=[], description='Intermediate progress events, in the order received')
+    stderr: str = ''
+    returncode: Optional[int] = None
+    timed_out: bool = False
+    elapsed: float = 0.
+
+    @property
+    def ok(self) -> bool:
+        if self.timed_out or self.returncode != 0 or self.stderr.strip() != '':
+            return False
+        if len(self.lines) != 1:
+            return False
+        return not line_contains_error(self.lines[0]) and line_type(self.lines[0]) != 'log'
+
+
+def line_type(line: str) -> Optional[str]:
+    try:
+        line_json = json.loads(line)
+    except JSONDecodeError:
+        return None
+    return line_json.get('type') if isinstance(line_json, dict) else None
+
+
+def backoff_delays(base: float = 5., cap: float = 120.) -> Iterator[float]:
+    """
+    Yields seconds to wait before each retry: exponential backoff (base, 2*base, 4*base, .. up to cap) with full jitter,
+    so that several runners retrying after a shared failure don't all retry at the same moment.
+    """
+    attempt = 0
+    while True:
+        yield random.uniform(0., min(cap, base * 2 ** attempt))
+        attempt += 1
+
+
+async def terminate(proc: asyncio.subprocess.Process, grace: float = 5.) -> None:
+    """
+    Stops a (possibly hung) process: SIGTERM, then SIGKILL if it hasn't exited within grace seconds. The process is
+    always reaped before returning, so no zombies are left behind.
+    """
+    if proc.returncode is not None:
+        return
+    try:
+        proc.terminate()
+        await asyncio.wait_for(proc.wait(), timeout=grace)
+    except ProcessLookupError:
+        pass
+    except asyncio.TimeoutError:
+        proc.kill()
+    await proc.wait()
+
+
+async def run_speedtest_async(command: List[str], timeout: float = 60.,
+                              on_line: Callable[[str], None] = None,
+                              on_progress: Callable[[dict], None] = None) -> SpeedtestOutcome:
+    """
+    Runs the CLI once, streaming its output line by line. on_line is called for each result/error/log line as soon as it
+    is printed (so the caller can persist it right away), on_progress for each progress event.
+    """
+
+    outcome = SpeedtestOutcome()
+    t0 = time.monotonic()
+    proc = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE,
+                                                stderr=asyncio.subprocess.PIPE)
+
+    async def read_stdout():
+        async for raw_line in proc.stdout:
+            line = raw_line.decode('utf-8', errors='replace').strip()
+            if line == '':
+                continue
+            if line_type(line) in PROGRESS_TYPES:
+                event = json.loads(line)
+                outcome.progress.append(event)
+                if on_progress is not None:
+                    on_progress(event)
+            else:
+                outcome.lines.append(line)
+                if on_line is not None:
+                    on_line(line)
+
+    async def read_stderr():
+        outcome.stderr = (await proc.stderr.read()).decode('utf-8', errors='replace')
+
+    try:
+        await asyncio.wait_for(asyncio.gather(read_stdout(), read_stderr(), proc.wait()), timeout=timeout)
+    except asyncio.TimeoutError:
+        outcome.timed_out = True
+    finally:
+        await terminate(proc)
+        outcome.returncode = proc.returncode
+        outcome.elapsed = time.monotonic() - t0
+
+    return outcome
+
+
+async def run_speedtest_with_retries(command: List[str], max_attempts: int = 5, timeout: float = 60.,
+                                     delays: Iterator[float] = None,
+                                     on_line: Callable[[str], None] = None,
+                                     on_progress: Callable[[dict], None] = None,
+                                     limiter: Callable[[], AsyncContextManager] = nullcontext,
+                                     label: str = 'speedtest') -> SpeedtestOutcome:
+    """
+    Runs the CLI until a run succeeds (see SpeedtestOutcome.ok), up to max_attempts times, waiting between attempts per
+    delays (default: backoff_delays()). Each attempt holds a limiter slot (e.g., an uplink semaphore) only while the
+    CLI is running, not while waiting to retry. Returns the outcome of the last attempt.
+    """
+
+    delays = delays if delays is not None else backoff_delays()
+    outcome = None
+
+    for attempt in range(1, max_attempts + 1):
+
+        if attempt > 1:
+            delay = next(delays)
+            logger.warning(f"[{label}] This is attempt {attempt} of maximum {max_attempts} "
+                           f"(after {delay:0.1f} seconds)")
+            await asyncio.sleep(delay)
+
+        async with limiter():
+            outcome = await run_speedtest_async(command, timeout=timeout, on_line=on_line, on_progress=on_progress)
+
+        logger.info(f"[{label}] speedtest finished in {outcome.elapsed:0.3f} seconds "
+                    f"(exit status {outcome.returncode})")
+
+        if outcome.timed_out:
+            last = outcome.progress[-1] if outcome.progress else None
+            logger.warning(f"[{label}] speedtest timed out after {timeout} seconds. Last progress event: {last}")
+        if outcome.stderr.strip() != '':
+            logger.warning(f"[{label}] non-empty stderr: {outcome.stderr.strip()}")
+        if len(outcome.lines) != 1:
+            logger.warning(f"[{label}] Expected only 1 line of output, found {len(outcome.lines)}")
+
+        if outcome.ok:
+            break
+
+    return outcome
@@ -4,7 +4,15 @@ plot-mbps.py
 
 A plotly application to plot timeseries data collected from the Ookla speedtest CLI. Input is in JSON, with data
 validation and data modeling performed with Pydantic (see model.py). Output is opened in an interactive plotly chart or
-saved to an image file (see variable 'plotly_output').
+(with --export) rendered to static HTML pages and images, e.g. for nightly reports:
+
+    plot-mbps.py -f 'logs/speedtest.log*' --export reports/ [--image-format png] [--cdn]
+
+Run directly, the app is served by Dash's development server. For several concurrent users, serve it with gunicorn
+(see gunicorn.conf.py), which builds the app with create_app() once, before forking its workers, so the workers share
+the loaded data:
+
+    PLOT_MBPS_ARGS="--compact -f 'logs/speedtest.log*'" gunicorn -c gunicorn.conf.py
 
 The impetus of this program is to assist in identifying weak Wi-Fi signal strength in various locations of a building.
 Annotations of the data are supported and allow calling-out of notable changes in throughput as the base system (a
@@ -14,57 +22,49 @@ Follows several principles from 'Clean Code' (R.C. Martin, 2008), including *not
 parameters (in favor of using appropriately descriptive method and parameter names with Python type hints).
 """
 
+import argparse
+import hashlib
+import importlib.util
 import json
 import logging
+import os
+import re
+import shlex
+from functools import lru_cache
 import pandas as pd
 from pandas.core.frame import DataFrame
+from typing import List, Union
+from aggregate import RollupCache, heatmap_matrix
+from anomaly import detect_batch
+from dedup import drop_duplicates
+from ingest import expand_sources, read_jsonl_files
+from jsonl_index import JsonlIndex
+from loggingrmb import TRACE, LoggingRmb, lazy, timed
 from model import MainObject
-from typing import List
-from pydantic import ValidationError
-from loggingrmb import LoggingRmb
+from samples import SampleArray
+from storage import SqliteStore
 import plotly.express as px
+import plotly.graph_objects as go
 from dash import Dash, Input, Output, dcc, html
 
-app = Dash(__name__)
+logger = LoggingRmb(console_level=logging.INFO, queued=True,
+                    file_format=os.environ.get('PLOT_MBPS_LOG_FORMAT', 'text')).setup()
+
 
-logger = LoggingRmb(console_level=logging.INFO).setup()
+# Colors are assigned per address in order of first appearance, and stay with the address as rooms are toggled
+COLOR_SEQUENCE = px.colors.qualitative.Plotly
 
+# Memoized figures per process (one per distinct selection of addresses)
+CALLBACK_CACHE_SIZE = 256
+
+# Series with at least this many samples are drawn with WebGL (scattergl) rather than SVG traces
+SCATTERGL_MIN_POINTS = 5000
 
 input_json_file = "speedtest-example.json"
 output_png_file = "speedtest.png"
 plotly_output = "show"  # An image filename, or "show" for an interactive plot
 
 
-def read_jsonl_file(file_path: str) -> List[MainObject]:
-    line_num = 0
-    lines_read = 0
-    data = []
-    with open(file_path, 'r') as f:
-        for line in f:
-            line_num += 1
-            try:
-                json_data = json.loads(line)
-                obj = MainObject(**json_data)
-                data.append(obj)
-            except json.JSONDecodeError as e:
-                logger.debug(f"Line {line_num}: JSON decode error: {e}")
-                continue
-            except ValidationError as e:
-                logger.debug(f"Line {line_num}: Validation error: {e}")
-                continue
-            except Exception as e:
-                logger.debug(f"Line {line_num}: Error: {e}")
-                continue
-            lines_read += 1
-
-    logger.info(f"Lines input: {line_num}")
-    logger.info(f"Lines processed: {lines_read}")
-    if line_num != lines_read:
-        logger.info('(see log file for JSON, validation and other input errors)')
-
-    return data
-
-
 def create_dataframe(data_objects: List) -> DataFrame:
 
     df_prep = []
@@ -89,8 +89,8 @@ def create_dataframe(data_objects: List) -> DataFrame:
 
     df = pd.DataFrame(df_prep)
 
-    with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', 200):
-        logger.debug(df)
+    # (the whole frame, formatted only if the log file records TRACE)
+    logger.log(TRACE, '%s', lazy(df.to_string))
 
     return df
 
@@ -126,39 +126,361 @@ def customize_upload_line_color(figure):
         figure['data'][i].line.color = 'gray'
 
 
-@app.callback(
-    Output(component_id='graph', component_property='figure'),
-    Input(component_id='addresses_checklist', component_property='value'),
-    prevent_initial_call=True
-)
-def update_graph(enabled_addresses):
-    df_update = speedtest_dataframe[speedtest_dataframe['address'].isin(enabled_addresses)]
-    fig_update = px.line(df_update, x='timestamp', y=['download_mbps', 'upload_mbps'], color='address', labels={'address': 'Address/Room'})
-    customize_legend(fig_update)
-    customize_axes(fig_update)
-    customize_upload_line_color(fig_update)
-    return fig_update
+class TraceCache:
+    """
+    Per-address plotly traces, built once from the dataframe and reused by every toggle of the addresses checklist.
+
+    The traces (and the customized layout) are stored as plain plotly JSON so that assembling a figure for any selection
+    of addresses is only a list concatenation. The cache is tagged with a data version and is rebuilt by refresh()
+    only when that version changes (i.e., when new data have been loaded).
 
+    Anomalous download/upload results (see anomaly.py) are overlaid on each address's lines as markers. Addresses with
+    long series are drawn with WebGL (scattergl) traces. A fingerprint of each address's data is kept, so that static
+    exports can skip charts whose data haven't changed.
+    """
 
-if __name__ == "__main__":
+    def __init__(self):
+        self.data_version = None
+        self.layout = {}
+        self.traces = {}  # address -> [download trace, upload trace(, anomalies trace)]
+        self.fingerprints = {}  # address -> hash of its samples and anomalies
+
+    def refresh(self, df: DataFrame, data_version, anomalies: DataFrame = None) -> None:
+        if data_version == self.data_version:
+            return
+
+        figure = go.Figure()
+        traces = {}
+        fingerprints = {}
+        for i, (address, df_address) in enumerate(df.groupby('address', sort=False)):
+            color = COLOR_SEQUENCE[i % len(COLOR_SEQUENCE)]
+            scatter = go.Scattergl if len(df_address) >= SCATTERGL_MIN_POINTS else go.Scatter
+            traces[address] = []
+            fingerprints[address] = hashlib.sha256(
+                value_hashes(df_address[['timestamp', 'download_mbps', 'upload_mbps']]))
+            for column in ['download_mbps', 'upload_mbps']:
+                figure.add_trace(scatter(
+                    x=df_address['timestamp'], y=df_address[column], name=address, legendgroup=address,
+                    showlegend=(column == 'download_mbps'), mode='lines', line=dict(color=color, dash='solid'),
+                    hovertemplate=(f'Address/Room={address}<br>variable={column}'
+                                   '<br>timestamp=%{x}<br>value=%{y}<extra></extra>')
+                ))
+                traces[address].append(len(figure.data) - 1)
+
+        figure.update_layout(legend=dict(title_text='Address/Room', tracegroupgap=0))
+        customize_legend(figure)
+        customize_axes(figure)
+        customize_upload_line_color(figure)
+
+        if anomalies is not None and len(anomalies) > 0:
+            speed_anomalies = anomalies[anomalies['metric'].isin(['download_mbps', 'upload_mbps'])]
+            speed_anomalies = speed_anomalies.assign(
+                address=speed_anomalies['address'] + '_' + speed_anomalies['room']
+            ).groupby(['address', 'timestamp', 'metric'], sort=False).agg(
+                value=('value', 'first'), detectors=('detector', ', '.join)
+            ).reset_index()
+            for address, df_anomalies in speed_anomalies.groupby('address', sort=False):
+                if address not in traces:
+                    continue
+                fingerprints[address].update(value_hashes(df_anomalies))
+                scatter = go.Scattergl if len(df_anomalies) >= SCATTERGL_MIN_POINTS else go.Scatter
+                figure.add_trace(scatter(
+                    x=df_anomalies['timestamp'], y=df_anomalies['value'], name=f'{address} anomalies',
+                    legendgroup=address, showlegend=False, mode='markers',
+                    marker=dict(color='red', symbol='x', size=9), customdata=df_anomalies[['metric', 'detectors']],
+                    hovertemplate=f'Address/Room={address}<br>anomaly=%{{customdata[0]}} (%{{customdata[1]}})'
+                                  f'<br>timestamp=%{{x}}<br>value=%{{y}}<extra></extra>'
+                ))
+                traces[address].append(len(figure.data) - 1)
+
+        figure_json = figure.to_plotly_json()
+        self.layout = figure_json['layout']
+        self.traces = {address: [figure_json['data'][i] for i in indices] for address, indices in traces.items()}
+        self.fingerprints = {address: fingerprint.hexdigest() for address, fingerprint in fingerprints.items()}
+        self.data_version = data_version
+        logger.debug(f"Trace cache rebuilt for {len(self.traces)} addresses (data version {data_version})")
+
+    def figure(self, enabled_addresses: List[str]) -> dict:
+        enabled = set(enabled_addresses or [])
+        data = [trace for address, traces in self.traces.items() if address in enabled for trace in traces]
+        return {'data': data, 'layout': self.layout}
+
+
+def value_hashes(df: DataFrame) -> bytes:
+    """
+    The hashes of the dataframe's values, as bytes. Timestamps are hashed as nanoseconds since the epoch (UTC), so
+    the hashes don't depend on the timestamp column's dtype (its resolution or time zone)
+    """
+    df = df.assign(**{name: pd.to_datetime(column, utc=True).dt.as_unit('ns').astype('int64')
+                      for name, column in df.items() if pd.api.types.is_datetime64_any_dtype(column)})
+    return pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()
+
+
+def dataframe_version(df: DataFrame) -> tuple:
+    """
+    A cheap fingerprint of the dataframe's values, used to decide when cached traces must be rebuilt
+    """
+    if len(df) == 0:
+        return 0, None
+    return len(df), pd.Timestamp(df['timestamp'].max()).value
+
+
+def heatmap_figure(rollups: RollupCache, enabled_addresses: List[str]) -> go.Figure:
+    """
+    Mean download Mbps by room and hour-of-day (from the cached hourly rollup)
+    """
+    matrix = heatmap_matrix(rollups)
+    if len(matrix) > 0:
+        matrix = matrix[matrix.index.isin(enabled_addresses or [])]
+    figure = px.imshow(matrix, labels=dict(x='Hour of day', y='Address/Room', color='Mbps'), aspect='auto',
+                       color_continuous_scale='RdYlGn', title='Mean download speed by hour of day')
+    figure.update_xaxes(dtick=1)
+    return figure
+
+
+def box_figure(rollups: RollupCache, enabled_addresses: List[str]) -> go.Figure:
+    """
+    Distribution of download and upload Mbps per room. Boxes are drawn from the precomputed rollup percentiles (whiskers
+    at p5/p95) rather than from the raw samples.
+    """
+    figure = go.Figure()
+    by_room = rollups.rollup('room')
+    if len(by_room) > 0:
+        by_room = by_room[by_room.index.isin(enabled_addresses or [])]
+    for direction, color in [('download', COLOR_SEQUENCE[0]), ('upload', 'gray')]:
+        figure.add_trace(go.Box(
+            name=f'{direction}_mbps', x=list(by_room.index), marker_color=color,
+            lowerfence=by_room.get(f'{direction}_p5'), q1=by_room.get(f'{direction}_p25'),
+            median=by_room.get(f'{direction}_median'), q3=by_room.get(f'{direction}_p75'),
+            upperfence=by_room.get(f'{direction}_p95'), mean=by_room.get(f'{direction}_mean'),
+        ))
+    figure.update_layout(boxmode='group', title='Speed distribution by room (p5, p25, median, p75, p95)')
+    customize_axes(figure)
+    return figure
+
+
+def chart_name(address: str) -> str:
+    return re.sub(r'[^A-Za-z0-9]+', '-', address).strip('-').lower() or 'unnamed'
+
+
+def export_charts(output_dir: str, traces: TraceCache, rollups: RollupCache, image_format: str = None,
+                  include_plotlyjs: Union[bool, str] = True, force: bool = False) -> int:
+    """
+    Renders, without the Dash server, one chart per address/room and an aggregate page (index.html: every address, the
+    heatmap and the box plots) to self-contained HTML, and to images if image_format is given (requires kaleido).
+    Charts whose data haven't changed since the last export (see manifest.json in output_dir) are not regenerated.
+    Returns the number of charts rendered.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_file = os.path.join(output_dir, 'manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_file) and not force:
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+
+    if image_format and importlib.util.find_spec('kaleido') is None:
+        logger.warning(f"kaleido is not installed, so no {image_format} images are written (HTML only)")
+        image_format = None
+
+    def up_to_date(name: str, fingerprint: str) -> bool:
+        files = [f"{name}.html"] + ([f"{name}.{image_format}"] if image_format else [])
+        return manifest.get(name) == fingerprint and all(os.path.exists(os.path.join(output_dir, file))
+                                                         for file in files)
+
+    def write(name: str, figure: go.Figure) -> None:
+        figure.write_html(os.path.join(output_dir, f"{name}.html"), include_plotlyjs=include_plotlyjs)
+        if image_format:
+            figure.write_image(os.path.join(output_dir, f"{name}.{image_format}"))
+
+    rendered = 0
+    for address in traces.traces:
+        name = chart_name(address)
+        if up_to_date(name, traces.fingerprints[address]):
+            continue
+        figure = go.Figure(traces.figure([address]))
+        figure.update_layout(title=address)
+        write(name, figure)
+        manifest[name] = traces.fingerprints[address]
+        rendered += 1
+
+    addresses = list(traces.traces)
+    aggregate_fingerprint = hashlib.sha256(
+        json.dumps([traces.fingerprints[address] for address in addresses]).encode('utf-8')).hexdigest()
+    if not up_to_date('index', aggregate_fingerprint):
+        figures = [go.Figure(traces.figure(addresses)), heatmap_figure(rollups, addresses),
+                   box_figure(rollups, addresses)]
+        links = ''.join(f'<li><a href="{chart_name(address)}.html">{address}</a></li>' for address in addresses)
+        body = ''.join(figure.to_html(full_html=False, include_plotlyjs=(include_plotlyjs if i == 0 else False))
+                       for i, figure in enumerate(figures))
+        with open(os.path.join(output_dir, 'index.html'), 'w') as f:
+            f.write(f'<html><head><meta charset="utf-8"><title>Speedtest Results</title></head><body>'
+                    f'<h1>Speedtest Results</h1><ul>{links}</ul>{body}</body></html>')
+        if image_format:
+            figures[0].write_image(os.path.join(output_dir, f"index.{image_format}"))
+        manifest['index'] = aggregate_fingerprint
+        rendered += 1
+
+    with open(manifest_file, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    logger.info(f"{rendered} of {len(addresses) + 1} charts rendered to {output_dir}")
+    return rendered
+
+
+def load_speedtest_data(args: argparse.Namespace) -> Union[List[MainObject], SampleArray]:
+    """
+    Loads the whole of the JSON lines file(s) (as MainObjects, or with --compact as a SampleArray), or only the results
+    within the requested time range and rooms: with --index via each file's offset index, with --db from SQLite
+    """
+    if args.db is None and args.index:
+        parts = [JsonlIndex(file_path).read(start=args.since, end=args.until, addresses=args.address,
+                                            rooms=args.room, compact=args.compact)
+                 for file_path in expand_sources(args.file)]
+        if args.compact:
+            return drop_duplicates(SampleArray.concatenate(parts).sorted_by_time())
+        return drop_duplicates(sorted((obj for part in parts for obj in part), key=lambda obj: obj.timestamp))
+    if args.db is None:
+        data, _ = read_jsonl_files(args.file, workers=args.workers, compact=args.compact)
+        return data
+    store = SqliteStore(args.db)
+    data = store.query(start=args.since, end=args.until, addresses=args.address, rooms=args.room)
+    store.close()
+    logger.info(f"{len(data)} results loaded from {args.db}")
+    return data
 
-    speedtest_data = read_jsonl_file(input_json_file)
-    speedtest_dataframe = create_dataframe(speedtest_data)
 
-    fig = px.line(speedtest_dataframe, x='timestamp', y=['download_mbps', 'upload_mbps'], color='address', labels={'address': 'Address/Room'})
-    customize_legend(fig)
-    customize_axes(fig)
-    customize_upload_line_color(fig)
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Plot speedtest results')
+    parser.add_argument('-f', '--file', nargs='+', default=[input_json_file],
+                        help='JSON lines input file(s), directories or glob patterns (.gz files are decompressed)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Processes parsing input files (default: one per CPU)')
+    parser.add_argument('--compact', action='store_true',
+                        help='Hold the samples in compact arrays rather than pydantic models (see samples.py)')
+    parser.add_argument('-d', '--db', help='Read from this SQLite database (see storage.py) instead of a file')
+    parser.add_argument('--index', action='store_true',
+                        help='Read only the requested results via the files\' offset indexes (see jsonl_index.py)')
+    parser.add_argument('--since',
+                        help='(with --db or --index) Only results at or after this UTC time, e.g. 2024-08-13')
+    parser.add_argument('--until', help='(with --db or --index) Only results before this UTC time')
+    parser.add_argument('--address', nargs='+', help='(with --db or --index) Only these addresses (houses)')
+    parser.add_argument('--room', nargs='+', help='(with --db or --index) Only these rooms')
+    parser.add_argument('--export', metavar='DIR',
+                        help='Render the charts to static files in DIR (no Dash server), e.g. from a nightly cron job')
+    parser.add_argument('--image-format', choices=['png', 'jpeg', 'webp', 'svg', 'pdf'],
+                        help='(with --export) Also write images in this format (requires kaleido)')
+    parser.add_argument('--cdn', action='store_true',
+                        help='(with --export) Load plotly.js from its CDN rather than embedding it in every file')
+    parser.add_argument('--force', action='store_true', help='(with --export) Regenerate every chart')
+    parser.add_argument('--host', default='127.0.0.1', help='(development server) Interface to listen on')
+    parser.add_argument('--port', type=int, default=8050, help='(development server) Port to listen on')
+    parser.add_argument('--debug', action='store_true', help='(development server) Run with the Dash debugger and '
+                                                             'reloader')
+    return parser
+
+
+class Dashboard:
+    """
+    The data behind the dashboard, loaded once per process, with the trace and rollup caches built from them.
+
+    Figures for the callbacks are memoized on (selected addresses, data version), so repeated selections (by any user of
+    the same worker) are served without rebuilding them.
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        with timed('load'):
+            self.data = load_speedtest_data(args)
+        with timed('build_frame', samples=len(self.data)):
+            if isinstance(self.data, SampleArray):
+                self.dataframe = self.data.to_frame()
+            else:
+                self.dataframe = create_dataframe(self.data)
+
+        with timed('detect_anomalies', samples=len(self.data)):
+            self.anomalies, _ = detect_batch(self.data)
+        self.data_version = dataframe_version(self.dataframe)
+        with timed('plot', samples=len(self.data)):
+            self.traces = TraceCache()
+            self.traces.refresh(self.dataframe, self.data_version, self.anomalies)
+        with timed('aggregate', samples=len(self.data)):
+            self.rollups = RollupCache()
+            self.rollups.add(self.data)
+
+        # List of unique addresses in the dataframe (for the Dash checklist)
+        self.addresses = sorted(list(set(self.dataframe['address'])))
+
+        self.cached_graph = lru_cache(maxsize=CALLBACK_CACHE_SIZE)(self.graph_figure)
+        self.cached_rollup_views = lru_cache(maxsize=CALLBACK_CACHE_SIZE)(self.rollup_figures)
+
+    def graph_figure(self, selection: tuple, data_version) -> dict:
+        return self.traces.figure(list(selection))
+
+    def rollup_figures(self, selection: tuple, data_version) -> tuple:
+        return heatmap_figure(self.rollups, list(selection)), box_figure(self.rollups, list(selection))
+
+    def layout(self) -> html.Div:
+        return html.Div([
+            html.H1(id="dash-title", children="Speedtest Results"),
+            html.Hr(),
+            dcc.Checklist(self.addresses, self.addresses, id='addresses_checklist'),
+            html.Hr(),
+            dcc.Graph(id="graph", figure=self.cached_graph(tuple(self.addresses), self.data_version)),
+            html.Hr(),
+            dcc.Graph(id="heatmap", figure=self.cached_rollup_views(tuple(self.addresses), self.data_version)[0]),
+            dcc.Graph(id="boxplot", figure=self.cached_rollup_views(tuple(self.addresses), self.data_version)[1])
+        ])
+
+
+def create_app(args: argparse.Namespace = None) -> Dash:
+    """
+    App factory: loads the data (once per process) and builds the Dash app. Without args, the options are parsed from
+    the PLOT_MBPS_ARGS environment variable (as when served by gunicorn, see gunicorn.conf.py).
+    """
+    if args is None:
+        args = make_parser().parse_args(shlex.split(os.environ.get('PLOT_MBPS_ARGS', '')))
+    dashboard = Dashboard(args)
+
+    app = Dash(__name__)
+    app.layout = dashboard.layout()
+
+    @app.callback(
+        Output(component_id='graph', component_property='figure'),
+        Input(component_id='addresses_checklist', component_property='value'),
+        prevent_initial_call=True
+    )
+    @timed('update_graph', level=logging.DEBUG)
+    def update_graph(enabled_addresses):
+        return dashboard.cached_graph(tuple(sorted(enabled_addresses or [])), dashboard.data_version)
+
+    @app.callback(
+        Output(component_id='heatmap', component_property='figure'),
+        Output(component_id='boxplot', component_property='figure'),
+        Input(component_id='addresses_checklist', component_property='value'),
+        prevent_initial_call=True
+    )
+    @timed('update_rollup_views', level=logging.DEBUG)
+    def update_rollup_views(enabled_addresses):
+        return dashboard.cached_rollup_views(tuple(sorted(enabled_addresses or [])), dashboard.data_version)
+
+    app.dashboard = dashboard
+    return app
+
+
+def create_server():
+    """
+    The WSGI application (Flask server) of a new Dash app, for gunicorn
+    """
+    return create_app().server
+
+
+if __name__ == "__main__":
 
-    # List of unique addresses in the dataframe (for the Dash checklist)
-    addresses = sorted(list(set(speedtest_dataframe['address'])))
+    args = make_parser().parse_args()
 
-    app.layout = html.Div([
-        html.H1(id="dash-title", children="Speedtest Results"),
-        html.Hr(),
-        dcc.Checklist(addresses, addresses, id='addresses_checklist'),
-        html.Hr(),
-        dcc.Graph(id="graph", figure=fig)
-    ])
+    if args.export:
+        dashboard = Dashboard(args)
+        with timed('export'):
+            export_charts(args.export, dashboard.traces, dashboard.rollups, image_format=args.image_format,
+                          include_plotlyjs='cdn' if args.cdn else True, force=args.force)
+        raise SystemExit(0)
 
-    app.run(debug=True)
+    create_app(args).run(host=args.host, port=args.port, debug=args.debug)
@@ -6,7 +6,6 @@ EXE=$DIR/$BASE
 
 cd $DIR
 source $DIR/.venv/bin/activate
-ps -efj | grep -q "python3 .*${BASE}$"
-[ $? -ne 0 ] && {
-    $EXE 2>&1 >> $DIR/console.log 2>&1
-}
+
+# (speedtest-runner.py holds a PID lockfile and exits right away if a previous run is still in progress)
+$EXE 2>&1 >> $DIR/console.log 2>&1
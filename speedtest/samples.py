@@ -0,0 +1,339 @@
+"""
+samples.py
+
+Compact in-memory representations of speedtest results, for holding long time series (years of samples) on a small host.
+
+A MainObject (see model.py) keeps every field of a result in seven nested pydantic models, which costs kilobytes per
+sample. Plotting and aggregation need only a dozen scalars per sample, so..
+
+    Sample       One result as a __slots__ object holding only those scalars.
+    SampleArray  A struct-of-arrays container: one typed array per field (array.array, exposed to numpy without
+                 copying), with address and room strings stored once and referenced by small integer codes.
+
+Both are built directly from the parsed JSON (no pydantic models are created), applying the same constraints as
+MainObject. The byte offset of each sample's line in its source file is kept, so the full MainObject for any sample can
+be re-read and validated on demand. (Logs are read into a SampleArray by ingest.read_samples.)
+"""
+
+import gzip
+import json
+import re
+import uuid
+from array import array
+from calendar import timegm
+from typing import BinaryIO, Iterable, List, Optional
+import numpy as np
+import pandas as pd
+from pandas.core.frame import DataFrame
+from model import MainObject
+
+TIMESTAMP_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z$")
+
+NO_RESULT_ID = bytes(16)  # (ids which aren't UUIDs, e.g. the '0' reported for results which weren't uploaded)
+
+# The fields (and their JSON types) which MainObject requires in the objects of a result which aren't kept in a Sample
+NUMBER = (int, float)
+REQUIRED_FIELDS = {
+    'ping': {'jitter': NUMBER, 'latency': NUMBER, 'low': NUMBER, 'high': NUMBER},
+    'interface': {'internalIp': str, 'name': str, 'macAddr': str, 'isVpn': bool, 'externalIp': str},
+    'server': {'id': int, 'host': str, 'port': int, 'name': str, 'location': str, 'country': str, 'ip': str},
+    'result': {'id': str, 'persisted': bool},
+}
+MAX_ADDRESS_LENGTH = 32  # (AddressObject's max_length, for address and room)
+
+
+def parse_timestamp(timestamp: str) -> int:
+    """
+    YYYY-MM-DDTHH:MM:SSZ to seconds since the epoch
+    """
+    if not isinstance(timestamp, str) or not TIMESTAMP_PATTERN.match(timestamp):
+        raise ValueError(f"Invalid timestamp: {timestamp}")
+    fields = (int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]),
+              int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19]))
+    if not (1 <= fields[1] <= 12 and 1 <= fields[2] <= 31 and fields[3] <= 23 and fields[4] <= 59 and fields[5] <= 61):
+        raise ValueError(f"Invalid timestamp: {timestamp}")
+    return timegm(fields)
+
+
+def transfer_mbps(transfer: dict) -> float:
+    """
+    Mbps of a download or upload object, as computed by DownloadObject.mbps / UploadObject.mbps
+    """
+    bandwidth, nbytes, elapsed = transfer['bandwidth'], transfer['bytes'], transfer['elapsed']
+    if not isinstance(nbytes, int) or not isinstance(elapsed, int) or not isinstance(bandwidth, int):
+        raise ValueError(f"Invalid transfer: {transfer}")
+    if bandwidth < 0 or nbytes < 0 or elapsed <= 0:
+        raise ValueError(f"Invalid transfer: {transfer}")
+    return (nbytes * 8) / (elapsed / 1000.0) / 1000000.0
+
+
+def check_fields(line_json: dict) -> None:
+    """
+    Raises TypeError or KeyError unless the result has the fields, of the JSON types in REQUIRED_FIELDS, which
+    MainObject requires. (MainObject also accepts numbers and booleans given as strings, which Ookla's CLI never
+    writes.)
+    """
+    if not isinstance(line_json['isp'], str):
+        raise TypeError(f"Invalid isp: {line_json['isp']!r}")
+    for name, fields in REQUIRED_FIELDS.items():
+        obj = line_json[name]
+        if not isinstance(obj, dict):
+            raise TypeError(f"Invalid {name}: {obj!r}")
+        for field, types in fields.items():
+            if not isinstance(obj[field], types):
+                raise TypeError(f"Invalid {name}.{field}: {obj[field]!r}")
+
+
+def result_id_bytes(result_id: str) -> bytes:
+    try:
+        return uuid.UUID(result_id).bytes
+    except (ValueError, AttributeError, TypeError):
+        return NO_RESULT_ID
+
+
+class Sample:
+    """
+    The scalars of one speedtest result which are needed for plotting and aggregation
+    """
+
+    __slots__ = ('timestamp', 'address', 'room', 'download_mbps', 'upload_mbps', 'download_bandwidth',
+                 'upload_bandwidth', 'ping_latency', 'ping_jitter', 'packet_loss', 'result_id', 'offset')
+
+    def __init__(self, timestamp: int, address: str, room: str, download_mbps: float, upload_mbps: float,
+                 download_bandwidth: int, upload_bandwidth: int, ping_latency: float, ping_jitter: float,
+                 packet_loss: float, result_id: bytes, offset: int = -1):
+        self.timestamp = timestamp
+        self.address = address
+        self.room = room
+        self.download_mbps = download_mbps
+        self.upload_mbps = upload_mbps
+        self.download_bandwidth = download_bandwidth
+        self.upload_bandwidth = upload_bandwidth
+        self.ping_latency = ping_latency
+        self.ping_jitter = ping_jitter
+        self.packet_loss = packet_loss
+        self.result_id = result_id
+        self.offset = offset
+
+    def __repr__(self):
+        return f"Sample({', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)})"
+
+    @classmethod
+    def from_json(cls, line_json: dict, offset: int = -1) -> 'Sample':
+        """
+        Builds a sample from one parsed line of speedtest JSON. Raises KeyError, TypeError or ValueError for lines which
+        MainObject would reject: the fields kept here are validated as MainObject validates them, and the other fields
+        which MainObject requires are checked by check_fields (result.url's syntax isn't checked).
+        """
+        if line_json.get('type') != 'result':
+            raise ValueError(f"Not a result: type={line_json.get('type')}")
+        check_fields(line_json)
+        address = line_json['address']
+        location, room = address.get('address', ''), address.get('room', '')
+        if not isinstance(location, str) or not isinstance(room, str):
+            raise TypeError(f"Invalid address: {address!r}")
+        if len(location) > MAX_ADDRESS_LENGTH or len(room) > MAX_ADDRESS_LENGTH:
+            raise ValueError(f"Address or room longer than {MAX_ADDRESS_LENGTH} characters: {address!r}")
+        packet_loss = line_json.get('packetLoss')
+        return cls(
+            timestamp=parse_timestamp(line_json['timestamp']),
+            address=location,
+            room=room,
+            download_mbps=transfer_mbps(line_json['download']),
+            upload_mbps=transfer_mbps(line_json['upload']),
+            download_bandwidth=line_json['download']['bandwidth'],
+            upload_bandwidth=line_json['upload']['bandwidth'],
+            ping_latency=float(line_json['ping']['latency']),
+            ping_jitter=float(line_json['ping']['jitter']),
+            packet_loss=float('nan') if packet_loss is None else float(packet_loss),
+            result_id=result_id_bytes(line_json['result']['id']),
+            offset=offset,
+        )
+
+    @classmethod
+    def from_main_object(cls, obj: MainObject, offset: int = -1) -> 'Sample':
+        return cls(
+            timestamp=timegm(obj.timestamp_.timetuple()),
+            address=obj.address.address,
+            room=obj.address.room,
+            download_mbps=obj.download.mbps,
+            upload_mbps=obj.upload.mbps,
+            download_bandwidth=obj.download.bandwidth,
+            upload_bandwidth=obj.upload.bandwidth,
+            ping_latency=obj.ping.latency,
+            ping_jitter=obj.ping.jitter,
+            packet_loss=float('nan') if obj.packetLoss is None else float(obj.packetLoss),
+            result_id=result_id_bytes(obj.result.id),
+            offset=offset,
+        )
+
+    def to_main_object(self, file_path: str) -> MainObject:
+        """
+        The full (validated) MainObject for this sample, re-read from its line in file_path
+        """
+        return read_main_object(file_path, self.offset)
+
+
+def open_log(file_path: str) -> BinaryIO:
+    """
+    Opens a speedtest log for reading (binary), decompressing gzip'ed (.gz) rotations on the fly
+    """
+    if file_path.endswith('.gz'):
+        return gzip.open(file_path, 'rb')
+    return open(file_path, 'rb')
+
+
+def read_main_object(file_path: str, offset: int) -> MainObject:
+    if offset < 0:
+        raise ValueError("The sample's source line is unknown (it wasn't read from a file)")
+    with open_log(file_path) as f:
+        f.seek(offset)  # (offsets in .gz files are offsets into the decompressed data)
+        return MainObject(**json.loads(f.readline()))
+
+
+class SampleArray:
+    """
+    Struct-of-arrays storage of samples. Each field is a typed array (8 bytes per sample or less; 16 for the result id),
+    address and room are codes into lists of distinct strings, as is the source file (the samples may come from several
+    files, see concatenate).
+    """
+
+    # The per-sample fields which are copied as-is between arrays (location and source codes need remapping)
+    ARRAYS = ['timestamp', 'download_mbps', 'upload_mbps', 'download_bandwidth', 'upload_bandwidth', 'ping_latency',
+              'ping_jitter', 'packet_loss', 'offset']
+
+    def __init__(self, source_file: Optional[str] = None):
+        self.sources: List[str] = [source_file] if source_file else []
+        self.timestamp = array('q')
+        self.location = array('i')  # code into self.locations
+        self.download_mbps = array('d')
+        self.upload_mbps = array('d')
+        self.download_bandwidth = array('q')
+        self.upload_bandwidth = array('q')
+        self.ping_latency = array('f')
+        self.ping_jitter = array('f')
+        self.packet_loss = array('f')
+        self.result_id = bytearray()
+        self.offset = array('q')
+        self.source = array('i')  # code into self.sources (-1: not read from a file)
+        self.locations: List[tuple] = []  # (address, room)
+        self.location_codes = {}
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def append(self, sample: Sample) -> None:
+        key = (sample.address, sample.room)
+        code = self.location_codes.get(key)
+        if code is None:
+            code = self.location_codes[key] = len(self.locations)
+            self.locations.append(key)
+        self.timestamp.append(sample.timestamp)
+        self.location.append(code)
+        self.download_mbps.append(sample.download_mbps)
+        self.upload_mbps.append(sample.upload_mbps)
+        self.download_bandwidth.append(sample.download_bandwidth)
+        self.upload_bandwidth.append(sample.upload_bandwidth)
+        self.ping_latency.append(sample.ping_latency)
+        self.ping_jitter.append(sample.ping_jitter)
+        self.packet_loss.append(sample.packet_loss)
+        self.result_id += sample.result_id
+        self.offset.append(sample.offset)
+        self.source.append(0 if self.sources and sample.offset >= 0 else -1)
+
+    def __getitem__(self, i: int) -> Sample:
+        if i < 0:
+            i += len(self)
+        address, room = self.locations[self.location[i]]
+        return Sample(self.timestamp[i], address, room, self.download_mbps[i], self.upload_mbps[i],
+                      self.download_bandwidth[i], self.upload_bandwidth[i], self.ping_latency[i], self.ping_jitter[i],
+                      self.packet_loss[i], bytes(self.result_id[16 * i:16 * i + 16]), self.offset[i])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @classmethod
+    def from_main_objects(cls, objects: Iterable[MainObject]) -> 'SampleArray':
+        samples = cls()
+        for obj in objects:
+            samples.append(Sample.from_main_object(obj))
+        return samples
+
+    def to_main_object(self, i: int) -> MainObject:
+        if self.source[i] < 0:
+            raise ValueError("This sample wasn't read from a file")
+        return read_main_object(self.sources[self.source[i]], self.offset[i])
+
+    @classmethod
+    def concatenate(cls, sample_arrays: List['SampleArray']) -> 'SampleArray':
+        """
+        One SampleArray holding all the samples of sample_arrays, in order
+        """
+        merged = cls()
+        for samples in sample_arrays:
+            location_map = np.array([merged.location_codes.setdefault(key, len(merged.location_codes))
+                                     for key in samples.locations] or [0], dtype='i')
+            merged.locations = list(merged.location_codes)
+            # (the trailing -1 maps source code -1, "not read from a file", to itself)
+            source_map = np.array([len(merged.sources) + i for i in range(len(samples.sources))] + [-1], dtype='i')
+            merged.sources += samples.sources
+            for name in SampleArray.ARRAYS:
+                getattr(merged, name).extend(getattr(samples, name))
+            merged.location.frombytes(location_map[samples.column('location')].tobytes())
+            merged.source.frombytes(source_map[samples.column('source')].tobytes())
+            merged.result_id += samples.result_id
+        return merged
+
+    def take(self, indices: np.ndarray) -> 'SampleArray':
+        """
+        A new SampleArray with the samples at indices (e.g. an argsort of the timestamps), in that order
+        """
+        taken = SampleArray()
+        taken.sources = list(self.sources)
+        taken.locations = list(self.locations)
+        taken.location_codes = dict(self.location_codes)
+        for name in SampleArray.ARRAYS + ['location', 'source']:
+            getattr(taken, name).frombytes(self.column(name)[indices].tobytes())
+        taken.result_id = bytearray(self.column('result_id')[indices].tobytes())
+        return taken
+
+    def sorted_by_time(self) -> 'SampleArray':
+        return self.take(np.argsort(self.column('timestamp'), kind='stable'))
+
+    def nbytes(self) -> int:
+        """
+        Bytes held by the arrays (excluding the few distinct address/room strings)
+        """
+        arrays = [getattr(self, name) for name in SampleArray.ARRAYS + ['location', 'source']]
+        return sum(a.buffer_info()[1] * a.itemsize for a in arrays) + len(self.result_id)
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        A numpy view of one field (no copy)
+        """
+        values = getattr(self, name)
+        if name == 'result_id':
+            return np.frombuffer(values, dtype='S16')
+        return np.frombuffer(values, dtype=values.typecode)
+
+    def to_frame(self) -> DataFrame:
+        """
+        The same columns as plot-mbps.py's create_dataframe (zero-valued speeds are NaN, so they are not displayed)
+        """
+        timestamps = pd.to_datetime(self.column('timestamp'), unit='s')
+        names = np.array([f'{address}_{room}' for address, room in self.locations] or [''], dtype=object)
+        download_mbps = self.column('download_mbps')
+        upload_mbps = self.column('upload_mbps')
+        download_mbytesec = self.column('download_bandwidth') / 1000000.0
+        upload_mbytesec = self.column('upload_bandwidth') / 1000000.0
+        return pd.DataFrame({
+            "timestamp": timestamps,
+            "date": timestamps.date,
+            "time": timestamps.time,
+            "download_mbps": np.where(download_mbps > 0., download_mbps, np.nan),
+            "upload_mbps": np.where(upload_mbps > 0., upload_mbps, np.nan),
+            "download_bandwidth_mbytesec": np.where(download_mbytesec > 0., download_mbytesec, np.nan),
+            "upload_bandwidth_mbytesec": np.where(upload_mbytesec > 0., upload_mbytesec, np.nan),
+            "address": names[self.column('location')],
+        })
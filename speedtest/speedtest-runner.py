@@ -6,15 +6,15 @@ A Python script to spawn an instance of Ookla's speedtest CLI utility. Results a
 JSON format.
 """
 
-import json
+import asyncio
 import logging
 import os
-import subprocess as sp
-from datetime import datetime
-from json.decoder import JSONDecodeError
+from anomaly import AnomalyDetector, DetectorConfig
+from appendwriter import AlreadyRunning, AppendWriter, PidLock
+from jsonl_index import update_index
 from loggingrmb import LoggingRmb
-from subprocess import CalledProcessError
-from time import sleep
+from ookla import add_address_info, backoff_delays, run_speedtest_with_retries
+from storage import SqliteStore
 
 ADDR_INFO = {'address': 'Lowell St', 'room': 'Kitchen'}
 
@@ -24,121 +24,62 @@ bin_dir = f"{home}/.local/bin"
 speedtest_exe = f"{bin_dir}/speedtest"
 output_basename = "speedtest.log"
 output_file = f"{log_dir}/{output_basename}"
-sleep_val = 15
+pid_file = f"{log_dir}/speedtest-runner.pid"
+sqlite_file = None  # Set to (e.g.) f"{log_dir}/speedtest.db" to also store results in SQLite (see storage.py)
+alerts_file = None  # Set to (e.g.) f"{log_dir}/speedtest-alerts.log" to detect anomalies (see anomaly.py)
+webhook_url = None  # ... and/or to a URL to POST anomalies to
+anomaly_state_file = f"{log_dir}/speedtest-anomaly.json"
+sleep_val = 15  # base of the backoff between retries (seconds)
+max_attempts = 5
+timeout = 60
 
 logger = LoggingRmb(name='speedtest', console_level=logging.INFO).setup()
 os.makedirs(log_dir, exist_ok=True)
+output_writer = AppendWriter(output_file)  # locked, single-write, fsync'ed appends
+sqlite_store = SqliteStore(sqlite_file) if sqlite_file else None
+anomaly_detector = AnomalyDetector(DetectorConfig(state_file=anomaly_state_file, alerts_file=alerts_file,
+                                                  webhook_url=webhook_url)) if alerts_file or webhook_url else None
 
 
-def line_contains_error(line: str) -> bool:
+def append_line(line: str) -> None:
     """
-    Checks an input line specifically for an error object (in JSON format). For example...
-
-        "{'error': 'description'}"
-
-    Looks only for the key name 'error' (i.e., 'error' in the description is not checked for)
-    """
-
-    try:
-        line_json = json.loads(line)
-    except JSONDecodeError:
-        return False
-    return True if 'error' in line_json.keys() else False
-
-
-def add_address_info(line: str) -> str:
-    """
-    Adds address info (in the form of an additional JSON object) to the end of a valid ookla cli output line
+    Tags one line of CLI output with the address info and appends it to the output file (as soon as it is printed)
     """
-    try:
-        line_json = json.loads(line)
-    except JSONDecodeError:
-        logger.warning(f'JSON decode error: {line}')
-        return line
-
-    # Must have all these keys. Otherwise, return the line unchanged.
-    for test in ['timestamp', 'upload', 'download', 'result']:
-        if test not in line_json.keys():
-            logger.warning(f'{test} key not found in: {line}')
-            return line
-
-    line_json['address'] = ADDR_INFO
-    line_updated = json.dumps(line_json)
-    return line_updated
+    line_with_addrinfo = add_address_info(line, ADDR_INFO).strip()
+    output_writer.write(line_with_addrinfo)
+    update_index(output_file)
+    if sqlite_store is not None:
+        sqlite_store.insert_line(line_with_addrinfo)
+    if anomaly_detector is not None:
+        anomaly_detector.update_line(line_with_addrinfo)
+    logger.debug(line_with_addrinfo)
 
 
 def run_speedtest() -> None:
     """
-    Runs Ookla's speedtest CLI one time. If an error is detected the test is run again, up to a maximum number of retries.
-    Output is in JSON and is appended to the output file.
+    Runs Ookla's speedtest CLI one time. If an error is detected the test is run again, up to a maximum number of
+    retries (with exponential backoff between attempts). Output is streamed from the CLI in JSON lines; progress
+    events are logged and results are appended to the output file.
     """
 
-    logger.info("Running speedtest CLI ({speedtest_exe})")
+    logger.info(f"Running speedtest CLI ({speedtest_exe})")
     logger.info(f"Output is appended to: {output_file}")
 
-    max_attempts = 5
-    current_attempt = 0
-
-    while current_attempt < max_attempts:
+    outcome = asyncio.run(run_speedtest_with_retries(
+        [speedtest_exe, "--format=jsonl", "--progress=yes"], max_attempts=max_attempts, timeout=timeout,
+        delays=backoff_delays(base=sleep_val), on_line=append_line,
+        on_progress=lambda event: logger.debug(f"progress: {event}")))
 
-        current_attempt += 1
+    if anomaly_detector is not None:
+        anomaly_detector.save_state()
 
-        if current_attempt > 1:
-            logger.warning(f"This is attempt {current_attempt} of maximum {max_attempts}.")
-            sleep(sleep_val)  # wait this many seconds before performing a retry
-
-        try_again = False  # If certain errors are detected this is set to True to trigger a retry
-
-        proc = None
-        try:
-            t0 = datetime.now()
-            proc = sp.run([speedtest_exe, "--format=json"], timeout=60, check=False, capture_output=True, encoding="utf-8")
-            t1 = datetime.now()
-        except CalledProcessError as ex:
-            logger.warning(ex)
-            try_again = True
-
-        if proc is None:
-            logger.warning("proc is None")
-            try_again = True
-
-        else:
-            if proc.stderr != '':
-                logger.warning("WARNING: non-empty stderr!...")
-                for line in proc.stderr:
-                    logger.warning(line)
-                try_again = True
-
-            if proc.stdout == '':
-                logger.warning("WARNING: no output")
-                try_again = True
-
-            num_lines = 0
-            with open(output_file, "a") as f:
-                for line in proc.stdout.split('\n'):
-                    if line.strip() != '':
-                        line_with_addrinfo = add_address_info(line)
-                        f.write(f"{line_with_addrinfo.strip()}\n")
-                        logger.debug(f"{line_with_addrinfo.strip()}")
-                        num_lines += 1
-                        if line_contains_error(line_with_addrinfo):
-                            try_again = True
-
-            if num_lines == 0:
-                logger.warning("WARNING: Empty output")
-                try_again = True
-
-            if num_lines != 1:
-                logger.warning(f"WARNING: Expected only 1 line of output, found {num_lines}")
-                try_again = True
-
-            if not try_again:
-                break
-
-        elapsed = t1 - t0
-        elapsed_float = elapsed.seconds + elapsed.microseconds * 0.000001
-        logger.info(f"speedtest finished in {elapsed_float:0.3f} seconds")
+    if not outcome.ok:
+        logger.warning(f"WARNING: speedtest failed after {max_attempts} attempts")
 
 
 if __name__ == "__main__":
-    run_speedtest()
+    try:
+        with PidLock(pid_file):
+            run_speedtest()
+    except AlreadyRunning as ex:
+        logger.warning(f"Another instance is still running, exiting ({ex})")
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+storage.py
+
+An optional SQLite storage backend for the speedtest time series, as an alternative to treating the JSON lines file as
+the database. With the data in SQLite, a query such as "the last 7 days, Kitchen only" reads (and validates) only the
+matching rows, via indexes on timestamp and on address/room, instead of scanning and validating the whole file.
+
+The table schema is derived from MainObject (see model.py): nested objects are flattened into columns named by their
+path (e.g. download.latency.iqm -> download_latency_iqm). Computed fields are not stored. The database runs in WAL mode
+so the dashboard can read while a runner writes.
+
+Results are keyed as everywhere else (see dedup.result_key): on result.id, or for results the CLI didn't upload (which
+have an id of '0') on timestamp, address and room. The key is stored in a unique column, so loading the same results
+more than once (e.g. re-importing a log) stores them once.
+
+Command line usage (imports existing JSON lines logs)..
+
+    storage.py -d speedtest.db --import speedtest.log [more.log ...] [--state speedtest.db.ingest]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+from typing import Iterable, List, Optional, Tuple
+from pydantic import BaseModel, ValidationError
+from dedup import IngestCheckpoint, SeenSet, object_key, result_key
+from ingest import expand_sources, log_summary, parse_file_or_report, read_jsonl_files
+from loggingrmb import LoggingRmb
+from model import MainObject
+
+logger = logging.getLogger()
+
+TABLE = 'speedtest'
+
+SQL_TYPES = {float: 'REAL', int: 'INTEGER', bool: 'INTEGER', str: 'TEXT'}
+
+
+def model_columns(model: type, prefix: Tuple[str, ...] = ()) -> List[Tuple[Tuple[str, ...], type]]:
+    """
+    (path, type annotation) for each scalar field of a (nested) pydantic model. Computed fields are not included.
+    """
+    columns = []
+    for name, field in model.model_fields.items():
+        path = prefix + (name,)
+        annotation = field.annotation
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            columns += model_columns(annotation, path)
+        else:
+            columns.append((path, annotation))
+    return columns
+
+
+COLUMNS = model_columns(MainObject)
+COLUMN_NAMES = ['_'.join(path) for path, _ in COLUMNS]
+KEY_COLUMN = 'result_key'  # (not a MainObject field: see dedup.result_key)
+
+
+def flatten(obj: MainObject) -> tuple:
+    """
+    The values of COLUMN_NAMES, then the result's key
+    """
+    dumped = obj.model_dump(mode='json', warnings=False)
+    values = []
+    for path, _ in COLUMNS:
+        value = dumped
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        values.append(value)
+    values.append(object_key(obj))
+    return tuple(values)
+
+
+def unflatten(row: sqlite3.Row) -> dict:
+    nested = {}
+    for (path, annotation), name in zip(COLUMNS, COLUMN_NAMES):
+        value = row[name]
+        if value is None:
+            continue
+        if annotation is bool:
+            value = bool(value)
+        target = nested
+        for key in path[:-1]:
+            target = target.setdefault(key, {})
+        target[path[-1]] = value
+    return nested
+
+
+class SqliteStore:
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.create_schema()
+
+    def create_schema(self) -> None:
+        columns = ', '.join(f'"{name}" {SQL_TYPES.get(annotation, "TEXT")}'
+                            for name, (_, annotation) in zip(COLUMN_NAMES, COLUMNS))
+        with self.connection:
+            self.connection.execute(f'CREATE TABLE IF NOT EXISTS {TABLE} ({columns}, "{KEY_COLUMN}" TEXT)')
+            existing = [row['name'] for row in self.connection.execute(f'PRAGMA table_info({TABLE})')]
+            if KEY_COLUMN not in existing:
+                # (a database from before the key column: key its rows, keeping the first of each result)
+                self.connection.create_function('result_key', 4, result_key, deterministic=True)
+                self.connection.execute(f'ALTER TABLE {TABLE} ADD COLUMN "{KEY_COLUMN}" TEXT')
+                self.connection.execute(f'UPDATE {TABLE} SET "{KEY_COLUMN}" = '
+                                        f'result_key(result_id, timestamp, address_address, address_room)')
+                self.connection.execute(f'DELETE FROM {TABLE} WHERE rowid NOT IN '
+                                        f'(SELECT MIN(rowid) FROM {TABLE} GROUP BY "{KEY_COLUMN}")')
+            self.connection.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {TABLE}_{KEY_COLUMN} '
+                                    f'ON {TABLE} ("{KEY_COLUMN}")')
+            self.connection.execute(f'CREATE INDEX IF NOT EXISTS {TABLE}_timestamp ON {TABLE} (timestamp)')
+            self.connection.execute(f'CREATE INDEX IF NOT EXISTS {TABLE}_address_room_timestamp '
+                                    f'ON {TABLE} (address_address, address_room, timestamp)')
+            self.connection.execute(f'CREATE INDEX IF NOT EXISTS {TABLE}_room_timestamp '
+                                    f'ON {TABLE} (address_room, timestamp)')
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def insert(self, objects: Iterable[MainObject]) -> int:
+        """
+        Stores results (in one transaction). Returns the number of new rows; results already stored are ignored.
+        """
+        placeholders = ', '.join('?' * (len(COLUMN_NAMES) + 1))
+        names = ', '.join(f'"{name}"' for name in COLUMN_NAMES + [KEY_COLUMN])
+        with self.connection:
+            before = self.connection.total_changes
+            self.connection.executemany(f'INSERT OR IGNORE INTO {TABLE} ({names}) VALUES ({placeholders})',
+                                        (flatten(obj) for obj in objects))
+            return self.connection.total_changes - before
+
+    def insert_line(self, line: str) -> bool:
+        """
+        Stores one line of speedtest JSON output, if it is a valid result. Returns True if a new row was stored.
+        """
+        try:
+            obj = MainObject(**json.loads(line))
+        except (json.JSONDecodeError, ValidationError, TypeError) as e:
+            logger.debug(f"Not stored in {self.db_path}: {e}")
+            return False
+        return self.insert([obj]) == 1
+
+    def query(self, start: Optional[str] = None, end: Optional[str] = None,
+              addresses: Optional[List[str]] = None, rooms: Optional[List[str]] = None) -> List[MainObject]:
+        """
+        Results with start <= timestamp < end (YYYY-MM-DDTHH:MM:SSZ, or any prefix of it, e.g. 2024-08-03), optionally
+        only for the given addresses (houses) and/or rooms, in timestamp order
+        """
+        clauses, params = [], []
+        if start is not None:
+            clauses.append('timestamp >= ?')
+            params.append(start)
+        if end is not None:
+            clauses.append('timestamp < ?')
+            params.append(end)
+        if addresses:
+            clauses.append(f"address_address IN ({', '.join('?' * len(addresses))})")
+            params += addresses
+        if rooms:
+            clauses.append(f"address_room IN ({', '.join('?' * len(rooms))})")
+            params += rooms
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self.connection.execute(f'SELECT * FROM {TABLE} {where} ORDER BY timestamp', params)
+        return [MainObject(**unflatten(row)) for row in rows]
+
+    def count(self) -> int:
+        return self.connection.execute(f'SELECT COUNT(*) FROM {TABLE}').fetchone()[0]
+
+
+def import_jsonl_files(store: SqliteStore, sources: List[str], state: Optional[str] = None) -> int:
+    """
+    Imports existing JSON lines logs (files, directories or glob patterns, see ingest.py). Lines which aren't valid
+    results are skipped (and logged, as by read_jsonl_file).
+
+    With a state file prefix, the import is incremental: only lines appended since the last import are parsed (see
+    IngestCheckpoint), and results recently seen are skipped before they reach the database (see SeenSet). Results which
+    SeenSet has probably seen are offered to the database too, whose unique result key (the same as SeenSet's) has the
+    last word.
+    """
+    if state is None:
+        data, _ = read_jsonl_files(sources)
+        added = store.insert(data)
+        logger.info(f"{added} new results stored in {store.db_path}")
+        return added
+
+    checkpoint = IngestCheckpoint(f"{state}.checkpoint.json")
+    added = 0
+    with SeenSet(state) as seen:
+        for file_path in expand_sources(sources):
+            start = checkpoint.start(file_path)
+            if start is None:
+                logger.info(f"{file_path}: unchanged since the last import")
+                continue
+            size = os.path.getsize(file_path)
+            data, summary = parse_file_or_report(file_path, start=start)
+            log_summary(summary, prefix=f"{file_path}: ")
+            if summary.read_error:
+                continue  # (not checkpointed, so it is read again by the next import)
+            keys = [object_key(obj) for obj in data]
+            new, maybe_seen = seen.unseen(keys)
+            added_new = store.insert(data[i] for i in new)
+            added_maybe = store.insert(data[i] for i in maybe_seen)
+            if added_maybe:
+                logger.warning(f"{file_path}: {added_maybe} results were new although the Bloom filter had probably "
+                               f"seen them")
+            added += added_new + added_maybe
+            for i in new + maybe_seen:
+                seen.add(keys[i])
+            checkpoint.update(file_path, summary.end_offset, size)
+            logger.info(f"{file_path}: {len(data)} results from offset {start}, {added_new + added_maybe} new")
+    checkpoint.save()
+    logger.info(f"{added} new results stored in {store.db_path}")
+    return added
+
+
+if __name__ == "__main__":
+
+    LoggingRmb(console_level=logging.INFO).setup()
+
+    parser = argparse.ArgumentParser(description='SQLite storage for speedtest results')
+    parser.add_argument('-d', '--db', required=True, help='SQLite database file (created if necessary)')
+    parser.add_argument('--import', dest='import_files', nargs='+', default=[], metavar='FILE',
+                        help='JSON lines log(s) to import: files, directories or glob patterns (.gz is decompressed)')
+    parser.add_argument('--state', help='Import incrementally, keeping what has been imported in files with this '
+                                        'prefix (e.g. speedtest.db.ingest)')
+    args = parser.parse_args()
+
+    sqlite_store = SqliteStore(args.db)
+    if args.import_files:
+        import_jsonl_files(sqlite_store, args.import_files, state=args.state)
+    logger.info(f"{sqlite_store.count()} results in {args.db}")
+    sqlite_store.close()
@@ -0,0 +1,28 @@
+"""
+Shared fixtures for the speedtest unit tests (run from the speedtest directory: python -m pytest tests/tests_*.py)
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+SPEEDTEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, SPEEDTEST_DIR)
+
+
+@pytest.fixture(scope='session')
+def result_lines():
+    """
+    The result lines of speedtest-example.json (each a complete JSON object, without its newline)
+    """
+    lines = []
+    with open(os.path.join(SPEEDTEST_DIR, 'speedtest-example.json')) as f:
+        for line in f:
+            try:
+                if json.loads(line).get('type') == 'result':
+                    lines.append(line.rstrip('\n'))
+            except json.JSONDecodeError:
+                continue
+    return lines
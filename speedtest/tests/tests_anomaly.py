@@ -0,0 +1,71 @@
+"""
+Unit tests for the anomaly detectors: the streaming detectors, the vectorized backfill, and the state kept between runs
+"""
+
+import json
+
+import pytest
+from anomaly import AnomalyDetector, DetectorConfig, detect_batch
+from samples import Sample, SampleArray
+
+
+@pytest.fixture(scope='module')
+def samples(result_lines):
+    """
+    The first 400 results in timestamp order, with a drop in one room's download speed, and a latency spike
+    """
+    samples = SampleArray()
+    for line in result_lines[:400]:
+        samples.append(Sample.from_json(json.loads(line)))
+    samples = samples.sorted_by_time()
+    for i in range(len(samples) - 40, len(samples), 2):
+        samples.column('download_mbps')[i] *= 0.2
+    samples.column('ping_latency')[len(samples) // 2] *= 20
+    return samples
+
+
+def identity(anomaly: dict) -> tuple:
+    return anomaly['timestamp'], anomaly['address'], anomaly['room'], anomaly['metric'], anomaly['detector']
+
+
+def streamed(detector, samples):
+    return [anomaly.model_dump() for sample in samples for anomaly in detector.update(sample)]
+
+
+class Tests_anomaly:
+
+    def test_detect_batch_01(self, samples):
+        """The streaming and the vectorized detectors flag the same values, with the same baselines and scores"""
+        streaming = streamed(AnomalyDetector(DetectorConfig()), samples)
+        batch_df, _ = detect_batch(samples)
+        batch = batch_df.to_dict('records')
+        for anomaly in batch:
+            anomaly['timestamp'] = anomaly['timestamp'].strftime('%Y-%m-%dT%H:%M:%SZ')
+
+        assert {anomaly['detector'] for anomaly in streaming} == {'mad', 'ewma', 'cusum'}
+        assert {anomaly['metric'] for anomaly in streaming} >= {'download_mbps', 'ping_latency'}
+        assert sorted(map(identity, batch)) == sorted(map(identity, streaming))
+        by_identity = {identity(anomaly): anomaly for anomaly in batch}
+        for anomaly in streaming:
+            assert by_identity[identity(anomaly)]['baseline'] == pytest.approx(anomaly['baseline'])
+            assert by_identity[identity(anomaly)]['score'] == pytest.approx(anomaly['score'])
+
+    def test_state_01(self, tmp_path, samples):
+        """A detector which resumes from a saved state flags what a detector which never stopped does"""
+        config = DetectorConfig(state_file=str(tmp_path / 'anomaly.json'))
+        half = len(samples) // 2
+        expected = streamed(AnomalyDetector(DetectorConfig()), samples)
+
+        detector = AnomalyDetector(config)
+        first = streamed(detector, samples.take(range(half)))
+        detector.save_state()
+        second = streamed(AnomalyDetector(config), samples.take(range(half, len(samples))))
+        assert first + second == expected
+
+        # (the state at the end of a backfill seeds the streaming detectors just as well)
+        _, state = detect_batch(samples.take(range(half)))
+        detector = AnomalyDetector(DetectorConfig())
+        detector.set_state(state)
+        seeded = streamed(detector, samples.take(range(half, len(samples))))
+        assert list(map(identity, seeded)) == list(map(identity, second))
+        assert [anomaly['score'] for anomaly in seeded] == pytest.approx([anomaly['score'] for anomaly in second])
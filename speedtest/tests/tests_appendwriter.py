@@ -0,0 +1,78 @@
+"""
+Unit tests for the crash-safe JSON lines writer and the PID lock
+"""
+
+import json
+import multiprocessing
+import os
+
+import pytest
+from appendwriter import AlreadyRunning, AppendWriter, PidLock
+
+
+def write_records(file_path, writer_id, count):
+    with AppendWriter(file_path, batch_size=7, fsync=False) as writer:
+        for i in range(count):
+            writer.write(json.dumps({'writer': writer_id, 'i': i, 'padding': 'x' * 500}))
+
+
+class Tests_appendwriter:
+
+    def test_write_01(self, tmp_path):
+        """Records are buffered until the batch is full, and written whole on close"""
+        file_path = str(tmp_path / 'out.log')
+        with AppendWriter(file_path, batch_size=3) as writer:
+            writer.write('{"a": 1}')
+            writer.write('  ')
+            writer.write('{"a": 2}')
+            assert not os.path.exists(file_path)
+            writer.write('{"a": 3}\n')
+            writer.write('{"a": 4}')
+            with open(file_path) as f:
+                assert f.read() == '{"a": 1}\n{"a": 2}\n{"a": 3}\n'
+        with open(file_path) as f:
+            assert f.read().splitlines() == ['{"a": 1}', '{"a": 2}', '{"a": 3}', '{"a": 4}']
+        assert writer.records_written == 4
+
+    def test_write_02(self, tmp_path):
+        with pytest.raises(ValueError):
+            AppendWriter(str(tmp_path / 'out.log')).write('{"a":\n1}')
+
+    def test_partial_line_01(self, tmp_path):
+        """A partial line left by a crashed writer is terminated, so it spoils no other record"""
+        file_path = tmp_path / 'out.log'
+        file_path.write_text('{"a": 1}\n{"a": 2, "trunc')
+        with AppendWriter(str(file_path)) as writer:
+            writer.write('{"a": 3}')
+        assert file_path.read_text().splitlines() == ['{"a": 1}', '{"a": 2, "trunc', '{"a": 3}']
+
+        with AppendWriter(str(file_path)) as writer:
+            writer.write('{"a": 4}')
+        assert file_path.read_text().endswith('{"a": 3}\n{"a": 4}\n')
+
+    def test_locking_01(self, tmp_path):
+        """Records of concurrent writers (processes) are never interleaved"""
+        file_path = str(tmp_path / 'out.log')
+        context = multiprocessing.get_context('fork')
+        writers = [context.Process(target=write_records, args=(file_path, writer_id, 200)) for writer_id in range(4)]
+        for process in writers:
+            process.start()
+        for process in writers:
+            process.join()
+            assert process.exitcode == 0
+
+        with open(file_path) as f:
+            records = [json.loads(line) for line in f]
+        assert len(records) == 800
+        for writer_id in range(4):
+            assert [record['i'] for record in records if record['writer'] == writer_id] == list(range(200))
+
+    def test_pid_lock_01(self, tmp_path):
+        file_path = str(tmp_path / 'collector.pid')
+        with PidLock(file_path):
+            with open(file_path) as f:
+                assert f.read() == f"{os.getpid()}\n"
+            with pytest.raises(AlreadyRunning):
+                PidLock(file_path).acquire()
+        with PidLock(file_path):
+            pass
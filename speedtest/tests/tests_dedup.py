@@ -0,0 +1,152 @@
+"""
+Unit tests for the identity of speedtest results: duplicates, the set of results seen, and the ingest checkpoint
+"""
+
+import gzip
+import json
+import os
+import shutil
+
+from dedup import IngestCheckpoint, SeenSet, drop_duplicates, object_key
+from model import MainObject
+from samples import Sample, SampleArray
+from storage import SqliteStore, import_jsonl_files
+
+
+def main_objects(lines):
+    return [MainObject(**json.loads(line)) for line in lines]
+
+
+class Tests_dedup:
+
+    def test_drop_duplicates_01(self, result_lines):
+        """MainObjects and SampleArrays keep the same results, including those without a result id"""
+        objects = main_objects(result_lines[:40])
+        no_id = objects[0].model_copy(update={'result': objects[0].result.model_copy(update={'id': '0'})})
+        other_room = no_id.model_copy(update={'address': no_id.address.model_copy(update={'room': 'Attic'})})
+        objects += [no_id, no_id, other_room] + objects[:5]
+
+        unique = drop_duplicates(objects)
+        assert len(unique) == 42
+        assert len({object_key(obj) for obj in unique}) == 42
+        samples = drop_duplicates(SampleArray.from_main_objects(objects))
+        assert [(sample.timestamp, sample.room) for sample in samples] == \
+            [(Sample.from_main_object(obj).timestamp, obj.address.room) for obj in unique]
+
+    def test_seen_set_01(self, tmp_path):
+        """Keys added are seen, by later sets too"""
+        state = str(tmp_path / 'state')
+        with SeenSet(state) as seen:
+            assert seen.unseen(['a', 'b', 'a']) == ([0, 1], [])
+            seen.add('a')
+            assert 'a' in seen and 'b' not in seen
+        with SeenSet(state) as seen:
+            assert seen.unseen(['a', 'b']) == ([1], [])
+
+    def test_seen_set_02(self, tmp_path):
+        """Keys which have left the recent set are only probably seen; the recent keys file is cut back on close"""
+        state = str(tmp_path / 'state')
+        keys = [f"key-{i}" for i in range(25)]
+        with SeenSet(state, recent_size=5) as seen:
+            for key in keys:
+                seen.add(key)
+            assert seen.unseen(keys[-5:]) == ([], [])
+            assert seen.unseen(keys[:3] + ['new']) == ([3], [0, 1, 2])
+        with open(f"{state}.recent") as f:
+            assert f.read().splitlines() == keys[-5:]
+        with SeenSet(state, recent_size=5) as seen:
+            assert seen.recent_set == set(keys[-5:])
+            assert seen.unseen(keys) == ([], list(range(20)))
+
+    def test_checkpoint_01(self, tmp_path, result_lines):
+        """Ingestion resumes where it left off, also after the log is renamed by rotation"""
+        log = tmp_path / 'speedtest.log'
+        log.write_text('\n'.join(result_lines[:10]) + '\n')
+        size = os.path.getsize(log)
+        checkpoint = IngestCheckpoint(str(tmp_path / 'checkpoint.json'))
+        assert checkpoint.start(str(log)) == 0
+        checkpoint.update(str(log), size, size)
+        checkpoint.save()
+
+        checkpoint = IngestCheckpoint(str(tmp_path / 'checkpoint.json'))
+        assert checkpoint.start(str(log)) == size
+        rotated = tmp_path / 'speedtest.log.1'
+        os.rename(log, rotated)
+        with open(rotated, 'a') as f:
+            f.write(result_lines[10] + '\n')
+        assert checkpoint.start(str(rotated)) == size
+
+        with open(rotated, 'w') as f:
+            f.write(result_lines[11] + '\n')
+        assert checkpoint.start(str(rotated)) == 0  # (truncated)
+
+    def test_checkpoint_02(self, tmp_path, result_lines):
+        """A file with the inode of a file read before, but other contents, is read from the start"""
+        log = tmp_path / 'speedtest.log'
+        log.write_text('\n'.join(result_lines[:10]) + '\n')
+        checkpoint = IngestCheckpoint(str(tmp_path / 'checkpoint.json'))
+        checkpoint.update(str(log), 100, 100)
+        with open(log, 'r+') as f:  # (same inode, same size, other first lines)
+            f.write('\n'.join(result_lines[20:30]) + '\n')
+        assert checkpoint.start(str(log)) == 0
+
+    def test_checkpoint_03(self, tmp_path, result_lines):
+        """Compressed rotations are read whole, once"""
+        log = tmp_path / 'speedtest.log'
+        log.write_text('\n'.join(result_lines[:10]) + '\n')
+        compressed = str(tmp_path / 'speedtest.log.2.gz')
+        with open(log, 'rb') as f, gzip.open(compressed, 'wb') as gz:
+            shutil.copyfileobj(f, gz)
+        checkpoint = IngestCheckpoint(str(tmp_path / 'checkpoint.json'))
+        assert checkpoint.start(compressed) == 0
+        checkpoint.update(compressed, 1234, os.path.getsize(compressed))
+        assert checkpoint.start(compressed) is None
+
+    def test_import_jsonl_files_01(self, tmp_path, result_lines):
+        """Results the Bloom filter has probably seen are still offered to the store, which has the last word"""
+        log = tmp_path / 'speedtest.log'
+        log.write_text('\n'.join(result_lines[:30]) + '\n')
+        state = str(tmp_path / 'ingest')
+        with SeenSet(state, recent_size=1) as seen:  # (a false positive: in the filter, never stored)
+            seen.bloom.add(object_key(main_objects(result_lines[:1])[0]))
+        store = SqliteStore(str(tmp_path / 'speedtest.db'))
+        assert import_jsonl_files(store, [str(log)], state=state) == 30
+        assert store.count() == 30
+
+        copy = tmp_path / 'copy.log'
+        shutil.copy(log, copy)
+        assert import_jsonl_files(store, [str(log), str(copy)], state=state) == 0
+        assert store.count() == 30
+        store.close()
+
+    def test_seen_set_03(self, tmp_path, caplog):
+        """Closing a set reports a Bloom filter past its capacity"""
+        state = str(tmp_path / 'state')
+        with SeenSet(state, capacity=100, error_rate=0.01) as seen:
+            seen.add('a')
+            assert 0 < seen.bloom.fill() < 0.1
+        assert 'past its capacity' not in caplog.text
+        with SeenSet(state, capacity=100, error_rate=0.01) as seen:
+            for i in range(1000):
+                seen.add(f"key-{i}")
+            assert seen.bloom.fill() > 0.5
+        assert 'past its capacity' in caplog.text
+        with SeenSet(state, capacity=100, error_rate=0.01) as seen:
+            assert 'key-999' in seen
+
+    def test_import_jsonl_files_02(self, tmp_path, result_lines):
+        """A compressed log which can't be read to its end is read again by the next import"""
+        log = tmp_path / 'speedtest.log.2.gz'
+        with gzip.open(log, 'wt') as f:
+            f.write('\n'.join(result_lines[:30]) + '\n')
+        compressed = log.read_bytes()
+        log.write_bytes(compressed[:len(compressed) // 2])
+        state = str(tmp_path / 'ingest')
+        store = SqliteStore(str(tmp_path / 'speedtest.db'))
+        assert import_jsonl_files(store, [str(log)], state=state) == 0
+        assert IngestCheckpoint(f"{state}.checkpoint.json").start(str(log)) == 0
+
+        log.write_bytes(compressed)
+        assert import_jsonl_files(store, [str(log)], state=state) == 30
+        assert import_jsonl_files(store, [str(log)], state=state) == 0
+        store.close()
@@ -0,0 +1,51 @@
+"""
+Unit tests for reading (rotated) speedtest logs in a process pool
+"""
+
+import gzip
+import json
+
+import pytest
+from ingest import read_jsonl_files
+from samples import SampleArray
+
+
+@pytest.fixture
+def rotated_logs(tmp_path, result_lines):
+    """
+    A rotated log in three files (newest first, as logrotate names them) which overlap by 10 results, with a line which
+    isn't JSON, one which isn't a valid result, and one missing file
+    """
+    (tmp_path / 'speedtest.log').write_text('\n'.join(result_lines[90:120]) + '\nnot JSON\n')
+    (tmp_path / 'speedtest.log.1').write_text('\n'.join(result_lines[40:100]) + '\n{"type": "result"}\n')
+    with gzip.open(tmp_path / 'speedtest.log.2.gz', 'wt') as f:
+        f.write('\n'.join(result_lines[:50]) + '\n')
+    return [str(tmp_path / 'speedtest.log*'), str(tmp_path / 'missing.log')]
+
+
+class Tests_ingest:
+
+    @pytest.mark.parametrize("compact", [False, True])
+    def test_read_jsonl_files_01(self, rotated_logs, result_lines, compact):
+        """Results from every worker are merged in timestamp order, each once; bad lines and files are reported"""
+        data, summaries = read_jsonl_files(rotated_logs, workers=4, compact=compact)
+        expected = sorted(json.loads(line)['timestamp'] for line in result_lines[:120])
+        if compact:
+            assert isinstance(data, SampleArray)
+            assert data.column('timestamp').tolist() == sorted(data.column('timestamp').tolist())
+            assert len(data) == 120
+        else:
+            assert [obj.timestamp for obj in data] == expected
+
+        by_file = {summary.file_path.rsplit('/', 1)[-1]: summary for summary in summaries}
+        assert list(by_file) == ['speedtest.log', 'speedtest.log.1', 'speedtest.log.2.gz', 'missing.log']
+        assert (by_file['speedtest.log'].lines_processed, by_file['speedtest.log'].json_errors) == (30, 1)
+        assert (by_file['speedtest.log.1'].lines_processed, by_file['speedtest.log.1'].validation_errors) == (60, 1)
+        assert by_file['speedtest.log.2.gz'].lines_processed == 50
+        assert by_file['missing.log'].read_error and by_file['missing.log'].other_errors == 1
+
+    def test_read_jsonl_files_02(self, rotated_logs):
+        """One worker gives the same results as several"""
+        serial, _ = read_jsonl_files(rotated_logs, workers=1)
+        parallel, _ = read_jsonl_files(rotated_logs, workers=3)
+        assert serial == parallel
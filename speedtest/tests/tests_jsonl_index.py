@@ -0,0 +1,112 @@
+"""
+Unit tests for the offset index of a speedtest JSON lines log
+"""
+
+import json
+import os
+
+import pytest
+from dedup import head_hash
+from jsonl_index import HEADER, MAGIC, JsonlIndex, to_epoch
+
+
+def header(index):
+    with open(index.index_path, 'rb') as f:
+        return index.read_header(f)
+
+
+class Tests_jsonl_index:
+
+    def test_update_01(self, tmp_path, result_lines):
+        """
+        The header records the log's device and inode, the bytes covered, the record count, whether they are in order,
+        and the hash of the log's first bytes
+        """
+        log = tmp_path / 'speedtest.log'
+        log.write_text('\n'.join(result_lines[:10]) + '\n{"type": "log", "message": "not a result"}\n')
+        index = JsonlIndex(str(log))
+        assert index.update() == 10
+        stat = os.stat(log)
+        assert header(index) == (MAGIC, stat.st_dev, stat.st_ino, stat.st_size, 10, 1,
+                                 bytes.fromhex(head_hash(str(log), stat.st_size)))
+        assert os.path.getsize(index.index_path) == HEADER.size + 10 * index.records().itemsize
+        records = index.records()
+        assert records['timestamp'][0] == to_epoch(json.loads(result_lines[0])['timestamp'])
+        assert records['offset'][1] == records['length'][0]
+
+    def test_update_02(self, tmp_path, result_lines):
+        """Only appended lines are indexed; a partial line waits for its newline"""
+        log = tmp_path / 'speedtest.log'
+        log.write_text('\n'.join(result_lines[:5]) + '\n')
+        index = JsonlIndex(str(log))
+        assert index.update() == 5
+        assert index.update() == 0
+
+        with open(log, 'a') as f:
+            f.write(result_lines[5] + '\n' + result_lines[6][:40])
+        assert index.update() == 1
+        assert header(index)[3:5] == (os.path.getsize(log) - 40, 6)
+
+        with open(log, 'a') as f:
+            f.write(result_lines[6][40:] + '\n')
+        assert index.update() == 1
+        assert header(index)[3:5] == (os.path.getsize(log), 7)
+        assert index.records()['offset'].tolist()[-1] == os.path.getsize(log) - len(result_lines[6]) - 1
+
+    def test_update_03(self, tmp_path, result_lines):
+        """A replaced (rotated) or truncated log is indexed afresh"""
+        log = tmp_path / 'speedtest.log'
+        log.write_text('\n'.join(result_lines[:8]) + '\n')
+        index = JsonlIndex(str(log))
+        index.update()
+
+        log.write_text('\n'.join(result_lines[8:11]) + '\n')
+        assert index.update() == 3
+        assert header(index)[4] == 3
+
+        replacement = tmp_path / 'replacement.log'
+        replacement.write_text('\n'.join(result_lines[20:22]) + '\n')
+        os.replace(replacement, log)
+        assert index.update() == 2
+        assert header(index)[2] == os.stat(log).st_ino
+
+    def test_update_04(self, tmp_path, result_lines):
+        """Lines out of timestamp order are noted in the header, and ranges are still found"""
+        log = tmp_path / 'speedtest.log'
+        log.write_text('\n'.join([result_lines[1], result_lines[0], result_lines[2]]) + '\n')
+        index = JsonlIndex(str(log))
+        index.update()
+        assert header(index)[5] == 0
+        start = json.loads(result_lines[1])['timestamp']
+        assert len(index.lookup(start=start)) == 2
+
+    def test_update_05(self, tmp_path, result_lines):
+        """A log truncated in place (copy-truncate rotation) and grown back past the bytes covered is indexed afresh"""
+        log = tmp_path / 'speedtest.log'
+        log.write_text('\n'.join(result_lines[:5]) + '\n')
+        index = JsonlIndex(str(log))
+        index.update()
+
+        with open(log, 'r+') as f:  # (same inode, grown past the bytes covered)
+            f.truncate(0)
+            f.write('\n'.join(result_lines[10:20]) + '\n')
+        assert index.update() == 10
+        assert header(index)[4] == 10
+        timestamps = [json.loads(line)['timestamp'] for line in result_lines[10:20]]
+        assert [result.timestamp for result in index.read()] == timestamps
+
+    def test_read_01(self, tmp_path, result_lines):
+        log = tmp_path / 'speedtest.log'
+        log.write_text('\n'.join(result_lines[:50]) + '\n')
+        timestamps = sorted(json.loads(line)['timestamp'] for line in result_lines[:50])
+        index = JsonlIndex(str(log))
+        results = index.read(start=timestamps[10], end=timestamps[20])
+        assert [result.timestamp for result in results] == timestamps[10:20]
+        samples = index.read(start=timestamps[10], end=timestamps[20], compact=True)
+        assert len(samples) == 10
+        room = results[0].address.room
+        assert all(sample.room == room for sample in index.read(rooms=[room], compact=True))
+
+    def test_compressed_01(self, tmp_path):
+        with pytest.raises(ValueError):
+            JsonlIndex(str(tmp_path / 'speedtest.log.1.gz'))
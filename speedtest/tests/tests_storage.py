@@ -0,0 +1,76 @@
+"""
+Unit tests for the SQLite storage backend
+"""
+
+import json
+
+import pytest
+from model import MainObject
+from storage import COLUMN_NAMES, SqliteStore, flatten, import_jsonl_files, unflatten
+
+
+@pytest.fixture
+def objects(result_lines):
+    return [MainObject(**json.loads(line)) for line in result_lines[:100]]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SqliteStore(str(tmp_path / 'speedtest.db'))
+    yield store
+    store.close()
+
+
+class Tests_storage:
+
+    def test_flatten_01(self, objects):
+        """A result flattened into columns and back is unchanged"""
+        for obj in objects[:10]:
+            row = dict(zip(COLUMN_NAMES, flatten(obj)))
+            assert 'download_latency_iqm' in row
+            assert MainObject(**unflatten(row)) == obj
+
+    def test_insert_01(self, store, objects):
+        """Results are stored once, however many times they are inserted"""
+        assert store.insert(objects) == 100
+        assert store.insert(objects[:50]) == 0
+        assert store.count() == 100
+        assert store.query() == sorted(objects, key=lambda obj: obj.timestamp)
+
+    def test_insert_02(self, store, objects, result_lines):
+        """Results without a result id are identified by timestamp, address and room"""
+        no_id = objects[0].model_copy(update={'result': objects[0].result.model_copy(update={'id': '0'})})
+        other_room = no_id.model_copy(update={'address': no_id.address.model_copy(update={'room': 'Attic'})})
+        assert store.insert([no_id, no_id, other_room]) == 2
+        assert store.insert_line(result_lines[1])
+        assert not store.insert_line(result_lines[1])
+        assert not store.insert_line('{"type": "log"}')
+        assert store.count() == 3
+
+    def test_query_01(self, store, objects):
+        """Queries select by time (start inclusive, end exclusive, or any prefix of a timestamp), address and room"""
+        elsewhere = [obj.model_copy(update={'address': obj.address.model_copy(update={'address': 'Elsewhere'}),
+                                            'timestamp': obj.timestamp.replace('2024', '2023'),
+                                            'result': obj.result.model_copy(update={'id': '0'})})
+                     for obj in objects[:10]]
+        store.insert(objects + elsewhere)
+
+        day = [obj for obj in objects if obj.timestamp.startswith('2024-08-04')]
+        assert [obj.timestamp for obj in store.query(start='2024-08-04', end='2024-08-05')] == \
+            sorted(obj.timestamp for obj in day)
+        assert len(store.query(start=objects[1].timestamp, end=objects[2].timestamp)) == 1
+        assert len(store.query(end='2024')) == 10
+        assert {obj.address.address for obj in store.query(addresses=['Elsewhere'])} == {'Elsewhere'}
+        assert len(store.query(addresses=['Village Rd', 'Elsewhere'])) == 110
+
+        family = store.query(addresses=['Village Rd'], rooms=['Family Room'])
+        assert len(family) == sum(obj.address.room == 'Family Room' for obj in objects)
+        assert all(obj.address.room == 'Family Room' for obj in family)
+
+    def test_import_jsonl_files_01(self, store, tmp_path, result_lines):
+        """Re-importing a log stores nothing new; invalid lines are skipped"""
+        log = tmp_path / 'speedtest.log'
+        log.write_text('\n'.join(result_lines[:20]) + '\n{"type": "result", "timestamp": "2024"}\nnot JSON\n')
+        assert import_jsonl_files(store, [str(log)]) == 20
+        assert import_jsonl_files(store, [str(log)]) == 0
+        assert store.count() == 20
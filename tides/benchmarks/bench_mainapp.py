@@ -0,0 +1,65 @@
+"""
+bench_mainapp.py
+
+pytest-benchmark end-to-end benchmark of TidesApp.mainapp, offline: BENCH_LOCATIONS synthetic locations are
+retrieved from a local ReplayServer (see tests/replay.py), which answers each request after SERVER_DELAY
+seconds, as a distant site would. One location in SCRIPTED_EVERY is a page whose table isn't in its HTML, so
+the run also exercises the fallback to the (fake) browsers.
+
+Every round starts with an empty tide cache, so every location is retrieved. The throughput (locations per
+second) is reported in the benchmark's extra_info. The per-host rate limit is lifted (RATE_PER_HOST = None), so the
+benchmark measures tidesapp itself; with the limit, a run takes BENCH_LOCATIONS / RATE_PER_HOST seconds.
+
+Command line usage (from the tides directory; the file is named so that a plain pytest run doesn't collect it)..
+
+    python -m pytest -c setup.cfg benchmarks/bench_mainapp.py [--benchmark-autosave]
+"""
+
+import json
+import sys
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from replay import ReplayServer, replay_tidesapp  # noqa: E402
+from tidesapp import TidesApp  # noqa: E402
+
+BENCH_LOCATIONS = 300
+SCRIPTED_EVERY = 10
+SERVER_DELAY = 0.02
+
+
+def synthetic_locations(count):
+    return [{'URL': f"{TidesApp.BASE_URL}/United-States/Massachusetts/Synthetic-County/"
+                    + ('Scripted' if i % SCRIPTED_EVERY == 0 else 'Beach') + f"-{i}/"}
+            for i in range(count)]
+
+
+def test_mainapp_throughput(benchmark, monkeypatch, tmp_path):
+    """
+    Retrieve BENCH_LOCATIONS locations with mainapp (HTTP first, browsers for the scripted pages)
+    """
+
+    # (a location path ending in /Scripted-<n>/ is served as /Scripted/ is; see tests/replay.py)
+    locations = synthetic_locations(BENCH_LOCATIONS)
+    file = tmp_path / 'locations.json'
+    file.write_text(json.dumps({'URLs': locations}))
+    monkeypatch.setattr(sys, 'argv', [sys.argv[0], '-f', str(file)])
+    monkeypatch.setattr(TidesApp, 'RATE_PER_HOST', None)
+    rounds = iter(range(1000))
+
+    with ReplayServer(delay=SERVER_DELAY) as server:
+        profile = replay_tidesapp(server, monkeypatch)
+
+        def setup():
+            monkeypatch.setattr(TidesApp, 'CACHE_FILE', str(tmp_path / f"tides-{next(rounds)}.sqlite"))
+            return (TidesApp(profile),), {}
+
+        app = benchmark.pedantic(lambda app: app.mainapp() or app, setup=setup, rounds=3)
+
+    assert len(app.weekly_tides) == BENCH_LOCATIONS
+    assert app.errors == {}
+    if benchmark.stats:  # (None under --benchmark-disable)
+        benchmark.extra_info['locations'] = BENCH_LOCATIONS
+        benchmark.extra_info['locations_per_second'] = BENCH_LOCATIONS / benchmark.stats.stats.mean
@@ -0,0 +1,100 @@
+"""
+bench_parser.py
+
+pytest-benchmark micro-benchmark of the tide table parser: tide_parser.parse_week (a whole table in one call)
+against the row-at-a-time parser it replaced (legacy_parse_high_tide_data, below: the regex compiled on every
+call, and strptime and date.today() for every tide).
+
+Each benchmark parses BENCH_WEEKS weekly tables (7 rows each) from the saved fixture page.
+
+Command line usage (from the tides directory; the file is named so that a plain pytest run doesn't collect it)..
+
+    python -m pytest -c setup.cfg benchmarks/bench_parser.py [--benchmark-autosave]
+"""
+
+import os
+import re
+
+import lxml.html
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from datetime_utils import day2datetime, timestr2time, date_time_combine  # noqa: E402
+from tidesapp import TidesApp  # noqa: E402
+from http_fetch import row_text  # noqa: E402
+from tide_parser import high_tide_times, parse_week  # noqa: E402
+
+BENCH_WEEKS = 100
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'fixtures', 'weekly_tides.html')
+
+
+def legacy_parse_high_tide_data(data):
+    """
+    TidesApp.parse_high_tide_data, as it was before tide_parser.py
+    """
+
+    pattern = re.compile(
+     r"^\s*" +
+     r"(?P<day>Mon|Tue|Wed|Thu|Fri|Sat|Sun)\s+" +
+     r"(?P<dayno>\d+)\s+" +
+     r"(?P<tide1_time>\d+:\d\d\s*(?:am|pm))\s+(?P<tide1_hilo>(?:▲|▼))\s+(?P<tide1_height>\d+(?:\.\d+|))\s*ft\s+" +
+     r"(?P<tide2_time>\d+:\d\d\s*(?:am|pm))\s+(?P<tide2_hilo>(?:▲|▼))\s+(?P<tide2_height>\d+(?:\.\d+|))\s*ft\s+" +
+     r"(?P<tide3_time>\d+:\d\d\s*(?:am|pm))\s+(?P<tide3_hilo>(?:▲|▼))\s+(?P<tide3_height>\d+(?:\.\d+|))\s*ft\s+" +
+     r"(?:(?P<tide4_time>\d+:\d\d\s*(?:am|pm))\s+(?P<tide4_hilo>(?:▲|▼))\s+(?P<tide4_height>\d+(?:\.\d+|))\s*ft\s+|)" +
+     r"▲\s*(?P<sunrise>\d+:\d\d\s*(?:am|pm))\s+" +
+     r"▼\s*(?P<sunset>\d+:\d\d\s*(?:am|pm))\s*$"
+    )
+
+    data = re.sub('\n', ' ', data)
+    matched = re.match(pattern, data)
+    if not matched:
+        raise ValueError
+
+    this_day = day2datetime(matched.group('dayno'))
+    this_day_high_tides = []
+    for timestr, hilo in [
+        (matched.group('tide1_time'), matched.group('tide1_hilo')),
+        (matched.group('tide2_time'), matched.group('tide2_hilo')),
+        (matched.group('tide3_time'), matched.group('tide3_hilo')),
+        (matched.group('tide4_time'), matched.group('tide4_hilo'))
+    ]:
+        if hilo == '▲':
+            this_day_high_tides.append(date_time_combine(this_day, timestr2time(timestr)))
+
+    if len(this_day_high_tides) < 1 or len(this_day_high_tides) > 2:
+        raise ValueError
+    return this_day_high_tides
+
+
+@pytest.fixture(scope='session')
+def weeks():
+    page = lxml.html.parse(FIXTURE).getroot()
+    rows = [row_text(row) for row in page.xpath(TidesApp.WEEKLY_TABLE_XPATH)]
+    return [rows] * BENCH_WEEKS
+
+
+def legacy_parse(weeks):
+    return [[tide for row in rows for tide in legacy_parse_high_tide_data(row)] for rows in weeks]
+
+
+def parse(weeks):
+    return [[tide for day_tides in parse_week(rows) for tide in high_tide_times(day_tides)] for rows in weeks]
+
+
+def test_parsers_agree(weeks):
+    assert parse(weeks[:1]) == legacy_parse(weeks[:1])
+
+
+def test_legacy_parse_high_tide_data(benchmark, weeks):
+    benchmark(legacy_parse, weeks)
+
+
+def test_parse_week(benchmark, weeks):
+    benchmark(parse, weeks)
+
+
+def test_parse_week_all_fields(benchmark, weeks):
+    """The full records (high and low tides, heights, sunrise and sunset)"""
+    benchmark(lambda: [parse_week(rows) for rows in weeks])
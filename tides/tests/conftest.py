@@ -0,0 +1,51 @@
+#!/bin/env python3
+"""
+pytest fixtures for running tidesapp against saved tideschart.com pages, served locally
+
+tides_server is a ReplayServer (see replay.py) serving the saved pages in fixtures/. fake_drivers is
+a factory of FakeDrivers (for DriverPool) which browse tides_server in place of www.tideschart.com.
+
+replay_server also serves the pages recorded to fixtures/recorded/, if any, and replay_profile points
+a whole TidesApp run (mainapp included) at it, with a fresh tide cache.
+"""
+
+import pytest
+from replay import RECORDED, FakeDriver, ReplayServer, replay_tidesapp
+
+
+@pytest.fixture
+def tides_server():
+    with ReplayServer() as server:
+        yield server
+
+
+@pytest.fixture
+def replay_server():
+    with ReplayServer(RECORDED) as server:
+        yield server
+
+
+@pytest.fixture
+def fake_drivers(tides_server):
+    """
+    A factory of FakeDrivers (for DriverPool), which keeps a list of the drivers it created
+    """
+
+    drivers = []
+
+    def factory():
+        driver = FakeDriver(tides_server.url)
+        drivers.append(driver)
+        return driver
+
+    factory.drivers = drivers
+    return factory
+
+
+@pytest.fixture
+def replay_profile(replay_server, monkeypatch, tmp_path):
+    """
+    The BrowserProfile for a TidesApp which runs offline, against replay_server (see replay_tidesapp)
+    """
+
+    return replay_tidesapp(replay_server, monkeypatch, str(tmp_path / 'tides.sqlite'))
@@ -0,0 +1,404 @@
+#!/bin/env python3
+"""
+Record tideschart.com pages to fixture files, and replay them from a local HTTP server, so that
+tidesapp can be tested and benchmarked offline and deterministically.
+
+Recording..
+
+    python replay.py -f file [-d directory]
+
+visits every location in file (a tidesapp input file, see tidesapp.py) and saves the pages
+tidesapp reads: the weekly tide page of each URL (fetched over HTTP), and the search results of
+each MUNI (searched for in a browser, with the default BrowserProfile). A search which the site
+throttles is saved as the throttle page. Pages are saved under directory (fixtures/recorded, by
+default), one file per URL path (and query).
+
+Replaying..
+
+ReplayServer is an HTTP/1.1 server (on localhost) which serves a recorded page for any path that
+was recorded, the saved weekly tide page (fixtures/weekly_tides.html) for any other location path,
+and a 404 page (without a tide table) for paths ending in /Nowhere/ (or /Nowhere-anything/). /search serves a page of search
+results (fixtures/search_results.html), except that the first server.throttle searches are answered
+with the site's "too many search requests" page (fixtures/too_many_searches.html). Paths ending in
+/Scripted/ (or /Scripted-anything/) serve the table only to the (fake) browser, and a page without it to any other client,
+as a page whose table is rendered by JavaScript would. Responses are gzip-compressed for clients
+which accept it, and carry an ETag and Last-Modified header (server.etag, server.last_modified); a
+request which presents the current ETag is answered 304 Not Modified. The server records the
+requests, the connections, the 304 responses and the greatest number of requests in progress at once.
+
+FakeDriver stands in for a selenium WebDriver: it fetches pages from a ReplayServer (in place of
+www.tideschart.com) and evaluates XPATHs with lxml. Its elements can be typed into and clicked:
+clicking a link follows it, and clicking the search form's button loads /search.
+
+replay_tidesapp points a whole TidesApp run (mainapp included) at a ReplayServer: the HTTP fetcher's
+requests to www.tideschart.com are redirected to the server, and the browsers are FakeDrivers.
+"""
+
+import argparse
+import gzip
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import lxml.html
+import selenium.common.exceptions
+from requests.adapters import HTTPAdapter
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.wait import WebDriverWait
+import tidesapp
+from browser_profile import BrowserProfile
+from http_fetch import HttpFetcher
+from tidesapp import TidesApp
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+RECORDED = os.path.join(FIXTURES, 'recorded')
+
+NOT_FOUND_PAGE = b'<html><body><h1>Page not found</h1></body></html>'
+SCRIPTED_PAGE = b'<html><body><div id="tides">Loading..</div><script src="/tides.js"></script></body></html>'
+
+# (the User-Agent of urllib, which FakeDriver uses to load pages)
+BROWSER_AGENT = 'Python-urllib'
+
+
+def page_file(directory: str, path: str) -> str:
+    """
+    The file a page is recorded to: one file per URL path (and query)
+
+    Args..
+    directory (str) The directory of recorded pages
+    path (str) The page's URL path, with its query if any (e.g., '/search?q=Salisbury')
+
+    Returns..
+    file (str) The file's path
+    """
+
+    return os.path.join(directory, urllib.parse.quote(path.rstrip('/') or '/', safe='') + '.html')
+
+
+class Recorder:
+    """
+    Saves the tideschart.com pages which tidesapp reads to a directory of recorded pages
+    """
+
+    def __init__(self, directory: str = RECORDED, profile: BrowserProfile = None):
+        self.directory = directory
+        self.profile = profile or BrowserProfile()
+        self.driver = None
+        os.makedirs(directory, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def save(self, URL: str, body: bytes) -> str:
+        parts = urllib.parse.urlsplit(URL)
+        file = page_file(self.directory, parts.path + (f"?{parts.query}" if parts.query else ''))
+        with open(file, 'wb') as fh:
+            fh.write(body)
+        return file
+
+    def record_url(self, URL: str, fetcher: HttpFetcher) -> str:
+        """
+        Save a location's weekly tide page (fetched over HTTP). Returns the file's path.
+        """
+
+        return self.save(URL, fetcher.get(URL).content)
+
+    def record_search(self, municipality: dict) -> str:
+        """
+        Search for a location in a browser and save the results page, or the throttle page if the
+        site refused the search (as fixtures/too_many_searches.html). Returns the file's path.
+        """
+
+        if self.driver is None:
+            self.driver = self.profile.new_session()
+        longwait = WebDriverWait(self.driver, self.profile.long_wait)
+        self.driver.get(TidesApp.BASE_URL)
+        longwait.until(EC.presence_of_element_located((By.XPATH, TidesApp.SEARCHBOX_FORM_XPATH))) \
+            .send_keys(municipality['MUNI'])
+        longwait.until(EC.presence_of_element_located((By.XPATH, TidesApp.SEARCHBOX_CLICK_XPATH))).click()
+        longwait.until(EC.presence_of_element_located((By.XPATH, '//div[@class="search-item"] | '
+                                                                  + TidesApp.TOO_MANY_SEARCHES_XPATH)))
+        body = self.driver.page_source.encode()
+        if self.driver.find_elements(By.XPATH, TidesApp.TOO_MANY_SEARCHES_XPATH):
+            file = os.path.join(self.directory, 'too_many_searches.html')
+            with open(file, 'wb') as fh:
+                fh.write(body)
+            return file
+        return self.save(self.driver.current_url, body)
+
+    def record_locations(self, file: str) -> list:
+        """
+        Save the pages of every location in a tidesapp input file. Returns the files' paths.
+        """
+
+        app = TidesApp()
+        app.load_user_locations(file)
+        files = []
+        with HttpFetcher() as fetcher:
+            for location in app.locations:
+                if 'URL' in location:
+                    files.append(self.record_url(location['URL'], fetcher))
+                else:
+                    files.append(self.record_search(location))
+        return files
+
+    def close(self):
+        if self.driver is not None:
+            self.driver.quit()
+            self.driver = None
+
+
+class TidesHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.in_progress += 1
+            server.max_in_progress = max(server.max_in_progress, server.in_progress)
+            server.requests.append(self.path)
+        try:
+            time.sleep(server.delay)
+            path = self.path.rstrip('/')
+            name = path.rsplit('/', 1)[-1]
+            recorded = page_file(server.recorded, self.path) if server.recorded else None
+            if name.split('-')[0] == 'Nowhere':
+                status, body = 404, NOT_FOUND_PAGE
+            elif path.startswith('/search'):
+                with server.lock:
+                    throttled = server.throttled < server.throttle
+                    if throttled:
+                        server.throttled += 1
+                status, body = 200, server.too_many_page if throttled else server.search_page
+                if not throttled and recorded and os.path.isfile(recorded):
+                    with open(recorded, 'rb') as fh:
+                        body = fh.read()
+            elif name.split('-')[0] == 'Scripted' and not self.headers.get('User-Agent', '').startswith(BROWSER_AGENT):
+                status, body = 200, SCRIPTED_PAGE
+            elif self.headers.get('If-None-Match') == server.etag:
+                with server.lock:
+                    server.not_modified += 1
+                self.send_response(304)
+                self.send_header('ETag', server.etag)
+                self.end_headers()
+                return
+            elif recorded and os.path.isfile(recorded):
+                with open(recorded, 'rb') as fh:
+                    status, body = 200, fh.read()
+            else:
+                status, body = 200, server.weekly_page
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            if status == 200:
+                self.send_header('ETag', server.etag)
+                self.send_header('Last-Modified', server.last_modified)
+            if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                body = gzip.compress(body)
+                self.send_header('Content-Encoding', 'gzip')
+                with server.lock:
+                    server.gzipped += 1
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.in_progress -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """
+    Serves recorded (or saved) tideschart.com pages on localhost, from a thread of its own
+
+    Usage..
+
+        with ReplayServer() as server:
+            ... server.url ...
+    """
+
+    daemon_threads = True
+
+    def __init__(self, recorded: str = None, delay: float = 0.05):
+        super().__init__(('127.0.0.1', 0), TidesHandler)
+        self.recorded = recorded
+        self.lock = threading.Lock()
+        self.in_progress = self.max_in_progress = 0
+        self.connections = self.gzipped = self.not_modified = 0
+        self.etag = '"tides-1"'
+        self.last_modified = 'Mon, 22 Aug 2022 04:00:00 GMT'
+        self.requests = []
+        self.delay = delay
+        self.throttle = self.throttled = 0
+        with open(os.path.join(FIXTURES, 'weekly_tides.html'), 'rb') as fh:
+            self.weekly_page = fh.read()
+        with open(os.path.join(FIXTURES, 'search_results.html'), 'rb') as fh:
+            self.search_page = fh.read()
+        with open(os.path.join(FIXTURES, 'too_many_searches.html'), 'rb') as fh:
+            self.too_many_page = fh.read()
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeElement:
+
+    def __init__(self, element, driver):
+        self.element = element
+        self.driver = driver
+
+    @property
+    def text(self):
+        # (like a browser, separate the text of adjacent cells)
+        return ' '.join(text.strip() for text in self.element.itertext() if text.strip())
+
+    def is_displayed(self):
+        return True
+
+    def is_enabled(self):
+        return True
+
+    def get_attribute(self, name):
+        value = self.element.get(name)
+        if name == 'href' and value is not None:
+            value = urllib.parse.urljoin(self.driver.current_url, value)
+        return value
+
+    def send_keys(self, text):
+        self.driver.typed += text
+
+    def click(self):
+        if self.element.tag == 'a':
+            self.driver.get(self.get_attribute('href'))
+        elif self.element.tag == 'button':
+            query = urllib.parse.urlencode({'q': self.driver.typed})
+            self.driver.typed = ''
+            self.driver.get(f"{TidesApp.BASE_URL}/search?{query}")
+
+
+class FakeDriver:
+
+    def __init__(self, server_url):
+        self.server_url = server_url
+        self.page = None
+        self.current_url = None
+        self.typed = ''
+        self.searches = 0
+        self.closed = False
+
+    def get(self, url):
+        self.current_url = url
+        if '/search?' in url:
+            self.searches += 1
+        url = url.replace(TidesApp.BASE_URL, self.server_url, 1)
+        try:
+            with urllib.request.urlopen(url) as response:
+                body = response.read()
+        except urllib.error.HTTPError as error:
+            body = error.read()
+        self.page = lxml.html.fromstring(body)
+
+    @property
+    def page_source(self):
+        return lxml.html.tostring(self.page, encoding='unicode')
+
+    def find_elements(self, by, xpath):
+        return [FakeElement(element, self) for element in self.page.xpath(xpath)]
+
+    def find_element(self, by, xpath):
+        elements = self.find_elements(by, xpath)
+        if not elements:
+            raise selenium.common.exceptions.NoSuchElementException(xpath)
+        return elements[0]
+
+    def quit(self):
+        self.closed = True
+
+
+class ReplayAdapter(HTTPAdapter):
+    """
+    Sends the requests for one origin (e.g., https://www.tideschart.com) to another (a ReplayServer)
+    """
+
+    def __init__(self, origin: str, target: str, **kwargs):
+        super().__init__(**kwargs)
+        self.origin = origin
+        self.target = target
+
+    def send(self, request, **kwargs):
+        if request.url.startswith(self.origin):
+            request.url = self.target + request.url[len(self.origin):]
+        return super().send(request, **kwargs)
+
+
+class ReplayProfile(BrowserProfile):
+    """
+    A BrowserProfile whose sessions are FakeDrivers on a ReplayServer
+    """
+
+    def __init__(self, server_url: str, **kwargs):
+        super().__init__(**kwargs)
+        self.server_url = server_url
+        self.drivers = []
+
+    def new_session(self):
+        driver = FakeDriver(self.server_url)
+        self.drivers.append(driver)
+        return driver
+
+
+def replay_tidesapp(server: ReplayServer, monkeypatch, cache_file: str = None) -> ReplayProfile:
+    """
+    Point tidesapp at a ReplayServer, for the duration of a test (with pytest's monkeypatch).
+
+    Args..
+    server (ReplayServer) The server
+    monkeypatch (pytest.MonkeyPatch) Undoes the changes at the end of the test
+    cache_file (str) The tide cache to be used (None disables the cache)
+
+    Returns..
+    profile (ReplayProfile) The browser profile to be passed to TidesApp
+    """
+
+    def fetcher(*args, **kwargs):
+        fetcher = HttpFetcher(*args, **kwargs)
+        fetcher.session.mount(TidesApp.BASE_URL, ReplayAdapter(TidesApp.BASE_URL, server.url))
+        return fetcher
+
+    monkeypatch.setattr(tidesapp, 'HttpFetcher', fetcher)
+    monkeypatch.setattr(TidesApp, 'CACHE_FILE', cache_file)
+    monkeypatch.setattr(TidesApp, 'PROFILE_DIR', None)
+    return ReplayProfile(server.url)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record the tideschart.com pages of a tidesapp input file')
+    parser.add_argument('-f', '--file', required=True)
+    parser.add_argument('-d', '--directory', default=RECORDED)
+    args = parser.parse_args()
+    with Recorder(args.directory) as recorder:
+        for file in recorder.record_locations(args.file):
+            print(file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/bin/env python3
+"""
+Unit tests for tidesapp's browser profile (the Chrome sessions themselves are not started)
+"""
+
+import fcntl
+import os
+
+import pytest
+from selenium import webdriver
+from browser_profile import BrowserProfile, ProfiledChrome
+from tidesapp import TidesApp
+
+
+@pytest.fixture
+def chrome_calls(monkeypatch):
+    """
+    Stands in for webdriver.Chrome's session (no browser is started), and records the calls made
+    """
+
+    calls = []
+
+    def init(driver, options=None, **kwargs):
+        driver.options = options
+        calls.append(('start', options))
+
+    monkeypatch.setattr(webdriver.Chrome, '__init__', init)
+    monkeypatch.setattr(webdriver.Chrome, 'quit', lambda driver: calls.append(('quit', None)))
+    monkeypatch.setattr(webdriver.Chrome, 'execute_cdp_cmd',
+                        lambda driver, command, args: calls.append((command, args)))
+    return calls
+
+
+class Tests_browser_profile:
+
+    def test_options_01(self):
+        options = BrowserProfile().options()
+        assert options.page_load_strategy == 'eager'
+        assert '--headless=new' in options.arguments
+        assert '--blink-settings=imagesEnabled=false' in options.arguments
+        assert options.experimental_options['prefs'] == {'profile.managed_default_content_settings.images': 2}
+        assert not any(argument.startswith(('--host-resolver-rules', '--user-data-dir'))
+                       for argument in options.arguments)
+
+    def test_options_02(self, tmp_path):
+        """Third-party hosts don't resolve; each slot has its own user data directory"""
+        profile = BrowserProfile(headless=False, block_images=False, page_load_strategy='normal',
+                                 first_party=['tideschart.com'], user_data_dir=str(tmp_path))
+        options = profile.options(slot=2)
+        assert options.page_load_strategy == 'normal'
+        assert '--headless=new' not in options.arguments
+        assert 'prefs' not in options.experimental_options
+        assert ('--host-resolver-rules=MAP * ~NOTFOUND, EXCLUDE tideschart.com, EXCLUDE *.tideschart.com'
+                in options.arguments)
+        assert f"--user-data-dir={tmp_path / 'session-2'}" in options.arguments
+
+    def test_options_03(self):
+        with pytest.raises(ValueError):
+            BrowserProfile(page_load_strategy='lazy')
+        assert BrowserProfile(block_fonts=False).blocked_urls() == []
+        assert '*.css' in BrowserProfile(block_css=True).blocked_urls()
+
+    def test_new_session_01(self, chrome_calls):
+        """Fonts are blocked through the DevTools protocol"""
+        driver = BrowserProfile().new_session()
+        assert not isinstance(driver, ProfiledChrome)
+        assert [call[0] for call in chrome_calls] == ['start', 'Network.enable', 'Network.setBlockedURLs']
+        assert '*.woff2' in chrome_calls[-1][1]['urls']
+
+    def test_new_session_02(self, chrome_calls, tmp_path):
+        """Sessions reuse the user data directories of the sessions which quit before them"""
+        profile = BrowserProfile(block_fonts=False, user_data_dir=str(tmp_path))
+        first, second = profile.new_session(), profile.new_session()
+        assert (first.slot, second.slot) == (0, 1)
+        first.quit()
+        third = profile.new_session()
+        assert third.slot == 0
+        assert third.options.arguments[-1] == f"--user-data-dir={tmp_path / 'session-0'}"
+        assert os.path.isdir(tmp_path)
+        assert [call[0] for call in chrome_calls] == ['start', 'start', 'quit', 'start']
+
+    def test_new_session_03(self, chrome_calls, tmp_path):
+        """Subdirectories locked by another process (or another profile) are skipped"""
+        other = BrowserProfile(user_data_dir=str(tmp_path))
+        assert other.take() == 0
+        os.makedirs(tmp_path / 'session-1')
+        with open(tmp_path / 'session-1' / BrowserProfile.LOCK_FILE, 'w') as file:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            profile = BrowserProfile(block_fonts=False, user_data_dir=str(tmp_path))
+            driver = profile.new_session()
+            assert driver.slot == 2
+        other.release(0)
+        assert profile.take() == 0
+        driver.quit()
+        assert profile.take() == 1
+        assert profile.take() == 2
+
+    def test_tidesapp_01(self):
+        app = TidesApp(BrowserProfile(quick_wait=1, long_wait=2))
+        assert (app.profile.quick_wait, app.profile.long_wait) == (1, 2)
+        app = TidesApp()
+        assert app.profile.first_party == TidesApp.FIRST_PARTY
+        assert app.profile.user_data_dir == TidesApp.PROFILE_DIR
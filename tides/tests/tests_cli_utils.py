@@ -6,7 +6,7 @@ Unit tests for tideapp's cli utility
 import pytest
 import sys
 import os
-from cli_utils import process_command_line
+from cli_utils import output_file, process_command_line
 
 
 class Tests_cli_utils:
@@ -46,3 +46,13 @@ class Tests_cli_utils:
         sys.argv[1:] = mock_cli
         file = process_command_line()
         assert os.path.isfile(file)
+
+    @pytest.mark.parametrize("mock_cli, expected", [
+        [['-f', 'sample_input_URLs_1.json'], None],
+        [['-f', 'sample_input_URLs_1.json', '-o', 'tides.csv'], 'tides.csv'],
+        [['--output=tides.json', '--file=sample_input_URLs_1.json'], 'tides.json'],
+    ])
+    def test_cli_utils_04(self, mock_cli, expected):
+        sys.argv[1:] = mock_cli
+        assert os.path.isfile(process_command_line())
+        assert output_file() == expected
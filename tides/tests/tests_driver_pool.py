@@ -0,0 +1,86 @@
+#!/bin/env python3
+"""
+Unit tests for tidesapp's pool of browser sessions (run against a local fixture server)
+"""
+
+import threading
+import time
+
+import pytest
+from browser_profile import BrowserProfile
+from driver_pool import DriverPool, HostLimiter
+from tidesapp import Modes, TidesApp
+
+SALISBURY = TidesApp.BASE_URL + "/United-States/Massachusetts/Essex-County/Salisbury/"
+NOWHERE = TidesApp.BASE_URL + "/United-States/Massachusetts/Essex-County/Nowhere/"
+
+
+def url_locations(count):
+    return [{'URL': f"{TidesApp.BASE_URL}/United-States/Massachusetts/Essex-County/Beach-{i}/"}
+            for i in range(count)]
+
+
+class Tests_driver_pool:
+
+    @pytest.mark.parametrize("size, per_host", [(0, 1), (1, 0)])
+    def test_driver_pool_01(self, size, per_host):
+        with pytest.raises(ValueError):
+            DriverPool(size, factory=object, per_host=per_host)
+
+    def test_driver_pool_02(self, fake_drivers):
+        """Sessions are created on demand, reused, and quit when the pool is closed"""
+        with DriverPool(2, factory=fake_drivers) as pool:
+            with pool.session(SALISBURY) as first:
+                pass
+            with pool.session(SALISBURY) as second:
+                assert second is first
+            assert len(fake_drivers.drivers) == 1
+        assert fake_drivers.drivers[0].closed
+
+    def test_driver_pool_03(self):
+        """No more than per_host visits to one host are in progress at once"""
+        limiter = HostLimiter(2)
+        lock = threading.Lock()
+        in_progress, max_in_progress = [0], [0]
+
+        def visit(url):
+            with limiter.visit(url):
+                with lock:
+                    in_progress[0] += 1
+                    max_in_progress[0] = max(max_in_progress[0], in_progress[0])
+                time.sleep(0.02)
+                with lock:
+                    in_progress[0] -= 1
+
+        threads = [threading.Thread(target=visit, args=(SALISBURY,)) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert max_in_progress[0] == 2
+
+    @pytest.mark.parametrize("size, per_host", [(4, 2), (3, 3), (1, 1)])
+    def test_get_all_weekly_tides_01(self, tides_server, fake_drivers, size, per_host):
+        app = TidesApp()
+        app.mode = Modes.URLs
+        app.locations = url_locations(8)
+        with DriverPool(size, factory=fake_drivers, per_host=per_host) as pool:
+            app.get_all_weekly_tides(pool)
+        assert list(app.weekly_tides) == [location['URL'] for location in app.locations]
+        assert app.errors == {}
+        for tides in app.weekly_tides.values():
+            assert len(tides) == 13
+            assert tides == sorted(tides)
+        assert len(fake_drivers.drivers) <= size
+        assert tides_server.max_in_progress <= per_host
+
+    def test_get_all_weekly_tides_02(self, tides_server, fake_drivers):
+        """A location which fails is reported in errors, without affecting the others"""
+        app = TidesApp(BrowserProfile(long_wait=0.5))
+        app.mode = Modes.URLs
+        app.locations = [{'URL': SALISBURY}, {'URL': NOWHERE}] + url_locations(3)
+        with DriverPool(2, factory=fake_drivers) as pool:
+            app.get_all_weekly_tides(pool)
+        assert list(app.errors) == [NOWHERE]
+        assert len(app.weekly_tides) == 4
+        assert NOWHERE not in app.weekly_tides
@@ -0,0 +1,67 @@
+#!/bin/env python3
+"""
+Unit tests for tidesapp's HTTP (browser-less) fetch path (run against a local fixture server)
+"""
+
+import pytest
+import requests
+from driver_pool import DriverPool
+from http_fetch import HttpFetcher
+from tide_parser import week_high_tides
+from tidesapp import Modes, TidesApp
+
+
+def location_url(server, name):
+    return f"{server.url}/United-States/Massachusetts/Essex-County/{name}/"
+
+
+class Tests_http_fetch:
+
+    def test_weekly_rows_01(self, tides_server):
+        """The rows are extracted with the browser's XPATH, over one gzipped keep-alive connection"""
+        with HttpFetcher(size=2) as fetcher:
+            for name in ['Salisbury', 'Newburyport', 'Rowley']:
+                rows = fetcher.weekly_rows(location_url(tides_server, name), TidesApp.WEEKLY_TABLE_XPATH)
+                assert len(rows) == 7
+        assert rows[0] == 'Mon 22 3:36am ▼ 0.98 ft 9:09am ▲ 6.56 ft 3:41pm ▼ 1.64 ft 9:17pm ▲ 7.55 ft ▲ 5:57am ▼ 7:35pm'
+        assert tides_server.connections == 1
+        assert tides_server.gzipped == 3
+
+    def test_weekly_rows_02(self, tides_server):
+        with HttpFetcher() as fetcher:
+            assert fetcher.weekly_rows(location_url(tides_server, 'Scripted'), TidesApp.WEEKLY_TABLE_XPATH) is None
+            with pytest.raises(requests.HTTPError):
+                fetcher.weekly_rows(location_url(tides_server, 'Nowhere'), TidesApp.WEEKLY_TABLE_XPATH)
+
+    def test_get_weekly_tides_via_http_01(self, tides_server):
+        app = TidesApp()
+        with HttpFetcher() as fetcher:
+            week = app.get_weekly_tides_via_http(location_url(tides_server, 'Salisbury'), fetcher)
+        assert len(week) == 7
+        assert sum(len(day_tides.tides) for day_tides in week) == 27
+        assert len(week_high_tides(week)) == 13
+
+    def test_get_all_weekly_tides_01(self, tides_server, fake_drivers):
+        """A browser is started only for the page whose table isn't in its HTML"""
+        app = TidesApp()
+        app.mode = Modes.URLs
+        names = ['Salisbury', 'Scripted', 'Newburyport', 'Rowley']
+        app.locations = [{'URL': location_url(tides_server, name)} for name in names]
+        with DriverPool(2, factory=fake_drivers) as pool, HttpFetcher(2) as fetcher:
+            app.get_all_weekly_tides(pool, fetcher)
+        assert list(app.weekly_tides) == [location['URL'] for location in app.locations]
+        assert all(len(tides) == 13 for tides in app.weekly_tides.values())
+        assert app.errors == {}
+        assert len(fake_drivers.drivers) == 1
+        assert tides_server.requests.count('/United-States/Massachusetts/Essex-County/Scripted/') == 2
+
+    def test_get_all_weekly_tides_02(self, tides_server, fake_drivers):
+        """HTTP errors are reported, without falling back to a browser"""
+        app = TidesApp()
+        app.mode = Modes.URLs
+        app.locations = [{'URL': location_url(tides_server, name)} for name in ['Nowhere', 'Salisbury']]
+        with DriverPool(2, factory=fake_drivers) as pool, HttpFetcher(2) as fetcher:
+            app.get_all_weekly_tides(pool, fetcher)
+        assert list(app.weekly_tides) == [app.locations[1]['URL']]
+        assert isinstance(app.errors[app.locations[0]['URL']], requests.HTTPError)
+        assert fake_drivers.drivers == []
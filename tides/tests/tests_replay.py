@@ -0,0 +1,55 @@
+#!/bin/env python3
+"""
+Unit tests for the record/replay harness (replay.py)
+"""
+
+import os
+
+import requests
+from http_fetch import HttpFetcher
+from replay import FIXTURES, Recorder, ReplayAdapter, ReplayProfile, ReplayServer, page_file
+from tidesapp import TidesApp
+
+SALISBURY = TidesApp.BASE_URL + "/United-States/Massachusetts/Essex-County/Salisbury/"
+
+
+class Tests_replay:
+
+    def test_page_file_01(self, tmp_path):
+        assert page_file(str(tmp_path), '/A/B/') == page_file(str(tmp_path), '/A/B')
+        assert page_file(str(tmp_path), '/search?q=Salisbury%2C+MA') != page_file(str(tmp_path), '/search')
+        assert os.path.dirname(page_file(str(tmp_path), '/A/B/')) == str(tmp_path)
+
+    def test_record_url_01(self, tides_server, tmp_path):
+        """A recorded page is replayed for its path; other paths get the saved pages"""
+        with Recorder(str(tmp_path)) as recorder, HttpFetcher() as fetcher:
+            file = recorder.record_url(tides_server.url + '/United-States/Massachusetts/Essex-County/Salisbury/',
+                                       fetcher)
+        with open(file, 'rb') as fh:
+            assert fh.read() == tides_server.weekly_page
+        recorder.save(tides_server.url + '/Recorded/', b'<html><body>Recorded</body></html>')
+
+        with ReplayServer(str(tmp_path), delay=0) as server:
+            assert requests.get(server.url + '/Recorded/').text == '<html><body>Recorded</body></html>'
+            assert requests.get(server.url + '/Elsewhere/').content == server.weekly_page
+
+    def test_record_search_01(self, tides_server, tmp_path, monkeypatch):
+        """Search results are recorded by query, and a throttled search as the throttle page"""
+        monkeypatch.setattr(TidesApp, 'BASE_URL', tides_server.url)
+        tides_server.throttle = 1
+        municipality = {'MUNI': "Salisbury, MA", 'HINT': "/United-States/Massachusetts/Essex-County/Salisbury/"}
+        with Recorder(str(tmp_path), ReplayProfile(tides_server.url)) as recorder:
+            throttled = recorder.record_search(municipality)
+            results = recorder.record_search(municipality)
+        assert os.path.basename(throttled) == 'too_many_searches.html'
+        assert results == page_file(str(tmp_path), '/search?q=Salisbury%2C+MA')
+        with open(results) as fh:
+            assert municipality['HINT'] in fh.read()
+        assert os.path.isfile(os.path.join(FIXTURES, 'too_many_searches.html'))
+
+    def test_replay_adapter_01(self, tides_server):
+        with HttpFetcher() as fetcher:
+            fetcher.session.mount(TidesApp.BASE_URL, ReplayAdapter(TidesApp.BASE_URL, tides_server.url))
+            rows = fetcher.weekly_rows(SALISBURY, TidesApp.WEEKLY_TABLE_XPATH)
+        assert len(rows) == 7
+        assert tides_server.requests == ['/United-States/Massachusetts/Essex-County/Salisbury/']
@@ -0,0 +1,159 @@
+#!/bin/env python3
+"""
+Unit tests for tidesapp's scheduler: per-host rate limits, and backoff on throttling
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from driver_pool import DriverPool
+from http_fetch import HttpFetcher
+from scheduler import Scheduler, Throttled, TokenBucket, backoff_delay
+from tidesapp import Modes, TidesApp
+
+MUNIS = [
+    {'MUNI': "Salisbury, MA", 'HINT': "/United-States/Massachusetts/Essex-County/Salisbury/"},
+    {'MUNI': "Newburyport, MA", 'HINT': "/United-States/Massachusetts/Essex-County/Newburyport/"},
+    {'MUNI': "Rowley, MA", 'HINT': "/United-States/Massachusetts/Essex-County/Rowley/"},
+]
+
+
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(Scheduler, 'BASE_DELAY', 0.2)
+    monkeypatch.setattr(Scheduler, 'MAX_DELAY', 0.4)
+
+
+class Tests_scheduler:
+
+    @pytest.mark.parametrize("rate, burst", [(0, 1), (1, 0)])
+    def test_token_bucket_01(self, rate, burst):
+        with pytest.raises(ValueError):
+            TokenBucket(rate, burst)
+
+    def test_token_bucket_02(self):
+        """After the burst, tokens are granted at the bucket's rate"""
+
+        async def take(count):
+            bucket = TokenBucket(rate=20, burst=3)
+            start = time.monotonic()
+            for _ in range(count):
+                await bucket.acquire()
+            return bucket, time.monotonic() - start
+
+        bucket, elapsed = asyncio.run(take(3))
+        assert bucket.tokens < 1
+        bucket, elapsed = asyncio.run(take(10))
+        assert elapsed >= 0.3
+
+    def test_backoff_delay_01(self):
+        for attempt in range(1, 10):
+            delays = [backoff_delay(attempt, 2, 60) for _ in range(50)]
+            assert all(0 <= delay <= min(60, 2 * 2 ** (attempt - 1)) for delay in delays)
+        assert len(set(backoff_delay(3, 2, 60) for _ in range(10))) > 1
+
+    def test_scheduler_01(self, monkeypatch):
+        """A throttled item is retried, while the other items are processed"""
+        fast_backoff(monkeypatch)
+        calls = []
+        lock = threading.Lock()
+
+        def task(item):
+            with lock:
+                calls.append(item)
+                if item == 'a' and calls.count('a') < 3:
+                    raise Throttled(item)
+            if item == 'b':
+                raise KeyError(item)
+            return item.upper()
+
+        scheduler = Scheduler(max_workers=1)
+        results, errors = scheduler.run(task, ['a', 'b', 'c', 'd'], key=str)
+        assert results == {'a': 'A', 'c': 'C', 'd': 'D'}
+        assert list(errors) == ['b']
+        assert isinstance(errors['b'], KeyError)
+        assert calls.count('a') == 3
+        assert calls.index('d') < len(calls) - 1  # ('a' succeeded last)
+        assert [key for key, delay in scheduler.backoffs] == ['a', 'a']
+
+    def test_scheduler_02(self, monkeypatch):
+        """An item is given up on after MAX_RETRIES retries"""
+        fast_backoff(monkeypatch)
+        monkeypatch.setattr(Scheduler, 'MAX_RETRIES', 2)
+
+        def task(item):
+            raise Throttled(item)
+
+        scheduler = Scheduler(max_workers=2)
+        results, errors = scheduler.run(task, ['a'], key=str)
+        assert results == {}
+        assert isinstance(errors['a'], Throttled)
+        assert len(scheduler.backoffs) == 2
+
+    def test_scheduler_03(self):
+        """Items are started at no more than the host's rate, whatever the number of workers"""
+        starts = []
+
+        def task(item):
+            starts.append(time.monotonic())
+            return item
+
+        scheduler = Scheduler(max_workers=8, rate=20, burst=2)
+        results, errors = scheduler.run(task, list(range(12)), key=str,
+                                        url=lambda item: 'https://www.tideschart.com/')
+        assert len(results) == 12
+        assert max(starts) - min(starts) >= 0.45
+
+    def test_scheduler_04(self, monkeypatch):
+        """
+        Tasks slower than the rate don't bank tokens while they wait for a worker: after a Throttled,
+        the next task waits for a new token
+        """
+        fast_backoff(monkeypatch)
+        events = []
+        lock = threading.Lock()
+
+        def task(item):
+            with lock:
+                events.append((item, time.monotonic()))
+                first = item == 'a' and len(events) == 1
+            time.sleep(0.3)
+            if first:
+                raise Throttled(item)
+            return item
+
+        scheduler = Scheduler(max_workers=1, rate=5, burst=1)
+        results, errors = scheduler.run(task, ['a', 'b', 'c'], key=str,
+                                        url=lambda item: 'https://www.tideschart.com/')
+        assert set(results) == {'a', 'b', 'c'}
+        (_, throttled), (second, start) = events[0], events[1]
+        assert second == 'b'
+        assert start - (throttled + 0.3) >= 0.15  # (b's token was taken after the bucket was drained)
+
+    def test_get_all_weekly_tides_01(self, tides_server, fake_drivers, monkeypatch):
+        """Throttled searches are retried with backoff, without holding a browser meanwhile"""
+        fast_backoff(monkeypatch)
+        monkeypatch.setattr(TidesApp, 'BASE_URL', tides_server.url)
+        tides_server.throttle = 2
+        app = TidesApp()
+        app.mode, app.locations = Modes.MUNIs, MUNIS
+        with DriverPool(1, factory=fake_drivers, rate=50, burst=3) as pool, HttpFetcher(1) as fetcher:
+            app.get_all_weekly_tides(pool, fetcher)
+        assert list(app.weekly_tides) == [muni['MUNI'] for muni in MUNIS]
+        assert app.errors == {}
+        assert len(fake_drivers.drivers) == 1
+        assert fake_drivers.drivers[0].searches == 5
+        assert tides_server.throttled == 2
+
+    def test_search_for_URL_01(self, tides_server, fake_drivers, monkeypatch):
+        """The site's "too many searches" page is detected at once"""
+        monkeypatch.setattr(TidesApp, 'BASE_URL', tides_server.url)
+        tides_server.throttle = 1
+        app = TidesApp()
+        driver = fake_drivers()
+        start = time.monotonic()
+        with pytest.raises(Throttled):
+            app.search_for_URL(MUNIS[0], driver)
+        assert time.monotonic() - start < app.profile.quick_wait
+        assert app.search_for_URL(MUNIS[0], driver) == tides_server.url + MUNIS[0]['HINT']
@@ -0,0 +1,140 @@
+#!/bin/env python3
+"""
+Unit tests for tidesapp's cache of retrieved tides
+"""
+
+from datetime import date, datetime
+
+from freezegun import freeze_time
+from driver_pool import DriverPool
+from http_fetch import HttpFetcher
+from tide_cache import TideCache
+from tide_parser import DayTides, Tide
+from tidesapp import Modes, TidesApp
+
+TIDES = [DayTides(date(2022, 8, 22),
+                  (Tide(datetime(2022, 8, 22, 3, 36), False, 0.98), Tide(datetime(2022, 8, 22, 9, 9), True, 6.56),
+                   Tide(datetime(2022, 8, 22, 15, 41), False, -0.5)),
+                  datetime(2022, 8, 22, 5, 57), datetime(2022, 8, 22, 19, 35))]
+
+
+def url_app(server, names):
+    app = TidesApp()
+    app.mode = Modes.URLs
+    app.locations = [{'URL': f"{server.url}/United-States/Massachusetts/Essex-County/{name}/"} for name in names]
+    return app
+
+
+class Tests_tide_cache:
+
+    def test_tide_cache_01(self, tmp_path):
+        """Entries are fresh until local midnight, then stale (but their validators are kept)"""
+        with freeze_time(datetime(2022, 8, 22, 10, 0)) as frozen:
+            with TideCache(str(tmp_path / 'tides.sqlite')) as cache:
+                assert cache.get('Salisbury') is None
+                assert cache.validators('Salisbury') == (None, None)
+                cache.put('Salisbury', TIDES, '"abc"', 'Mon, 22 Aug 2022 04:00:00 GMT')
+                assert cache.get('Salisbury') == TIDES
+                frozen.move_to(datetime(2022, 8, 22, 23, 59))
+                assert cache.get('Salisbury') == TIDES
+                frozen.move_to(datetime(2022, 8, 23, 0, 0))
+                assert cache.get('Salisbury') is None
+                assert cache.validators('Salisbury') == ('"abc"', 'Mon, 22 Aug 2022 04:00:00 GMT')
+                assert cache.renew('Salisbury') == TIDES
+                assert cache.get('Salisbury') == TIDES
+
+    def test_tide_cache_02(self, tmp_path):
+        """The cache persists between processes (connections)"""
+        file = str(tmp_path / 'cache' / 'tides.sqlite')
+        with freeze_time(datetime(2022, 8, 22, 10, 0)):
+            with TideCache(file) as cache:
+                cache.put('Salisbury, MA', TIDES)
+            with TideCache(file) as cache:
+                assert cache.get('Salisbury, MA') == TIDES
+
+    def test_get_all_weekly_tides_01(self, tides_server, fake_drivers, tmp_path):
+        """Repeated runs on one day make no requests; the next day's requests are revalidated"""
+        names = ['Salisbury', 'Newburyport', 'Scripted']
+        with freeze_time(datetime(2022, 8, 22, 10, 0)) as frozen, \
+                TideCache(str(tmp_path / 'tides.sqlite')) as cache:
+            first = url_app(tides_server, names)
+            with DriverPool(2, factory=fake_drivers) as pool, HttpFetcher(2) as fetcher:
+                first.get_all_weekly_tides(pool, fetcher, cache)
+            assert len(first.weekly_tides) == 3
+            requests = len(tides_server.requests)
+
+            second = url_app(tides_server, names)
+            with DriverPool(2, factory=fake_drivers) as pool, HttpFetcher(2) as fetcher:
+                second.get_all_weekly_tides(pool, fetcher, cache)
+            assert second.weekly_tides == first.weekly_tides
+            assert len(tides_server.requests) == requests
+
+            frozen.move_to(datetime(2022, 8, 23, 6, 0))
+            third = url_app(tides_server, names[:2])
+            with DriverPool(2, factory=fake_drivers) as pool, HttpFetcher(2) as fetcher:
+                third.get_all_weekly_tides(pool, fetcher, cache)
+            assert tides_server.not_modified == 2
+            assert list(third.weekly_tides.values()) == list(first.weekly_tides.values())[:2]
+
+    def test_resolve_01(self, tmp_path):
+        with TideCache(str(tmp_path / 'tides.sqlite')) as cache:
+            assert cache.resolve('Salisbury, MA', '/Essex-County/Salisbury/') is None
+            cache.save_resolved('Salisbury, MA', '/Essex-County/Salisbury/', TidesApp.BASE_URL + '/Salisbury/')
+            assert cache.resolve('Salisbury, MA', '/Essex-County/Salisbury/') == TidesApp.BASE_URL + '/Salisbury/'
+            assert cache.resolve('Salisbury, MA', '/Wicomico-County/Salisbury/') is None
+
+    def test_get_all_weekly_tides_02(self, tides_server, fake_drivers, tmp_path, monkeypatch):
+        """A municipality is searched for once; later runs retrieve its URL over HTTP"""
+        monkeypatch.setattr(TidesApp, 'BASE_URL', tides_server.url)
+        munis = [
+            {'MUNI': "Salisbury, MA", 'HINT': "/United-States/Massachusetts/Essex-County/Salisbury/"},
+            {'MUNI': "Newburyport, MA", 'HINT': "/United-States/Massachusetts/Essex-County/Newburyport/"},
+        ]
+        with freeze_time(datetime(2022, 8, 22, 10, 0)) as frozen, \
+                TideCache(str(tmp_path / 'tides.sqlite')) as cache:
+            first = TidesApp()
+            first.mode, first.locations = Modes.MUNIs, munis
+            with DriverPool(2, factory=fake_drivers) as pool, HttpFetcher(2) as fetcher:
+                first.get_all_weekly_tides(pool, fetcher, cache)
+            assert list(first.weekly_tides) == ["Salisbury, MA", "Newburyport, MA"]
+            assert all(len(tides) == 13 for tides in first.weekly_tides.values())
+            assert sum(driver.searches for driver in fake_drivers.drivers) == 2
+            assert cache.resolve(munis[0]['MUNI'], munis[0]['HINT']) == \
+                tides_server.url + "/United-States/Massachusetts/Essex-County/Salisbury/"
+
+            frozen.move_to(datetime(2022, 8, 23, 6, 0))
+            drivers = len(fake_drivers.drivers)
+            second = TidesApp()
+            second.mode, second.locations = Modes.MUNIs, munis
+            with DriverPool(2, factory=fake_drivers) as pool, HttpFetcher(2) as fetcher:
+                second.get_all_weekly_tides(pool, fetcher, cache)
+            assert list(second.weekly_tides) == list(first.weekly_tides)
+            assert len(fake_drivers.drivers) == drivers
+            assert not any(path.startswith('/search') for path in tides_server.requests[-2:])
+
+    def test_get_all_weekly_tides_03(self, tides_server, fake_drivers, tmp_path, monkeypatch):
+        """A municipality whose resolved URL fails (404) is searched for again"""
+        monkeypatch.setattr(TidesApp, 'BASE_URL', tides_server.url)
+        muni = {'MUNI': "Salisbury, MA", 'HINT': "/United-States/Massachusetts/Essex-County/Salisbury/"}
+        with TideCache(str(tmp_path / 'tides.sqlite')) as cache:
+            cache.save_resolved(muni['MUNI'], muni['HINT'], tides_server.url + "/United-States/Nowhere-Salisbury/")
+            app = TidesApp()
+            app.mode, app.locations = Modes.MUNIs, [muni]
+            with DriverPool(1, factory=fake_drivers) as pool, HttpFetcher(1) as fetcher:
+                app.get_all_weekly_tides(pool, fetcher, cache)
+            assert app.errors == {}
+            assert list(app.weekly_tides) == [muni['MUNI']]
+            assert sum(driver.searches for driver in fake_drivers.drivers) == 1
+            assert cache.resolve(muni['MUNI'], muni['HINT']) == tides_server.url + muni['HINT']
+            assert cache.get(tides_server.url + muni['HINT']) is not None
+
+    def test_latest_01(self, tmp_path):
+        """The most recent entry of every location, fresh or stale"""
+        later = [TIDES[0]._replace(sunset=datetime(2022, 8, 22, 19, 36))]
+        with freeze_time(datetime(2022, 8, 22, 10, 0)) as frozen, \
+                TideCache(str(tmp_path / 'tides.sqlite')) as cache:
+            cache.put('Salisbury', TIDES)
+            cache.put('Rowley', TIDES)
+            frozen.move_to(datetime(2022, 8, 23, 10, 0))
+            cache.put('Rowley', later)
+            assert cache.latest() == {'Rowley': later, 'Salisbury': TIDES}
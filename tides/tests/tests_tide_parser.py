@@ -0,0 +1,87 @@
+#!/bin/env python3
+"""
+Unit tests for tidesapp's tide table parser
+"""
+
+import pytest
+from datetime import date, datetime
+from freezegun import freeze_time
+from datetime_utils import day2datetime
+from tide_parser import DayTides, Tide, day_lookup, high_tide_times, hour24, parse_row, parse_week
+
+ROW = 'Mon 22 3:36am ▼ 0.98 ft 9:09am ▲ 6.56 ft 3:41pm ▼ 1.64 ft 9:17pm ▲ 7.55 ft ▲ 5:57am ▼ 7:35pm'
+
+
+class Tests_tide_parser:
+
+    @pytest.mark.parametrize("hours, meridiem, expected", [
+        ('12', 'a', 0), ('1', 'a', 1), ('11', 'a', 11), ('12', 'p', 12), ('3', 'p', 15), ('11', 'p', 23),
+    ])
+    def test_hour24_01(self, hours, meridiem, expected):
+        assert hour24(hours, meridiem) == expected
+
+    @pytest.mark.parametrize("today", [
+        date(2022, 8, 16), date(2022, 8, 31), date(2022, 12, 28), date(2024, 2, 27), date(2023, 2, 1),
+    ])
+    def test_day_lookup_01(self, today):
+        """Days of month resolve as datetime_utils.day2datetime resolves them"""
+        days = day_lookup(today)
+        with freeze_time(today):
+            for day_of_month in range(1, 32):
+                try:
+                    expected = day2datetime(day_of_month)
+                except ValueError:
+                    continue  # (e.g., Feb 30th)
+                day = days[day_of_month]
+                assert datetime(day.year, day.month, day.day) == expected
+
+    def test_parse_row_01(self):
+        observed = parse_row(ROW, day_lookup(date(2022, 8, 16)))
+        assert observed == DayTides(
+            date(2022, 8, 22),
+            (Tide(datetime(2022, 8, 22, 3, 36), False, 0.98),
+             Tide(datetime(2022, 8, 22, 9, 9), True, 6.56),
+             Tide(datetime(2022, 8, 22, 15, 41), False, 1.64),
+             Tide(datetime(2022, 8, 22, 21, 17), True, 7.55)),
+            datetime(2022, 8, 22, 5, 57),
+            datetime(2022, 8, 22, 19, 35))
+
+    @pytest.mark.parametrize("data, heights", [
+        ('Fri 26 6:34am ▼ -0.33 ft 12:04pm ▲ 7.87 ft 6:41pm ▼ 0.33 ft ▲ 6:01am ▼ 7:28pm', [-0.33, 7.87, 0.33]),
+        ('Fri 26\n6:34am ▼ 0 ft\n12:04pm ▲ 8 ft\n6:41pm ▼ 1 ft\n▲ 6:01am\n▼ 7:28pm', [0., 8., 1.]),
+    ])
+    def test_parse_row_02(self, data, heights):
+        observed = parse_row(data, day_lookup(date(2022, 8, 22)))
+        assert [tide.height for tide in observed.tides] == heights
+        assert high_tide_times(observed) == [datetime(2022, 8, 26, 12, 4)]
+
+    @pytest.mark.parametrize("data", [
+        'Mon 22 12:36am ▼ 0.98 ft 12:09pm ▲ 6.56 ft 3:41pm ▼ 1.64 ft ▲ 5:57am ▼ 7:35xm',
+        'Mon 22 3:36am ▼ 0.98 ft 9:09am ▲ 6.56 ft 3:41xx ▼ 1.64 ft ▲x5:57am ▼ 7:35pm',
+        'Mon 22 3:36am ▼ 0.98 ft 9:09am ▲ 6.56 ft ▲ 5:57am ▼ 7:35pm',
+        'Mon 22',
+    ])
+    def test_parse_row_03(self, data):
+        with pytest.raises(ValueError):
+            parse_row(data, day_lookup(date(2022, 8, 16)))
+
+    def test_parse_row_04(self):
+        with pytest.raises(ValueError):
+            high_tide_times(parse_row(
+                'Mon 22 3:36am ▼ 0.98 ft 9:09am ▼ 6.56 ft 3:41pm ▼ 1.64 ft ▲ 5:57am ▼ 7:35pm',
+                day_lookup(date(2022, 8, 16))))
+
+    def test_parse_week_01(self):
+        """A week which runs into the next month (and year)"""
+        rows = [
+            'Sat 30 3:36am ▼ 0.98 ft 9:09am ▲ 6.56 ft 3:41pm ▼ 1.64 ft ▲ 5:57am ▼ 7:35pm',
+            'Sun 31 3:36am ▼ 0.98 ft 9:09am ▲ 6.56 ft 3:41pm ▼ 1.64 ft ▲ 5:57am ▼ 7:35pm',
+            'Mon 1 3:36am ▼ 0.98 ft 9:09am ▲ 6.56 ft 3:41pm ▼ 1.64 ft ▲ 5:57am ▼ 7:35pm',
+        ]
+        observed = parse_week(rows, date(2023, 12, 30))
+        assert [day_tides.day for day_tides in observed] == [date(2023, 12, 30), date(2023, 12, 31), date(2024, 1, 1)]
+
+    @freeze_time(datetime(2022, 8, 22))
+    def test_parse_week_02(self):
+        observed = parse_week([ROW])
+        assert observed[0].day == date(2022, 8, 22)
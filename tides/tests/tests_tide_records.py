@@ -0,0 +1,93 @@
+#!/bin/env python3
+"""
+Unit tests for tidesapp's tide records and exporters
+"""
+
+import csv
+import json
+
+import pyarrow.parquet
+import pytest
+from datetime import date, datetime
+from freezegun import freeze_time
+from driver_pool import DriverPool
+from http_fetch import HttpFetcher
+from tide_parser import DayTides, Tide
+from tide_records import Exporter, TideRecord, open_exporter
+from tidesapp import Modes, TidesApp
+
+DAY_TIDES = DayTides(
+    date(2022, 8, 22),
+    (Tide(datetime(2022, 8, 22, 3, 36), False, 0.98), Tide(datetime(2022, 8, 22, 9, 9), True, 6.56),
+     Tide(datetime(2022, 8, 22, 15, 41), False, -0.33)),
+    datetime(2022, 8, 22, 5, 57),
+    datetime(2022, 8, 22, 19, 35))
+
+
+class Tests_tide_records:
+
+    def test_tide_record_01(self):
+        record = TideRecord.from_day_tides('Salisbury, MA', DAY_TIDES)
+        assert record.day == date(2022, 8, 22)
+        assert [(tide.high, tide.height_ft) for tide in record.tides] == [(False, 0.98), (True, 6.56), (False, -0.33)]
+        assert TideRecord.model_validate_json(record.model_dump_json()) == record
+        rows = record.rows()
+        assert len(rows) == 3
+        assert rows[1] == {'location': 'Salisbury, MA', 'day': date(2022, 8, 22), 'time': datetime(2022, 8, 22, 9, 9),
+                           'tide': 'high', 'height_ft': 6.56, 'sunrise': datetime(2022, 8, 22, 5, 57),
+                           'sunset': datetime(2022, 8, 22, 19, 35)}
+
+    def test_exporters_01(self, tmp_path):
+        files = {extension: str(tmp_path / f"tides{extension}") for extension in ['.json', '.jsonl', '.csv']}
+        for file in files.values():
+            with open_exporter(file) as exporter:
+                exporter.write('Salisbury, MA', [DAY_TIDES])
+                exporter.write('Newburyport, MA', [DAY_TIDES, DAY_TIDES])
+
+        with open(files['.json']) as fh:
+            records = [TideRecord.model_validate(record) for record in json.load(fh)]
+        assert [record.location for record in records] == ['Salisbury, MA'] + ['Newburyport, MA'] * 2
+
+        with open(files['.jsonl']) as fh:
+            assert [TideRecord.model_validate_json(line) for line in fh] == records
+
+        with open(files['.csv'], newline='') as fh:
+            rows = list(csv.DictReader(fh))
+        assert len(rows) == 9
+        assert rows[2] == {'location': 'Salisbury, MA', 'day': '2022-08-22', 'time': '2022-08-22T15:41:00',
+                           'tide': 'low', 'height_ft': '-0.33', 'sunrise': '2022-08-22T05:57:00',
+                           'sunset': '2022-08-22T19:35:00'}
+
+    def test_exporters_02(self, tmp_path):
+        file = str(tmp_path / 'tides.parquet')
+        with open_exporter(file) as exporter:
+            exporter.write('Salisbury, MA', [DAY_TIDES])
+        table = pyarrow.parquet.read_table(file)
+        assert table.num_rows == 3
+        assert table.column('tide').to_pylist() == ['low', 'high', 'low']
+
+    @pytest.mark.parametrize("file", ['tides.txt', 'tides'])
+    def test_exporters_03(self, tmp_path, file):
+        with pytest.raises(ValueError):
+            open_exporter(str(tmp_path / file))
+
+    def test_exporters_04(self, tmp_path):
+        """An exporter must define write_records"""
+        with pytest.raises(TypeError):
+            Exporter(str(tmp_path / 'tides.txt'))
+
+    def test_get_all_weekly_tides_01(self, tides_server, fake_drivers, tmp_path):
+        """Each location's tides are exported as soon as they are retrieved"""
+        file = str(tmp_path / 'tides.jsonl')
+        app = TidesApp()
+        app.mode = Modes.URLs
+        app.locations = [{'URL': f"{tides_server.url}/United-States/Massachusetts/Essex-County/{name}/"}
+                         for name in ['Salisbury', 'Scripted', 'Rowley']]
+        with freeze_time(datetime(2022, 8, 22, 10, 0)), open_exporter(file) as exporter:
+            with DriverPool(2, factory=fake_drivers) as pool, HttpFetcher(2) as fetcher:
+                app.get_all_weekly_tides(pool, fetcher, exporter=exporter)
+            with open(file) as fh:
+                lines = fh.readlines()
+        assert len(lines) == 21
+        assert {TideRecord.model_validate_json(line).location for line in lines} == set(app.weeks)
+        assert len(app.weekly_tides[app.locations[1]['URL']]) == 13
@@ -0,0 +1,106 @@
+#!/bin/env python3
+"""
+Unit tests for the tide query service
+"""
+
+import os
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from tide_cache import TideCache
+from tide_parser import DayTides, Tide
+from tide_service import TideIndex, TideService, create_app, location_name
+from tidesapp import TidesApp
+
+CRANE_BEACH = TidesApp.BASE_URL + "/United-States/Massachusetts/Essex-County/Crane-Beach/"
+ROCKPORT = TidesApp.BASE_URL + "/United-States/Massachusetts/Essex-County/Rockport/"
+SAMPLE_URLS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sample_input_URLs_1.json')
+
+
+def day(day, highs, offset=0):
+    """A day of tides: a low tide, then the high tides (hours), each shifted by 'offset' minutes"""
+    start = datetime(2022, 8, day)
+    tides = (Tide(start + timedelta(hours=3, minutes=offset), False, 0.5),) + tuple(
+        Tide(start + timedelta(hours=hour, minutes=offset), True, 9.0 + hour / 100) for hour in highs)
+    return DayTides(start.date(), tides, start + timedelta(hours=6), start + timedelta(hours=19))
+
+
+WEEKS = {
+    CRANE_BEACH: [day(22, [9, 21]), day(23, [10, 22])],
+    ROCKPORT: [day(22, [9, 21], offset=30), day(23, [10], offset=30)],
+    "Salisbury, MA": [day(23, [11])],
+}
+
+
+@pytest.fixture
+def index():
+    return TideIndex(WEEKS)
+
+
+@pytest.fixture
+def cache_file(tmp_path):
+    file = str(tmp_path / 'tides.sqlite')
+    with TideCache(file) as cache:
+        for location, week in WEEKS.items():
+            cache.put(location, week)
+    return file
+
+
+class Tests_tide_service:
+
+    def test_location_name_01(self):
+        assert location_name(CRANE_BEACH) == 'Crane Beach'
+        assert location_name("Salisbury, MA") == "Salisbury, MA"
+
+    def test_next_high_01(self, index):
+        tide = index.next_high('crane beach', datetime(2022, 8, 22, 12, 0))
+        assert (tide.location, tide.name, tide.time, tide.height_ft) == \
+            (CRANE_BEACH, 'Crane Beach', datetime(2022, 8, 22, 21, 0), 9.21)
+        assert index.next_high(CRANE_BEACH, datetime(2022, 8, 22, 21, 0)).time == datetime(2022, 8, 23, 10, 0)
+        assert index.next_high("Salisbury, MA", datetime(2022, 8, 20)).time == datetime(2022, 8, 23, 11, 0)
+        assert index.next_high(ROCKPORT, datetime(2022, 8, 23, 11, 0)) is None
+        assert index.next_high('Atlantis', datetime(2022, 8, 22)) is None
+
+    def test_high_tides_between_01(self, index):
+        """Every location's high tides in a period (inclusive), in time order"""
+        tides = index.high_tides_between(datetime(2022, 8, 23, 9, 0), datetime(2022, 8, 23, 11, 0))
+        assert [(tide.name, tide.time.hour, tide.time.minute) for tide in tides] == \
+            [('Crane Beach', 10, 0), ('Rockport', 10, 30), ("Salisbury, MA", 11, 0)]
+        assert index.high_tides_between(datetime(2022, 8, 23, 12, 0), datetime(2022, 8, 23, 20, 0)) == []
+        assert len(index.high_tides_between(datetime(2022, 8, 1), datetime(2022, 9, 1))) == 8
+
+    def test_high_tides_between_02(self, index):
+        """Times with a time zone are converted to local time"""
+        start = datetime(2022, 8, 23, 9, 0).astimezone(timezone.utc)
+        end = datetime(2022, 8, 23, 11, 0).astimezone(timezone.utc)
+        assert len(index.high_tides_between(start, end)) == 3
+        assert len(TideIndex({}).high_tides_between(start, end)) == 0
+
+    def test_api_01(self, cache_file):
+        with TestClient(create_app(TideService(cache_file))) as client:
+            assert client.get('/locations').json()[0] == {'location': "Salisbury, MA", 'name': "Salisbury, MA"}
+
+            response = client.get('/tides/next-high', params={'location': 'Rockport', 'after': '2022-08-22T12:00'})
+            assert response.json() == {'location': ROCKPORT, 'name': 'Rockport',
+                                       'time': '2022-08-22T21:30:00', 'height_ft': 9.21}
+            assert client.get('/tides/next-high', params={'location': 'Atlantis'}).status_code == 404
+            assert client.get('/tides/next-high', params={'location': 'Rockport'}).status_code == 404
+
+            response = client.get('/tides/high', params={'start': '2022-08-23T09:00', 'end': '2022-08-23T11:00'})
+            assert [tide['name'] for tide in response.json()] == ['Crane Beach', 'Rockport', "Salisbury, MA"]
+            assert client.get('/tides/high', params={'start': '2022-08-23T11:00',
+                                                     'end': '2022-08-23T09:00'}).status_code == 422
+
+    def test_refresh_01(self, replay_profile, tmp_path):
+        """A refresh retrieves the locations file into the cache, and swaps in a new index"""
+        service = TideService(str(tmp_path / 'service.sqlite'), SAMPLE_URLS, profile=replay_profile)
+        service.reload()
+        index = service.index
+        assert len(index) == 0
+        service.refresh()
+        assert service.index is not index
+        assert [location_name(location) for location in service.index.locations] == ['Salisbury']
+        today = date.today()
+        after = datetime(today.year, today.month, 1)
+        assert service.index.next_high('Salisbury', after) is not None
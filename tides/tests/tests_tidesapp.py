@@ -66,15 +66,19 @@ class Tests_tidesapp_viaSelenium:
         ['-f', 'sample_input_URLs_1.json'],
         ['-f', 'sample_input_URLs_2.json'],
         ])
-    def test_mainapp_URLs_01(self, mock_cli):
+    def test_mainapp_URLs_01(self, mock_cli, replay_profile):
         sys.argv[1:] = mock_cli
-        app = TidesApp()
+        app = TidesApp(replay_profile)
         app.mainapp()
+        assert len(app.weekly_tides) == len(app.locations)
+        assert app.errors == {}
 
     @pytest.mark.parametrize("mock_cli", [
      ['-f', 'sample_input_munis_2.json'],
     ])
-    def test_mainapp_munis_01(self, mock_cli):
+    def test_mainapp_munis_01(self, mock_cli, replay_profile):
         sys.argv[1:] = mock_cli
-        app = TidesApp()
+        app = TidesApp(replay_profile)
         app.mainapp()
+        assert list(app.weekly_tides) == [location['MUNI'] for location in app.locations]
+        assert app.errors == {}
@@ -0,0 +1,200 @@
+#!/bin/env python3
+"""
+A module defining how tidesapp's browser sessions are configured (for tidesapp only).
+
+tidesapp only reads text from tideschart.com's pages, so a BrowserProfile trims everything else from
+each page load..
+
+- Chrome runs headless, with images not loaded, and fonts (and, optionally, style sheets) blocked.
+
+- Page loads are 'eager': driver.get returns as soon as the HTML is parsed (the tide table is in
+  the HTML), without waiting for images, frames and scripts to finish loading.
+
+- Requests to hosts other than the site's (ads, analytics, consent banners, CDNs for widgets) are
+  blocked, by resolving only the first-party hosts.
+
+- The waits for web elements (quick, for search results; long, for page loads) are part of the
+  profile, rather than hard-coded.
+
+With a user_data_dir, each session keeps its browser profile (HTTP cache and cookies) in a
+subdirectory of user_data_dir, which later runs reuse: a new session takes the first subdirectory
+not in use by another session, so a pool of N sessions reuses the same N profiles from run to run.
+A session claims its subdirectory with an exclusive lock (fcntl.flock) on a file inside it, so
+sessions of concurrent runs (e.g., tidesapp.py alongside tide_service.py's refreshes) never share a
+browser profile.
+"""
+
+import fcntl
+import os
+import threading
+
+from selenium import webdriver
+
+
+class ProfiledChrome(webdriver.Chrome):
+    """
+    A Chrome session which returns its profile slot (user data subdirectory) when it quits
+    """
+
+    def __init__(self, profile, slot, options):
+        self.profile = profile
+        self.slot = slot
+        super().__init__(options=options)
+
+    def quit(self):
+        try:
+            super().quit()
+        finally:
+            self.profile.release(self.slot)
+
+
+class BrowserProfile:
+    """
+    The configuration of tidesapp's browser sessions. new_session is a session factory for DriverPool.
+
+    Usage..
+
+        profile = BrowserProfile(first_party=['tideschart.com'], user_data_dir='~/.cache/tidesapp/chrome')
+        with DriverPool(size=4, factory=profile.new_session) as pool:
+            ...
+    """
+
+    # URL patterns of the font files blocked by block_fonts, and of the style sheets blocked by block_css
+    FONT_PATTERNS = ['*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot', '*fonts.googleapis.com*']
+    CSS_PATTERNS = ['*.css']
+
+    # The file in each user data subdirectory which is locked by the session using it
+    LOCK_FILE = 'tidesapp.lock'
+
+    def __init__(self, headless: bool = True, block_images: bool = True, block_fonts: bool = True,
+                 block_css: bool = False, page_load_strategy: str = 'eager', first_party: list = None,
+                 quick_wait: float = 5, long_wait: float = 30, user_data_dir: str = None):
+        """
+        Args..
+        headless (bool) Run Chrome without a window
+        block_images (bool) Don't load images
+        block_fonts (bool) Block web fonts
+        block_css (bool) Block style sheets (pages may then lay out differently)
+        page_load_strategy (str) 'normal', 'eager' or 'none' (see selenium's ChromeOptions)
+        first_party (list) The domains whose hosts may be visited (and their subdomains); requests to
+                           any other host are blocked. None (the default) blocks no hosts.
+        quick_wait (float) Seconds to wait for search results
+        long_wait (float) Seconds to wait for pages to load
+        user_data_dir (str) Keep the sessions' browser profiles under this directory, to be reused
+                            by later runs (optional)
+        """
+
+        if page_load_strategy not in ('normal', 'eager', 'none'):
+            raise ValueError
+        self.headless = headless
+        self.block_images = block_images
+        self.block_fonts = block_fonts
+        self.block_css = block_css
+        self.page_load_strategy = page_load_strategy
+        self.first_party = list(first_party) if first_party else None
+        self.quick_wait = quick_wait
+        self.long_wait = long_wait
+        self.user_data_dir = os.path.expanduser(user_data_dir) if user_data_dir else None
+        self.lock = threading.Lock()
+        self.slots = {}
+
+    def blocked_urls(self) -> list:
+        """
+        The URL patterns blocked in every session (see Chrome DevTools' Network.setBlockedURLs)
+        """
+
+        return (self.FONT_PATTERNS if self.block_fonts else []) + (self.CSS_PATTERNS if self.block_css else [])
+
+    def options(self, slot: int = None) -> webdriver.ChromeOptions:
+        """
+        The Chrome options of a session.
+
+        Args..
+        slot (int) The session's user data subdirectory, if the profile has a user_data_dir
+
+        Returns..
+        options (webdriver.ChromeOptions)
+        """
+
+        options = webdriver.ChromeOptions()
+        options.page_load_strategy = self.page_load_strategy
+        if self.headless:
+            options.add_argument('--headless=new')
+        options.add_argument('--disable-gpu')
+        options.add_argument('--disable-extensions')
+        options.add_argument('--no-first-run')
+        if self.block_images:
+            options.add_argument('--blink-settings=imagesEnabled=false')
+            options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+        if self.first_party:
+            # (hosts outside the first-party domains don't resolve, so nothing is requested from them)
+            excludes = ', '.join(f"EXCLUDE {domain}, EXCLUDE *.{domain}" for domain in self.first_party)
+            options.add_argument(f"--host-resolver-rules=MAP * ~NOTFOUND, {excludes}")
+        if self.user_data_dir and slot is not None:
+            options.add_argument(f"--user-data-dir={os.path.join(self.user_data_dir, f'session-{slot}')}")
+        return options
+
+    def take(self) -> int:
+        """
+        Claim the first user data subdirectory not in use by a session of this, or any other, process.
+
+        Args..
+        (none)
+
+        Returns..
+        slot (int) The subdirectory's number (to be released by release)
+        """
+
+        with self.lock:
+            slot = 0
+            while True:
+                if slot not in self.slots:
+                    directory = os.path.join(self.user_data_dir, f'session-{slot}')
+                    os.makedirs(directory, exist_ok=True)
+                    fd = os.open(os.path.join(directory, self.LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o600)
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        os.close(fd)
+                    else:
+                        self.slots[slot] = fd
+                        return slot
+                slot += 1
+
+    def release(self, slot: int):
+        with self.lock:
+            fd = self.slots.pop(slot, None)
+            if fd is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def new_session(self):
+        """
+        Create a Chrome session with this profile. This is a session factory for DriverPool.
+
+        Args..
+        (none)
+
+        Returns..
+        driver (webdriver.Chrome) A new browser session
+        """
+
+        slot = self.take() if self.user_data_dir else None
+        try:
+            if slot is None:
+                driver = webdriver.Chrome(options=self.options())
+            else:
+                driver = ProfiledChrome(self, slot, self.options(slot))
+        except Exception:
+            if slot is not None:
+                self.release(slot)
+            raise
+        patterns = self.blocked_urls()
+        if patterns:
+            try:
+                driver.execute_cdp_cmd('Network.enable', {})
+                driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+            except Exception:
+                driver.quit()
+                raise
+        return driver
@@ -8,6 +8,14 @@ import os
 import sys
 
 
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--file')
+    parser.add_argument('-o', '--output',
+                        help='Write the tides to this file (.json, .jsonl, .csv or .parquet)')
+    return parser
+
+
 def process_command_line() -> str:
     """
     Processes the command line. Returns the name of the input file.
@@ -17,7 +25,8 @@ def process_command_line() -> str:
 
     Uses argparse to process the user's command line.
 
-    Currently only supports a filename argument (-f, or --file=)
+    Supports a filename argument (-f, or --file=) and an output
+    filename argument (-o, or --output=, see output_file).
     Returns the filename. If no filename argument was supplied, a
     value of None is returned.
 
@@ -28,9 +37,7 @@ def process_command_line() -> str:
     filename (str) the name of a file containing location URLs.
     """
 
-    parser = argparse.ArgumentParser()
-    parser.add_argument('-f', '--file')
-    args = parser.parse_args(sys.argv[1:])
+    args = make_parser().parse_args(sys.argv[1:])
 
     if not args.file:
         raise ValueError
@@ -40,3 +47,20 @@ def process_command_line() -> str:
         raise FileNotFoundError
 
     return args.file
+
+
+def output_file() -> str:
+    """
+    Processes the command line. Returns the name of the output file.
+
+    Supports *ONLY* the tidesapp's CLI syntax (see process_command_line).
+
+    Args..
+    (none)
+
+    Returns..
+    filename (str) the name of the file to write the tides to (-o, or --output=),
+    or None if no output file was given.
+    """
+
+    return make_parser().parse_args(sys.argv[1:]).output
@@ -0,0 +1,227 @@
+#!/bin/env python3
+"""
+A module for running browser sessions concurrently (for tidesapp only).
+
+DriverPool holds a bounded number of browser sessions and dispatches one task per location to a pool
+of threads. Each task borrows a session for the duration of one page visit and then returns it to the
+pool, so no more than 'size' browsers are ever running, however many locations are queried.
+
+A per-host limit caps the number of visits in progress to any one web site (tideschart.com, in
+practice), independently of the pool size, so that a large pool doesn't hammer a single site. An
+optional per-host rate limit also caps the number of visits started per second (see scheduler.py).
+"""
+
+import threading
+from contextlib import contextmanager
+from queue import Empty, Queue
+from urllib.parse import urlparse
+
+import selenium.common.exceptions
+from browser_profile import BrowserProfile
+from scheduler import Scheduler
+
+
+def dispatch(task, items: list, key, max_workers: int, done=None, url=None, rate: float = None,
+             burst: int = 1) -> tuple:
+    """
+    Call task(item) for every item, concurrently, on up to max_workers threads. A task which raises
+    scheduler.Throttled is retried later, with backoff (see scheduler.py).
+
+    Args..
+    task (callable) Called as task(item)
+    items (list) The items (locations) to be processed
+    key (callable) key(item) is the item's key in the returned dictionaries
+    max_workers (int) The number of threads
+    done (callable) Called as done(item, result) as soon as each item succeeds, on the item's
+                    thread (optional)
+    url (callable) url(item) is the URL the item visits first (for the rate limit; optional)
+    rate (float) The maximum number of items started per second on any one host (optional)
+    burst (int) The number of items which may be started at once on any one host, within the rate
+
+    Returns..
+    results (dict) key -> the value returned by task, for each item which succeeded
+    errors (dict) key -> the exception raised by task, for each item which failed
+
+    Both dictionaries are ordered as the items are.
+    """
+
+    return Scheduler(max_workers, rate, burst).run(task, items, key, url, done)
+
+
+def headless_chrome():
+    """
+    Create a headless Chrome session, with the default BrowserProfile (see browser_profile.py). This
+    is the default session factory for DriverPool.
+
+    Args..
+    (none)
+
+    Returns..
+    driver (webdriver.Chrome) A new browser session
+    """
+
+    return BrowserProfile().new_session()
+
+
+class HostLimiter:
+    """
+    Caps the number of concurrent visits to each host
+    """
+
+    def __init__(self, per_host: int):
+        if per_host < 1:
+            raise ValueError
+        self.per_host = per_host
+        self.lock = threading.Lock()
+        self.semaphores = {}
+
+    @contextmanager
+    def visit(self, url: str):
+        """
+        A context manager which blocks until the URL's host has a free slot, and holds the slot
+        until the context exits.
+
+        Args..
+        url (str) The URL about to be visited
+
+        Returns..
+        (a context manager)
+        """
+
+        host = urlparse(url).netloc
+        with self.lock:
+            semaphore = self.semaphores.setdefault(host, threading.BoundedSemaphore(self.per_host))
+        with semaphore:
+            yield
+
+
+class DriverPool:
+    """
+    A bounded pool of browser sessions, shared by a pool of worker threads
+
+    Sessions are created on demand (by calling factory) up to 'size' sessions, and are reused
+    by subsequent tasks. A session which fails with a WebDriverException is assumed to be broken;
+    it is quit and discarded, and a fresh one is created when next needed.
+
+    Usage..
+
+        with DriverPool(size=4, per_host=2, rate=2.0) as pool:
+            results, errors = pool.map(fetch, locations, key=..., url=...)
+    """
+
+    def __init__(self, size: int = 4, factory=headless_chrome, per_host: int = 2, rate: float = None,
+                 burst: int = 1):
+        if size < 1:
+            raise ValueError
+        self.size = size
+        self.factory = factory
+        self.limiter = HostLimiter(per_host)
+        self.rate = rate
+        self.burst = burst
+        self.idle = Queue()
+        self.lock = threading.Lock()
+        self.created = 0
+        self.drivers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def acquire(self):
+        """
+        Borrow a session: an idle one if there is one, else a new one if the pool isn't full, else
+        wait for another task to release one.
+        """
+
+        try:
+            return self.idle.get_nowait()
+        except Empty:
+            pass
+        with self.lock:
+            create = self.created < self.size
+            if create:
+                self.created += 1
+        if not create:
+            return self.idle.get()
+        try:
+            driver = self.factory()
+        except Exception:
+            with self.lock:
+                self.created -= 1
+            raise
+        with self.lock:
+            self.drivers.append(driver)
+        return driver
+
+    def release(self, driver, broken: bool = False):
+        if not broken:
+            self.idle.put(driver)
+            return
+        with self.lock:
+            self.drivers.remove(driver)
+            self.created -= 1
+        try:
+            driver.quit()
+        except selenium.common.exceptions.WebDriverException:
+            pass
+
+    @contextmanager
+    def session(self, url: str):
+        """
+        A context manager which yields a browser session for visiting one URL, subject to the
+        per-host limit. (The host slot is taken first, so that a task waiting on a busy host
+        doesn't tie up a browser.)
+        """
+
+        with self.limiter.visit(url):
+            driver = self.acquire()
+            broken = False
+            try:
+                yield driver
+            except (selenium.common.exceptions.TimeoutException,
+                    selenium.common.exceptions.NoSuchElementException):
+                # (the page lacked an element; the browser itself is fine)
+                raise
+            except selenium.common.exceptions.WebDriverException:
+                broken = True
+                raise
+            finally:
+                self.release(driver, broken)
+
+    def map(self, fetch, items: list, key, url, done=None) -> tuple:
+        """
+        Call fetch(item, driver) for every item, concurrently.
+
+        Args..
+        fetch (callable) Called as fetch(item, driver) with a session borrowed from the pool
+        items (list) The items (locations) to be fetched
+        key (callable) key(item) is the item's key in the returned dictionaries
+        url (callable) url(item) is the URL the item visits first (for the per-host limits)
+        done (callable) Called as done(item, result) as soon as each item succeeds (optional)
+
+        Returns..
+        (results, errors) as for dispatch()
+        """
+
+        def task(item):
+            with self.session(url(item)) as driver:
+                return fetch(item, driver)
+
+        return dispatch(task, items, key, self.size, done, url, self.rate, self.burst)
+
+    def close(self):
+        """
+        Quit every session in the pool
+        """
+
+        with self.lock:
+            drivers, self.drivers = self.drivers, []
+            self.created = 0
+        self.idle = Queue()
+        for driver in drivers:
+            try:
+                driver.quit()
+            except selenium.common.exceptions.WebDriverException:
+                pass
@@ -0,0 +1,134 @@
+#!/bin/env python3
+"""
+A module for retrieving tide pages over plain HTTP, without a browser (for tidesapp only).
+
+tideschart.com renders its weekly tide table on the server, so the table's rows are present in the
+raw HTML of the page. Fetching the page with requests and evaluating the same XPATH with lxml gives
+the same rows as a browser does, in a fraction of the time and memory.
+
+Connections are pooled and kept alive (one requests.Session, shared by all threads), and responses
+are gzip-compressed. If a page arrives without the table (e.g., it is rendered by JavaScript, or
+the site sent a challenge page instead), HttpFetcher.weekly_rows returns None and the caller falls
+back to a browser.
+
+Requests may be made conditional on a cached copy's ETag and Last-Modified headers, in which case the
+server may reply 304 Not Modified (see tide_cache.py).
+"""
+
+import lxml.html
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from driver_pool import HostLimiter, dispatch
+
+
+def row_text(element) -> str:
+    """
+    The text of a DOM element, as a browser renders it: the text of each child element, separated
+    by spaces. (lxml's text_content() would run adjacent table cells together.)
+
+    Args..
+    element (lxml.html.HtmlElement) A DOM element, e.g., a table row
+
+    Returns..
+    text (str) The element's text
+    """
+
+    return ' '.join(text.strip() for text in element.itertext() if text.strip())
+
+
+class HttpFetcher:
+    """
+    Fetches pages over a pool of keep-alive HTTP connections, with a per-host concurrency limit
+
+    Usage..
+
+        with HttpFetcher(size=4, per_host=2) as fetcher:
+            rows = fetcher.weekly_rows(URL, TidesApp.WEEKLY_TABLE_XPATH)
+    """
+
+    USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) tidesapp'
+
+    def __init__(self, size: int = 4, per_host: int = 2, timeout: float = 30, rate: float = None,
+                 burst: int = 1):
+        if size < 1:
+            raise ValueError
+        self.size = size
+        self.timeout = timeout
+        self.rate = rate
+        self.burst = burst
+        self.limiter = HostLimiter(per_host)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size,
+                              max_retries=Retry(total=2, backoff_factor=0.5, status_forcelist=[502, 503, 504]))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'User-Agent': HttpFetcher.USER_AGENT, 'Accept-Encoding': 'gzip, deflate'})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, url: str, etag: str = None, last_modified: str = None) -> requests.Response:
+        """
+        GET a page, subject to the per-host limit. Raises requests.HTTPError for an error status.
+
+        Args..
+        url (str) The page's URL
+        etag (str) The ETag of a cached copy of the page (optional)
+        last_modified (str) The Last-Modified header of a cached copy of the page (optional)
+
+        Returns..
+        response (requests.Response) The response; its status_code is 304 if the page is unchanged
+                                     since the cached copy
+        """
+
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        with self.limiter.visit(url):
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+        return response
+
+    def weekly_rows(self, url: str, xpath: str):
+        """
+        Retrieve a page and extract the text of the elements matching an XPATH.
+
+        Args..
+        url (str) The page's URL
+        xpath (str) An XPATH selecting the rows of the weekly tide table
+
+        Returns..
+        rows (list) The text of each row, or None if the page has no such rows
+        """
+
+        return HttpFetcher.rows(self.get(url), xpath)
+
+    @staticmethod
+    def rows(response: requests.Response, xpath: str):
+        """
+        Extract the text of the elements matching an XPATH from a retrieved page. Returns a list
+        of the text of each element, or None if the page has no such elements.
+        """
+
+        page = lxml.html.fromstring(response.content)
+        rows = page.xpath(xpath)
+        if not rows:
+            return None
+        return [row_text(row) for row in rows]
+
+    def map(self, fetch, items: list, key, done=None, url=None) -> tuple:
+        """
+        Call fetch(item) for every item, concurrently, subject to the per-host rate limit if url(item)
+        is given. Returns (results, errors) as for dispatch().
+        """
+
+        return dispatch(fetch, items, key, self.size, done, url, self.rate, self.burst)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,168 @@
+#!/bin/env python3
+"""
+A module for scheduling tidesapp's page visits (for tidesapp only).
+
+Scheduler runs one task per location on a pool of worker threads, from an asyncio event loop which
+decides when each task may start..
+
+- A token bucket per host limits the rate at which tasks visiting that host start (with bursts of
+  up to 'burst' tasks), whatever the number of worker threads. A task takes its token once a worker
+  thread is free for it, just before it starts.
+
+- A task which finds itself throttled by the site (it raises Throttled, e.g. when tideschart.com
+  replies "Too many search requests") is retried after an exponential backoff with jitter. The
+  backoff is awaited without holding a worker thread (or a browser), so the other locations carry
+  on meanwhile, and the host's bucket is drained so that its other tasks slow down too.
+
+The total run time is therefore bounded by the host's rate, not by the sum of the sleeps.
+"""
+
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+
+class Throttled(Exception):
+    """
+    Raised by a task which the site refused to serve because of too many requests
+    """
+
+
+class TokenBucket:
+    """
+    Allows 'rate' acquisitions per second on average, in bursts of up to 'burst'
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0 or burst < 1:
+            raise ValueError
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """
+        Wait for a token, and take it. (Waiters are served in turn.)
+        """
+
+        async with self.lock:
+            self.refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self.refill()
+            self.tokens -= 1
+
+    def drain(self):
+        self.refill()
+        self.tokens = min(self.tokens, 0.)
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """
+    The delay before retry number 'attempt' (1, 2, ..): exponential backoff with full jitter, i.e.
+    a random delay of up to base * 2**(attempt - 1) seconds, capped at 'cap'.
+    """
+
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class Scheduler:
+    """
+    Runs task(item) for every item, on up to max_workers threads, with a per-host rate limit and
+    backoff on Throttled.
+
+    Usage..
+
+        results, errors = Scheduler(max_workers=4, rate=1.0).run(task, items, key, url)
+    """
+
+    # Backoff: the first retry waits up to BASE_DELAY seconds, doubling with each retry up to MAX_DELAY
+    BASE_DELAY = 2.
+    MAX_DELAY = 60.
+    MAX_RETRIES = 8
+
+    def __init__(self, max_workers: int, rate: float = None, burst: int = 1):
+        if max_workers < 1:
+            raise ValueError
+        self.max_workers = max_workers
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.backoffs = []
+
+    def bucket(self, url: str):
+        host = urlparse(url).netloc
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate, self.burst)
+        return self.buckets[host]
+
+    def run(self, task, items: list, key, url=None, done=None) -> tuple:
+        """
+        Call task(item) for every item, concurrently.
+
+        Args..
+        task (callable) Called as task(item), on a worker thread
+        items (list) The items (locations) to be processed
+        key (callable) key(item) is the item's key in the returned dictionaries
+        url (callable) url(item) is the URL the item visits (for the per-host rate limit; optional)
+        done (callable) Called as done(item, result) as soon as each item succeeds, on the item's
+                        thread (optional)
+
+        Returns..
+        results (dict) key -> the value returned by task, for each item which succeeded
+        errors (dict) key -> the exception raised by task, for each item which failed
+
+        Both dictionaries are ordered as the items are.
+        """
+
+        return asyncio.run(self.run_async(task, items, key, url, done))
+
+    async def run_async(self, task, items: list, key, url=None, done=None) -> tuple:
+
+        def task_done(item):
+            result = task(item)
+            if done is not None:
+                done(item, result)
+            return result
+
+        loop = asyncio.get_running_loop()
+        # (a task takes a worker before its token, so that tokens aren't taken, and spent, by tasks
+        # waiting for a worker: a drained bucket then slows down every task which hasn't yet started)
+        workers = asyncio.Semaphore(self.max_workers)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+
+            async def attempt(item):
+                bucket = self.bucket(url(item)) if self.rate and url is not None else None
+                for retry in range(1, self.MAX_RETRIES + 2):
+                    try:
+                        async with workers:
+                            if bucket is not None:
+                                await bucket.acquire()
+                            return await loop.run_in_executor(executor, task_done, item)
+                    except Throttled:
+                        if retry > self.MAX_RETRIES:
+                            raise
+                        if bucket is not None:
+                            bucket.drain()
+                        delay = backoff_delay(retry, self.BASE_DELAY, self.MAX_DELAY)
+                        self.backoffs.append((key(item), delay))
+                        await asyncio.sleep(delay)
+
+            outcomes = await asyncio.gather(*(attempt(item) for item in items), return_exceptions=True)
+
+        results, errors = {}, {}
+        for item, outcome in zip(items, outcomes):
+            if isinstance(outcome, Exception):
+                errors[key(item)] = outcome
+            else:
+                results[key(item)] = outcome
+        return results, errors
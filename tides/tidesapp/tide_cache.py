@@ -0,0 +1,201 @@
+#!/bin/env python3
+"""
+A module for caching retrieved tide data on disk (for tidesapp only).
+
+tideschart.com's weekly tide table for a location changes once a day, so the tides parsed from it
+(a week of tide_parser.DayTides records) are cached in an SQLite database, keyed by location (URL
+or MUNI) and the local date on which they were retrieved. An entry is fresh until local midnight;
+after that it is stale, and the location is retrieved again.
+
+For pages retrieved over HTTP, the page's ETag and Last-Modified headers are saved with the entry.
+When the entry goes stale they are sent back with the next request (If-None-Match and
+If-Modified-Since); if the server replies 304 Not Modified, the stale entry is simply renewed for
+the new day.
+
+The cache also remembers the URL which each municipality (MUNI and HINT, operational mode 2)
+resolved to in tideschart.com's search results, so that a municipality is searched for only once;
+thereafter its tides are retrieved from the URL directly, as in operational mode 1 (until the URL
+fails, e.g. 404 Not Found, when the URL is forgotten and the municipality searched for again).
+
+SQLite serializes writers, so several tidesapp processes may share one cache file.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import date, datetime
+from tide_parser import DayTides, Tide
+
+
+def encode_week(week: list) -> str:
+    """
+    Serialize a week of DayTides records to JSON
+    """
+
+    return json.dumps([
+        [day_tides.day.isoformat(),
+         [[tide.time.isoformat(), tide.high, tide.height] for tide in day_tides.tides],
+         day_tides.sunrise.isoformat(),
+         day_tides.sunset.isoformat()]
+        for day_tides in week
+    ])
+
+
+def decode_week(text: str) -> list:
+    """
+    Deserialize a week of DayTides records from JSON
+    """
+
+    return [
+        DayTides(date.fromisoformat(day),
+                 tuple(Tide(datetime.fromisoformat(time), high, height) for time, high, height in tides),
+                 datetime.fromisoformat(sunrise),
+                 datetime.fromisoformat(sunset))
+        for day, tides, sunrise, sunset in json.loads(text)
+    ]
+
+
+class TideCache:
+    """
+    Persistent cache of tides: (location, date) -> a week of DayTides records, plus HTTP validators
+
+    Usage..
+
+        with TideCache('tides.sqlite') as cache:
+            week = cache.get(URL)
+            if week is None:
+                ...
+                cache.put(URL, week, etag, last_modified)
+    """
+
+    # Number of days for which stale entries are kept (for their validators)
+    KEEP_DAYS = 7
+
+    # (version 1 caches every tide, with heights, sunrise and sunset; version 0 cached only the high tides)
+    SCHEMA_VERSION = 1
+
+    def __init__(self, file: str):
+        directory = os.path.dirname(file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(file, timeout=30, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            if self.connection.execute('PRAGMA user_version').fetchone()[0] < TideCache.SCHEMA_VERSION:
+                self.connection.execute('DROP TABLE IF EXISTS tides')
+                self.connection.execute(f'PRAGMA user_version = {TideCache.SCHEMA_VERSION}')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS tides ('
+                ' location TEXT NOT NULL,'
+                ' date TEXT NOT NULL,'
+                ' tides TEXT NOT NULL,'
+                ' etag TEXT,'
+                ' last_modified TEXT,'
+                ' PRIMARY KEY (location, date))')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS places ('
+                ' muni TEXT NOT NULL,'
+                ' hint TEXT NOT NULL,'
+                ' url TEXT NOT NULL,'
+                ' PRIMARY KEY (muni, hint))')
+            self.connection.execute(
+                'DELETE FROM tides WHERE date < ?',
+                (date.fromordinal(date.today().toordinal() - TideCache.KEEP_DAYS).isoformat(),))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, location: str):
+        """
+        Fetch today's tides for a location.
+
+        Args..
+        location (str) The location's URL or MUNI
+
+        Returns..
+        week (list) The location's DayTides records, or None if they aren't cached today
+        """
+
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT tides FROM tides WHERE location = ? AND date = ?',
+                (location, date.today().isoformat())).fetchone()
+        if row is None:
+            return None
+        return decode_week(row[0])
+
+    def put(self, location: str, week: list, etag: str = None, last_modified: str = None):
+        """
+        Save today's tides for a location, with the HTTP validators of the page they came from.
+        """
+
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO tides VALUES (?, ?, ?, ?, ?)',
+                (location, date.today().isoformat(), encode_week(week), etag, last_modified))
+
+    def validators(self, location: str) -> tuple:
+        """
+        The ETag and Last-Modified headers of the location's most recent entry (None if not known)
+        """
+
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT etag, last_modified FROM tides WHERE location = ? ORDER BY date DESC LIMIT 1',
+                (location,)).fetchone()
+        return row if row is not None else (None, None)
+
+    def renew(self, location: str):
+        """
+        Copy the location's most recent entry to today (the page was Not Modified). Returns its week.
+        """
+
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO tides'
+                ' SELECT location, ?, tides, etag, last_modified FROM tides'
+                ' WHERE location = ? ORDER BY date DESC LIMIT 1',
+                (date.today().isoformat(), location))
+        return self.get(location)
+
+    def latest(self) -> dict:
+        """
+        The most recent tides of every location in the cache, fresh or stale.
+
+        Returns..
+        weeks (dict) location -> the location's most recent week of DayTides records, ordered by location
+        """
+
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT location, tides FROM tides AS entry'
+                ' WHERE date = (SELECT MAX(date) FROM tides WHERE location = entry.location)'
+                ' ORDER BY location').fetchall()
+        return {location: decode_week(tides) for location, tides in rows}
+
+    def resolve(self, muni: str, hint: str):
+        """
+        The URL which a municipality's search resolved to, or None if it hasn't been searched for
+        """
+
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT url FROM places WHERE muni = ? AND hint = ?', (muni, hint)).fetchone()
+        return row[0] if row is not None else None
+
+    def save_resolved(self, muni: str, hint: str, url: str):
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO places VALUES (?, ?, ?)', (muni, hint, url))
+
+    def forget_resolved(self, muni: str, hint: str):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM places WHERE muni = ? AND hint = ?', (muni, hint))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
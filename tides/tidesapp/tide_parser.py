@@ -0,0 +1,156 @@
+#!/bin/env python3
+"""
+A module for parsing the rows of tideschart.com's weekly tide tables (for tidesapp only).
+
+Each row of the table holds one day's tides, e.g...
+
+    'Mon 22 3:36am ▼ 0.98 ft 9:09am ▲ 6.56 ft 3:41pm ▼ 1.64 ft 9:17pm ▲ 7.55 ft ▲ 5:57am ▼ 7:35pm'
+
+..the day of week and day of month, three or four tides (time, ▲ for high or ▼ for low, and height
+in feet), then sunrise (▲) and sunset (▼).
+
+The row pattern is compiled once, when the module is loaded, and captures every field in one
+pass (the hours and minutes of each time separately). Times are converted with integer arithmetic
+rather than strptime, and the table's days of month are resolved to dates against a
+reference date (today) which is looked up once per table rather than once per row.
+"""
+
+import re
+from datetime import date, datetime, timedelta
+from typing import NamedTuple
+
+# (a time is captured as three groups: hours, minutes and 'a' or 'p'; a tide as five: its time, ▲ or ▼, height)
+_TIME = r'(\d{1,2}):(\d\d)\s*([ap])m'
+_TIDE = _TIME + r'\s+([▲▼])\s+(-?\d+(?:\.\d+)?)\s*ft\s+'
+
+ROW_PATTERN = re.compile(
+    r'\s*(?:Mon|Tue|Wed|Thu|Fri|Sat|Sun)\s+(\d{1,2})\s+'
+    + _TIDE + _TIDE + _TIDE + r'(?:' + _TIDE + r')?'
+    + r'▲\s*' + _TIME + r'\s+▼\s*' + _TIME + r'\s*'
+)
+
+# (the index of the first group of each tide, and of sunrise and sunset)
+_TIDE_GROUPS = (1, 6, 11, 16)
+_SUNRISE_GROUP = 21
+_SUNSET_GROUP = 24
+
+HIGH = '▲'
+
+
+class Tide(NamedTuple):
+    time: datetime
+    high: bool
+    height: float  # (feet)
+
+
+class DayTides(NamedTuple):
+    day: date
+    tides: tuple  # (of Tide, in time order)
+    sunrise: datetime
+    sunset: datetime
+
+
+def day_lookup(today: date = None) -> dict:
+    """
+    Map each day of month to a date, relative to a reference date.
+
+    A weekly tide table starts today, so a day of month at or after today's is this month, and one
+    before today's is next month (see datetime_utils.day2datetime).
+
+    Args..
+    today (date) The reference date (default: today)
+
+    Returns..
+    days (dict) day of month (int) -> date
+    """
+
+    today = today or date.today()
+    days = {}
+    for i in range(31):
+        day = today + timedelta(days=i)
+        days.setdefault(day.day, day)
+    return days
+
+
+def hour24(hours: str, meridiem: str) -> int:
+    """
+    Convert an hour on the 12-hour clock ("12", "a") to the 24-hour clock (0).
+    """
+
+    if meridiem == 'p':
+        return int(hours) % 12 + 12
+    return int(hours) % 12
+
+
+def parse_row(data: str, days: dict) -> DayTides:
+    """
+    Parse a single row of tides data.
+
+    Args..
+    data (str) The text of one row of the table (newlines are allowed)
+    days (dict) The day of month lookup (from day_lookup)
+
+    Returns..
+    A DayTides record
+    """
+
+    matched = ROW_PATTERN.fullmatch(data)
+    if not matched:
+        print(f"ERROR: Tide data not parsed: {data}")
+        raise ValueError
+
+    groups = matched.groups()
+    day = days.get(int(groups[0]))
+    if day is None:
+        print(f"ERROR: Invalid day of month: {data}")
+        raise ValueError
+
+    year, month, day_of_month = day.year, day.month, day.day
+    tides = tuple(
+        Tide(datetime(year, month, day_of_month, hour24(groups[i], groups[i + 2]), int(groups[i + 1])),
+             groups[i + 3] == HIGH, float(groups[i + 4]))
+        for i in _TIDE_GROUPS if groups[i] is not None
+    )
+    i, j = _SUNRISE_GROUP, _SUNSET_GROUP
+    return DayTides(day, tides,
+                    datetime(year, month, day_of_month, hour24(groups[i], groups[i + 2]), int(groups[i + 1])),
+                    datetime(year, month, day_of_month, hour24(groups[j], groups[j + 2]), int(groups[j + 1])))
+
+
+def parse_week(rows: list, today: date = None) -> list:
+    """
+    Parse all the rows of a weekly tide table.
+
+    Args..
+    rows (list) The text of each row of the table
+    today (date) The reference date (default: today)
+
+    Returns..
+    A list of DayTides records, one per row
+    """
+
+    days = day_lookup(today)
+    return [parse_row(data, days) for data in rows]
+
+
+def high_tide_times(day_tides: DayTides) -> list:
+    """
+    The times of a day's high tides. There must be one or two.
+    """
+
+    times = [tide.time for tide in day_tides.tides if tide.high]
+    if len(times) < 1:
+        print(f"ERROR: No high tide data found for: {day_tides.day}")
+        raise ValueError
+    if len(times) > 2:
+        print(f"ERROR: Too many high tides found for: {day_tides.day}")
+        raise ValueError
+    return times
+
+
+def week_high_tides(week: list) -> list:
+    """
+    The times of a week's high tides (see high_tide_times).
+    """
+
+    return [time for day_tides in week for time in high_tide_times(day_tides)]
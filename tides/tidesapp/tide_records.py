@@ -0,0 +1,212 @@
+#!/bin/env python3
+"""
+A module defining tidesapp's output: typed tide records, and exporters which write them to files.
+
+A TideRecord holds everything the weekly tide table shows for one location and day: every tide (high
+and low, with its height), sunrise and sunset.
+
+Exporters write the records of each location as soon as the location's tides are retrieved, so the
+output grows as the run progresses (and a consumer can follow it). The format is chosen by the output
+file's extension..
+
+    .json     A JSON array of records
+    .jsonl    JSON lines, one record per line
+    .csv      CSV, one row per tide (the day's fields repeated on each of its rows)
+    .parquet  Parquet, one row per tide as for CSV, one row group per location
+"""
+
+import abc
+import csv
+import os
+import threading
+from datetime import date, datetime
+
+import pyarrow
+import pyarrow.parquet
+from pydantic import BaseModel, ConfigDict
+
+
+class TideEvent(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    time: datetime
+    high: bool
+    height_ft: float
+
+
+class TideRecord(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    location: str
+    day: date
+    tides: list[TideEvent]
+    sunrise: datetime
+    sunset: datetime
+
+    @classmethod
+    def from_day_tides(cls, location: str, day_tides):
+        """
+        Create a record from a location and one of its tide_parser.DayTides records
+        """
+
+        return cls(
+            location=location,
+            day=day_tides.day,
+            tides=[TideEvent(time=tide.time, high=tide.high, height_ft=tide.height) for tide in day_tides.tides],
+            sunrise=day_tides.sunrise,
+            sunset=day_tides.sunset,
+        )
+
+    def rows(self) -> list:
+        """
+        The record flattened to one row (dict) per tide, with the columns in ROW_FIELDS
+        """
+
+        return [
+            {'location': self.location, 'day': self.day, 'time': tide.time,
+             'tide': 'high' if tide.high else 'low', 'height_ft': tide.height_ft,
+             'sunrise': self.sunrise, 'sunset': self.sunset}
+            for tide in self.tides
+        ]
+
+
+ROW_FIELDS = ['location', 'day', 'time', 'tide', 'height_ft', 'sunrise', 'sunset']
+
+
+def week_records(location: str, week: list) -> list:
+    return [TideRecord.from_day_tides(location, day_tides) for day_tides in week]
+
+
+class Exporter(abc.ABC):
+    """
+    Base class of the exporters. write() may be called from several threads at once.
+    """
+
+    def __init__(self, file: str):
+        self.file = file
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, location: str, week: list):
+        """
+        Write a location's tides.
+
+        Args..
+        location (str) The location's URL or MUNI
+        week (list) The location's tide_parser.DayTides records
+        """
+
+        records = week_records(location, week)
+        with self.lock:
+            self.write_records(records)
+
+    @abc.abstractmethod
+    def write_records(self, records: list):
+        """
+        Write records to the file (called with the lock held)
+        """
+
+    def close(self):
+        pass
+
+
+class JsonExporter(Exporter):
+
+    def __init__(self, file: str):
+        super().__init__(file)
+        self.fh = open(file, 'w')
+        self.fh.write('[')
+        self.count = 0
+
+    def write_records(self, records: list):
+        for record in records:
+            self.fh.write(',\n' if self.count else '\n')
+            self.fh.write(record.model_dump_json())
+            self.count += 1
+        self.fh.flush()
+
+    def close(self):
+        self.fh.write('\n]\n')
+        self.fh.close()
+
+
+class JsonLinesExporter(Exporter):
+
+    def __init__(self, file: str):
+        super().__init__(file)
+        self.fh = open(file, 'w')
+
+    def write_records(self, records: list):
+        self.fh.write(''.join(f"{record.model_dump_json()}\n" for record in records))
+        self.fh.flush()
+
+    def close(self):
+        self.fh.close()
+
+
+class CsvExporter(Exporter):
+
+    def __init__(self, file: str):
+        super().__init__(file)
+        self.fh = open(file, 'w', newline='')
+        self.writer = csv.DictWriter(self.fh, fieldnames=ROW_FIELDS)
+        self.writer.writeheader()
+
+    def write_records(self, records: list):
+        for record in records:
+            self.writer.writerows(
+                {**row, 'day': row['day'].isoformat(), 'time': row['time'].isoformat(),
+                 'sunrise': row['sunrise'].isoformat(), 'sunset': row['sunset'].isoformat()}
+                for row in record.rows())
+        self.fh.flush()
+
+    def close(self):
+        self.fh.close()
+
+
+class ParquetExporter(Exporter):
+
+    def __init__(self, file: str):
+        super().__init__(file)
+        self.schema = pyarrow.schema([
+            ('location', pyarrow.string()),
+            ('day', pyarrow.date32()),
+            ('time', pyarrow.timestamp('s')),
+            ('tide', pyarrow.string()),
+            ('height_ft', pyarrow.float64()),
+            ('sunrise', pyarrow.timestamp('s')),
+            ('sunset', pyarrow.timestamp('s')),
+        ])
+        self.writer = pyarrow.parquet.ParquetWriter(file, self.schema)
+
+    def write_records(self, records: list):
+        rows = [row for record in records for row in record.rows()]
+        self.writer.write_table(pyarrow.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+EXPORTERS = {
+    '.json': JsonExporter,
+    '.jsonl': JsonLinesExporter,
+    '.csv': CsvExporter,
+    '.parquet': ParquetExporter,
+}
+
+
+def open_exporter(file: str) -> Exporter:
+    """
+    Create the exporter for an output file, by the file's extension (see EXPORTERS).
+    """
+
+    extension = os.path.splitext(file)[1].lower()
+    if extension not in EXPORTERS:
+        print(f"ERROR: Unsupported output format: {file} (use one of {', '.join(EXPORTERS)})")
+        raise ValueError
+    return EXPORTERS[extension](file)
@@ -0,0 +1,283 @@
+#!/bin/env python3
+"""
+tide_service.py
+
+A small, long-running HTTP service (FastAPI) which answers queries about the tides in tidesapp's cache
+(see tide_cache.py)..
+
+    GET /locations                                  The locations known to the service
+    GET /tides/next-high?location=L&after=T         The next high tide at location L after time T
+                                                    (default: now)
+    GET /tides/high?start=T1&end=T2                 Every location's high tides between T1 and T2
+
+Locations may be given by their key in the cache (a URL or MUNI) or by name: the last part of a
+URL's path, with spaces for dashes (e.g., 'Crane Beach'), or the MUNI itself. Times are local
+(as in the tide tables), in ISO 8601 format, e.g., 2022-08-23T09:00.
+
+The high tides are held in memory in a TideIndex: a sorted NumPy array of times per location, and
+one for all locations together, so that each query is a binary search (numpy.searchsorted) and a
+slice, whatever the number of locations.
+
+The index is loaded from the cache at startup. If a file of locations is given (as for tidesapp.py),
+the service also retrieves those locations' tides in the background every 'refresh' seconds, through
+the cache (so a refresh costs nothing until the cached tides go stale at midnight), and swaps in a
+new index when the refresh is complete.
+
+Command line usage..
+
+    tide_service.py [-f file] [--host host] [--port port] [--refresh seconds] [--cache file]
+
+(the service is run by uvicorn)
+"""
+
+import argparse
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+from urllib.parse import urlparse
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+from tide_cache import TideCache
+from tidesapp import TidesApp
+
+
+class Location(BaseModel):
+    location: str
+    name: str
+
+
+class HighTide(BaseModel):
+    location: str
+    name: str
+    time: datetime
+    height_ft: float
+
+
+def location_name(location: str) -> str:
+    """
+    The name of a location: the last part of its URL's path, with spaces for dashes (e.g., 'Crane
+    Beach'), or its MUNI.
+    """
+
+    if '://' not in location:
+        return location
+    return urlparse(location).path.rstrip('/').rsplit('/', 1)[-1].replace('-', ' ')
+
+
+def local_time(time: datetime) -> np.datetime64:
+    """
+    A time as a NumPy datetime64 (to the second), converted to local time if it has a time zone
+    """
+
+    if time.tzinfo is not None:
+        time = time.astimezone().replace(tzinfo=None)
+    return np.datetime64(time, 's')
+
+
+class TideIndex:
+    """
+    The high tides of every location, sorted by time, for fast queries
+
+    Usage..
+
+        index = TideIndex(cache.latest())
+        index.next_high('Crane Beach', datetime.now())
+    """
+
+    def __init__(self, weeks: dict):
+        """
+        Args..
+        weeks (dict) location -> the location's week of tide_parser.DayTides records
+        """
+
+        self.locations = list(weeks)
+        self.keys = {}
+        for location in self.locations:
+            self.keys.setdefault(location_name(location).casefold(), location)
+            self.keys[location.casefold()] = location
+
+        self.highs = {}
+        for location, week in weeks.items():
+            highs = sorted((tide.time, tide.height) for day_tides in week for tide in day_tides.tides if tide.high)
+            self.highs[location] = (np.array([time for time, height in highs], dtype='datetime64[s]'),
+                                    np.array([height for time, height in highs], dtype=float))
+
+        # (all the locations' high tides, in one array sorted by time, with the location of each)
+        times = np.concatenate([self.highs[location][0] for location in self.locations]
+                               + [np.empty(0, dtype='datetime64[s]')])
+        heights = np.concatenate([self.highs[location][1] for location in self.locations] + [np.empty(0)])
+        owners = np.repeat(np.arange(len(self.locations)), [len(self.highs[location][0]) for location in self.locations])
+        order = np.argsort(times, kind='stable')
+        self.times, self.heights, self.owners = times[order], heights[order], owners[order]
+
+    def __len__(self):
+        return len(self.locations)
+
+    def lookup(self, location: str):
+        """
+        A location's key (URL or MUNI), from its key or name (case-insensitive). None if unknown.
+        """
+
+        return self.keys.get(location.casefold())
+
+    def high_tide(self, location: str, time: np.datetime64, height: float) -> HighTide:
+        return HighTide(location=location, name=location_name(location), time=time.item(), height_ft=float(height))
+
+    def next_high(self, location: str, after: datetime):
+        """
+        The first high tide at a location after a time.
+
+        Args..
+        location (str) The location's key or name
+        after (datetime) The time
+
+        Returns..
+        tide (HighTide) The high tide, or None if the location is unknown or has no later high tide
+        """
+
+        location = self.lookup(location)
+        if location is None:
+            return None
+        times, heights = self.highs[location]
+        i = np.searchsorted(times, local_time(after), side='right')
+        if i == len(times):
+            return None
+        return self.high_tide(location, times[i], heights[i])
+
+    def high_tides_between(self, start: datetime, end: datetime) -> list:
+        """
+        Every location's high tides between two times (inclusive), sorted by time.
+
+        Args..
+        start (datetime) The start of the period
+        end (datetime) The end of the period
+
+        Returns..
+        tides (list) HighTide records
+        """
+
+        first = np.searchsorted(self.times, local_time(start), side='left')
+        last = np.searchsorted(self.times, local_time(end), side='right')
+        return [self.high_tide(self.locations[owner], time, height)
+                for owner, time, height in zip(self.owners[first:last], self.times[first:last],
+                                               self.heights[first:last])]
+
+
+class TideService:
+    """
+    Holds the current TideIndex, and refreshes it (see the module's docstring)
+    """
+
+    # Seconds between background refreshes
+    REFRESH_SECONDS = 3600
+
+    def __init__(self, cache_file: str, locations_file: str = None, refresh: float = REFRESH_SECONDS,
+                 profile=None):
+        """
+        Args..
+        cache_file (str) The tide cache (see tide_cache.py)
+        locations_file (str) The locations to be retrieved in the background (optional)
+        refresh (float) Seconds between background refreshes
+        profile (BrowserProfile) The configuration of the browsers used by the refreshes (optional)
+        """
+
+        self.cache_file = cache_file
+        self.locations_file = locations_file
+        self.refresh_seconds = refresh
+        self.profile = profile
+        self.index = TideIndex({})
+        self.refreshed = None
+
+    def reload(self):
+        """
+        Rebuild the index from the cache (the new index replaces the old one in one assignment, so
+        queries in progress are unaffected)
+        """
+
+        with TideCache(self.cache_file) as cache:
+            self.index = TideIndex(cache.latest())
+        self.refreshed = datetime.now()
+
+    def refresh(self):
+        """
+        Retrieve the tides of the locations file into the cache (see TidesApp), then reload the index
+        """
+
+        if self.locations_file is not None:
+            app = TidesApp(self.profile)
+            app.load_user_locations(self.locations_file)
+            with TideCache(self.cache_file) as cache:
+                app.retrieve_all_weekly_tides(cache)
+        self.reload()
+
+    async def refresh_periodically(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as error:
+                print(f"ERROR: Unable to refresh the tides: {error!r}")
+            await asyncio.sleep(self.refresh_seconds)
+
+
+def create_app(service: TideService) -> FastAPI:
+    """
+    Create the service's FastAPI application.
+
+    Args..
+    service (TideService) The service holding the index
+
+    Returns..
+    app (FastAPI) The application
+    """
+
+    @asynccontextmanager
+    async def lifespan(app):
+        service.reload()
+        refresher = asyncio.create_task(service.refresh_periodically()) if service.locations_file else None
+        yield
+        if refresher is not None:
+            refresher.cancel()
+
+    app = FastAPI(title='tidesapp', lifespan=lifespan)
+
+    @app.get('/locations', response_model=list[Location])
+    def locations():
+        return [Location(location=location, name=location_name(location)) for location in service.index.locations]
+
+    @app.get('/tides/next-high', response_model=HighTide)
+    def next_high(location: str, after: datetime = None):
+        index = service.index
+        if index.lookup(location) is None:
+            raise HTTPException(status_code=404, detail=f"Unknown location: {location}")
+        tide = index.next_high(location, after or datetime.now())
+        if tide is None:
+            raise HTTPException(status_code=404, detail=f"No high tide known at {location} after {after}")
+        return tide
+
+    @app.get('/tides/high', response_model=list[HighTide])
+    def high_tides(start: datetime, end: datetime):
+        if local_time(end) < local_time(start):
+            raise HTTPException(status_code=422, detail='end is before start')
+        return service.index.high_tides_between(start, end)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve queries about the tides in tidesapp's cache")
+    parser.add_argument('-f', '--file', help='Also retrieve the tides of these locations, in the background')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--refresh', type=float, default=TideService.REFRESH_SECONDS)
+    parser.add_argument('--cache', default=TidesApp.CACHE_FILE)
+    args = parser.parse_args()
+
+    service = TideService(args.cache, args.file, args.refresh)
+    uvicorn.run(create_app(service), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
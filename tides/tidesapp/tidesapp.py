@@ -25,6 +25,8 @@ This app operates in one of two modes..
 
     If the input file contains place names and hints, the place names are entered in the search box
     at tideschart.com, and the hints are used to find the desired place from the search results.
+    Each place is searched for only once: the URL found is cached (see tide_cache.py), and later
+    runs retrieve the place's tides from that URL, as in operational mode 1.
 
 Command line usage..
 
@@ -33,6 +35,21 @@ Command line usage..
 where file is a JSON file containing either a list of URLs or a list of place names and hints.
 There is no specific limit on the number of URLs or places, tidesapp will query tide data from each.
 
+    tidesapp.py -f file -o output
+
+also writes every tide retrieved (high and low, with heights, and sunrise and sunset) to output, as
+JSON (.json or .jsonl), CSV (.csv) or Parquet (.parquet), as each location's tides are retrieved.
+Locations are queried concurrently by a small pool of headless browsers (see driver_pool.py), which
+load only the pages' HTML and keep their profiles from run to run (see browser_profile.py), with a
+cap on the number of concurrent visits to tideschart.com, and on the rate at which visits start. A
+search which tideschart.com throttles is retried later, with backoff, while the other locations carry
+on (see scheduler.py). In operational mode 1 the tide tables are
+first fetched over plain HTTP (see http_fetch.py); a browser is used only for pages whose table isn't
+present in the raw HTML.
+
+Retrieved tides are cached on disk until local midnight (see tide_cache.py), so repeated runs on
+the same day don't revisit the site.
+
 This script should run on most systems with python, selenium and the Chrome webdriver. There
 are some OS-specific (linux) operations that require running the app's test suite in a linux
 environment (*todo: remove this limitation!*).
@@ -60,19 +77,25 @@ Example JSON for operational mode 2 (place names and hints)..
 """
 
 import json
+import os
 import re
 from datetime import datetime
 from enum import Enum, auto
-from time import sleep
+from operator import itemgetter
 
+import requests
 import selenium.common.exceptions
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.wait import WebDriverWait
-from datetime_utils import (day2datetime, timestr2time,
-                            date_time_combine)
-from cli_utils import process_command_line
+from browser_profile import BrowserProfile
+from cli_utils import output_file, process_command_line
+from driver_pool import DriverPool
+from http_fetch import HttpFetcher
+from scheduler import Throttled
+from tide_cache import TideCache
+from tide_parser import day_lookup, high_tide_times, parse_row, parse_week, week_high_tides
+from tide_records import open_exporter
 
 
 class Modes(Enum):
@@ -87,28 +110,6 @@ class Modes(Enum):
     MUNIs = auto()
 
 
-def backoff():
-    """
-    This generator function is used by loops that need to pause for progressively longer times after each
-    iteration. The values returned can be used by the caller as seconds to sleep. The early retries have
-    relatively short pauses. The pauses increase with each iteration until we hit a max value, after which
-    we always return the max.
-
-    Args..
-
-        (none)
-
-    Yields..
-
-        sleep (int) The next sleep value from the sequence of sleep values
-    """
-
-    sleeps = [2, 4, 8, 12, 20, 32, 48] + [60]*1440  # (enough for ~24 hours of retries)
-
-    for sleep in sleeps:
-        yield sleep
-
-
 class TidesApp:
     """
     Implements the primary operations and properties required of the tidesapp application
@@ -157,18 +158,44 @@ class TidesApp:
         + 'and contains(text(), "this week")]/../tbody/tr'
     )
 
-    # Maximum number of timeouts to wait during a wait-for-web-element loop
-    MAX_TIMEOUTS = 10
+    # The domains the browsers may request pages and resources from (all other hosts are blocked)
+    FIRST_PARTY = ['tideschart.com']
+
+    # The browsers' profiles (HTTP cache and cookies), reused from run to run (set to None to start
+    # every run with fresh profiles)
+    PROFILE_DIR = os.path.expanduser('~/.cache/tidesapp/chrome')
+
+    # Number of concurrent browser sessions, and the maximum number of them visiting any one host
+    POOL_SIZE = 4
+    MAX_PER_HOST = 2
 
-    def __init__(self):
+    # Maximum number of visits started per second on any one host, and in a burst (see scheduler.py)
+    RATE_PER_HOST = 2.0
+    BURST_PER_HOST = 4
+
+    # Fetch tide tables over plain HTTP before resorting to a browser (operational mode 1 only)
+    HTTP_FETCH = True
+
+    # The cache of retrieved tides (set to None to disable the cache)
+    CACHE_FILE = os.path.expanduser('~/.cache/tidesapp/tides.sqlite')
+
+    def __init__(self, profile=None):
+        """
+        Args..
+
+        profile (BrowserProfile): The configuration of the browsers, including the seconds to wait
+                                  for web elements (see browser_profile.py). Defaults to a headless,
+                                  resource-trimmed profile, reused from run to run.
+        """
+
+        self.profile = profile or BrowserProfile(first_party=TidesApp.FIRST_PARTY, user_data_dir=TidesApp.PROFILE_DIR)
         self.mode = Modes.UNKNOWN
         self.locations = []
-        self.quickwait = None
-        self.longwait = None
         self.driver = None
         self.weekly_tides = None
+        self.weeks = None
+        self.errors = None
         self.attempts = []
-        self.sleep_tracker = []
 
     def load_user_locations(self, file=None):
         """
@@ -194,6 +221,7 @@ class TidesApp:
         """
 
         if file is None:
+            self.mode = Modes.URLs
             self.locations = TidesApp.DEFAULT_URLS
         else:
             with open(file) as fh:
@@ -246,126 +274,169 @@ class TidesApp:
         # 'Mon 22 3:36am ▼ 0.98 ft 9:09am ▲ 6.56 ft 3:41pm ▼ 1.64 ft 9:17pm ▲ 7.55 ft ▲ 5:57am ▼ 7:35pm'
         # 'Mon 22 3:36am ▼ 0.98 ft 9:09am ▲ 6.56 ft 3:41pm ▼ 1.64 ft ▲ 5:57am ▼ 7:35pm'
         #
-        # Notes..
-        #
-        # (1) The web page indicates high tide with unicode character
-        #     up triangle, and low tide with down triangle.
-        #
-        # (2) It is possible to have only three tides in a day!
+        # (see tide_parser.py; to parse a whole table, use parse_weekly_rows)
 
-        # The following regex will parse any data adhering to the format in the above examples..
+        return high_tide_times(parse_row(data, day_lookup()))
 
-        pattern = re.compile(
-         "^\s*" +
-         "(?P<day>Mon|Tue|Wed|Thu|Fri|Sat|Sun)\s+" +
-         "(?P<dayno>\d+)\s+" +
-         "(?P<tide1_time>\d+:\d\d\s*(?:am|pm))\s+(?P<tide1_hilo>(?:▲|▼))\s+(?P<tide1_height>\d+(?:\.\d+|))\s*ft\s+" +
-         "(?P<tide2_time>\d+:\d\d\s*(?:am|pm))\s+(?P<tide2_hilo>(?:▲|▼))\s+(?P<tide2_height>\d+(?:\.\d+|))\s*ft\s+" +
-         "(?P<tide3_time>\d+:\d\d\s*(?:am|pm))\s+(?P<tide3_hilo>(?:▲|▼))\s+(?P<tide3_height>\d+(?:\.\d+|))\s*ft\s+" +
-         "(?:(?P<tide4_time>\d+:\d\d\s*(?:am|pm))\s+(?P<tide4_hilo>(?:▲|▼))\s+(?P<tide4_height>\d+(?:\.\d+|))\s*ft\s+|)" +
-         "▲\s*(?P<sunrise>\d+:\d\d\s*(?:am|pm))\s+" +
-         "▼\s*(?P<sunset>\d+:\d\d\s*(?:am|pm))\s*$"
-        )
+    def get_weekly_tides(self, URL, driver=None):
+        """
+        Retrive tide data for one location. Return a list of tides for the upcoming week.
 
-        # Get rid of all newlines in the data stream, they may be safely ignored in this method
-        data = re.sub('\n', ' ', data)
+        This method is only for operational mode 1.
 
-        # Parse the row's data..
+        This method navigates the browser to a URL which renders weekly tide data for one
+        particular location.
 
-        matched = re.match(pattern, data)
+        The table of tide data is located in the DOM and, for each day in the table, the
+        tide data are extracted and saved to the weekly_tides object.
 
-        if not matched:
-            print(f"ERROR: Tide data not parsed: {data}")
-            raise ValueError
+        The browser object (self.driver) is assumed to have already been created, unless a
+        browser is passed in.
 
-        # Convert the day to a datetime
-        this_day = day2datetime(matched.group('dayno'))
-
-        # Assemble the list of tides
-        this_day_high_tides = []
-        for timestr, hilo in [
-            (matched.group('tide1_time'), matched.group('tide1_hilo')),
-            (matched.group('tide2_time'), matched.group('tide2_hilo')),
-            (matched.group('tide3_time'), matched.group('tide3_hilo')),
-            (matched.group('tide4_time'), matched.group('tide4_hilo'))
-        ]:
-            # Check if this tide data is for a high tide or low tide
-            if hilo == '▲':
-                # ok, it is for a high tide! Continue processing..
-
-                # Convert time (e.g., "3:32 am") to a datetime object
-                this_high_tide_time = timestr2time(timestr)
-                # Combine with the day's datetime
-                this_high_tide_datetime = date_time_combine(
-                    this_day, this_high_tide_time)
-                # Append the datetime
-                this_day_high_tides.append(this_high_tide_datetime)
-
-        if len(this_day_high_tides) < 1:
-            print(f"ERROR: No high tide data found for: {data}")
-            raise ValueError
-        if len(this_day_high_tides) > 2:
-            print(f"ERROR: Too many high tides found for: {data}")
-            raise ValueError
+        Args..
 
-        return this_day_high_tides
+        URL (str): A URL, starting with 'https://www.tideschart.com/' that renders a
+                   weekly tide table for one location.
 
-    def get_weekly_tides(self, URL):
+        driver (WebDriver): The browser to use (e.g., one borrowed from a DriverPool). Defaults
+                            to self.driver.
+
+        Returns..
+
+        week, a list of DayTides records (see tide_parser.py) for a particular location: every
+        tide, with its height, and sunrise and sunset, for each day of the upcoming week
         """
-        Retrive tide data for one location. Return a list of tides for the upcoming week.
 
-        This method is only for operational mode 1.
+        driver = driver or self.driver
+        longwait = WebDriverWait(driver, self.profile.long_wait)
 
-        This method navigates the browser to a URL which renders weekly tide data for one
-        particular location.
+        driver.get(URL)
+        longwait.until(EC.presence_of_element_located((By.XPATH, TidesApp.WEEKLY_TABLE_XPATH)))
+        weekly_tides_dom = driver.find_elements(By.XPATH, TidesApp.WEEKLY_TABLE_XPATH)
 
-        The table of tide data is located in the DOM and, for each day in the table, the
-        tide data are extracted and saved to the weekly_tides object.
+        return self.parse_weekly_rows([row.text for row in weekly_tides_dom])
 
-        The browser object (self.driver) is assumed to have already been created.
+    def get_weekly_tides_via_http(self, URL, fetcher, cache=None):
+        """
+        Retrive tide data for one location without a browser. Return a list of tides for the
+        upcoming week, or None if the page's tide table could not be found in its HTML.
+
+        This method is only for operational mode 1.
+
+        If a cache is passed in and it holds an earlier copy of the location's tides, the
+        request is conditional on that copy's ETag/Last-Modified. If the server replies that
+        the page is unchanged, the cached week is renewed and returned. A newly parsed week
+        is saved to the cache.
 
         Args..
 
         URL (str): A URL, starting with 'https://www.tideschart.com/' that renders a
                    weekly tide table for one location.
 
+        fetcher (HttpFetcher): The HTTP connection pool to use
+
+        cache (TideCache): The cache of retrieved tides (optional)
+
         Returns..
 
-        weekly_tides, a list of high tides over one week for a particular location
+        week, a list of DayTides records (see tide_parser.py) for a particular location, or None
         """
 
-        self.driver.get(URL)
-        self.longwait.until(EC.presence_of_element_located((By.XPATH, TidesApp.WEEKLY_TABLE_XPATH)))
-        weekly_tides_dom = self.driver.find_elements_by_xpath(TidesApp.WEEKLY_TABLE_XPATH)
+        etag, last_modified = cache.validators(URL) if cache is not None else (None, None)
+        response = fetcher.get(URL, etag, last_modified)
+        if response.status_code == 304:
+            return cache.renew(URL)
 
-        if not len(weekly_tides_dom) == 7:
-            raise ValueError
+        rows = fetcher.rows(response, TidesApp.WEEKLY_TABLE_XPATH)
+        if rows is None:
+            return None
+        week = self.parse_weekly_rows(rows)
+        if cache is not None:
+            cache.put(URL, week, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return week
 
-        weekly_tides_one_location = []
+    def parse_weekly_rows(self, rows):
+        """
+        Parse the seven rows of a weekly tide table. Return a list of DayTides records.
 
-        for i in range(7):
-            weekly_tides_one_location += self.parse_high_tide_data(weekly_tides_dom[i].text)
+        Each day must have one or two high tides.
 
-        return weekly_tides_one_location
+        Args..
+
+        rows (list): The text of each row of the table
+
+        Returns..
 
-    def get_weekly_tides_via_search_box(self, municipality):
+        week, a list of DayTides records (see tide_parser.py) for a particular location: every
+        tide, with its height, and sunrise and sunset, for each day of the upcoming week
+        """
+
+        if not len(rows) == 7:
+            raise ValueError
+
+        week = parse_week(rows)
+        week_high_tides(week)  # (validates the number of high tides)
+        return week
+
+    def get_weekly_tides_via_search_box(self, municipality, driver=None, cache=None):
         """
         Retrive tide data for one location. Return a list of tides for the upcoming week.
 
         This method is only for operational mode 2.
 
         This version interracts with the search box at www.tideschart.com in order to
-        bring up the tide chart for the requested location.
+        find the URL of the tide chart for the requested location (see search_for_URL), then
+        retrieves the tide chart as in operational mode 1.
 
-        The table of tide data is located in the DOM and, for each day in the table, the
-        tide data are extracted and saved to the weekly_tides object.
+        If a cache is passed in, the URL found is saved to it, and a municipality which has
+        been searched for before is not searched for again.
 
-        The browser object (self.driver) is assumed to have already been created.
+        The browser object (self.driver) is assumed to have already been created, unless a
+        browser is passed in.
+
+        Args..
+
+        municipality (dict): A dictionary with the 'MUNI' and 'HINT' keys (see search_for_URL)
+
+        driver (WebDriver): The browser to use (e.g., one borrowed from a DriverPool). Defaults
+                            to self.driver.
+
+        cache (TideCache): The cache of resolved URLs (optional)
+
+        Returns..
+
+        week, a list of DayTides records (see tide_parser.py) for a particular location: every
+        tide, with its height, and sunrise and sunset, for each day of the upcoming week
+        """
+
+        driver = driver or self.driver
+
+        URL = None
+        if cache is not None:
+            URL = cache.resolve(municipality['MUNI'], municipality['HINT'])
+        if URL is None:
+            URL = self.search_for_URL(municipality, driver)
+            if cache is not None:
+                cache.save_resolved(municipality['MUNI'], municipality['HINT'], URL)
+
+        return self.get_weekly_tides(URL, driver)
+
+    def search_for_URL(self, municipality, driver=None):
+        """
+        Search for a location. Return the URL of its weekly tide table.
+
+        This method is only for operational mode 2.
+
+        This method interracts with the search box at www.tideschart.com, and picks the
+        requested location's link from the search results.
+
+        The browser object (self.driver) is assumed to have already been created, unless a
+        browser is passed in.
 
         NOTE: The site (tideschart.com) implements a throttling mechanism which prevents us
-        from issuing too many searches in a certain time period. This method contains a
-        while-loop which will retry the search several times. Eventually one of our searches
-        succeeds.
+        from issuing too many searches in a certain time period. When the site says so, this
+        method raises Throttled, and the scheduler retries the location later, with backoff,
+        without holding up the browser meanwhile (see scheduler.py).
 
         Args..
 
@@ -377,9 +448,17 @@ class TidesApp:
 
             ['HINT'] (str): A pattern used to locate the location's link in the search results.
 
+        driver (WebDriver): The browser to use (e.g., one borrowed from a DriverPool). Defaults
+                            to self.driver.
+
         Returns..
 
-        weekly_tides, a list of high tides over one week for a particular location
+        URL (str), the URL of the location's weekly tide table
+
+        Raises..
+
+        Throttled, if the site refused the search because of too many searches
+        TimeoutError, if the location's link wasn't found in the search results
         """
 
         # Make an XPATH string from the template (TidesApp.SEARCH_RESULTS_XPATH). The template contains
@@ -387,39 +466,31 @@ class TidesApp:
 
         search_results_xpath = re.sub('HINT', municipality['HINT'], TidesApp.SEARCH_RESULTS_XPATH)
 
-        this_result = None
-        self.timeouts = self.too_many_searches_errors = 0
-        still_searching = True
-        sleeper = backoff()
-
-        while still_searching and self.timeouts < TidesApp.MAX_TIMEOUTS:
-
-            self.driver.get(TidesApp.BASE_URL)
-            searchbox_form = self.longwait.until(EC.presence_of_element_located((By.XPATH, TidesApp.SEARCHBOX_FORM_XPATH)))
-            searchbox_form.send_keys(municipality['MUNI'])
-            searchbox_click = self.longwait.until(EC.presence_of_element_located((By.XPATH, TidesApp.SEARCHBOX_CLICK_XPATH)))
-            searchbox_click.click()
-
-            try:
-                self.attempts.append([municipality['MUNI'], datetime.now()])
-                this_result = self.quickwait.until(EC.element_to_be_clickable((By.XPATH, search_results_xpath)))
-            except (selenium.common.exceptions.TimeoutException, TimeoutError):
-                self.timeouts += 1
-                too_many = self.quickwait.until(EC.presence_of_element_located((By.XPATH, TidesApp.TOO_MANY_SEARCHES_XPATH)))
-                if too_many is not None:
-                    self.too_many_searches_errors += 1
-                sleepval = next(sleeper)
-                self.sleep_tracker.append([municipality['MUNI'], sleepval])
-                sleep(sleepval)
-            finally:
-                if this_result is not None:
-                    still_searching = False
-
-        if still_searching:
-            print("ERROR: Unable to find search results")
+        driver = driver or self.driver
+        quickwait = WebDriverWait(driver, self.profile.quick_wait)
+        longwait = WebDriverWait(driver, self.profile.long_wait)
+
+        driver.get(TidesApp.BASE_URL)
+        searchbox_form = longwait.until(EC.presence_of_element_located((By.XPATH, TidesApp.SEARCHBOX_FORM_XPATH)))
+        searchbox_form.send_keys(municipality['MUNI'])
+        searchbox_click = longwait.until(EC.presence_of_element_located((By.XPATH, TidesApp.SEARCHBOX_CLICK_XPATH)))
+        searchbox_click.click()
+
+        # Wait for either the location's link, or the site's "too many searches" message
+
+        self.attempts.append([municipality['MUNI'], datetime.now()])
+        try:
+            quickwait.until(EC.any_of(
+                EC.element_to_be_clickable((By.XPATH, search_results_xpath)),
+                EC.presence_of_element_located((By.XPATH, TidesApp.TOO_MANY_SEARCHES_XPATH))))
+        except selenium.common.exceptions.TimeoutException:
+            print(f"ERROR: Unable to find search results for {municipality['MUNI']}")
             raise TimeoutError
 
-        this_result.click()
+        if driver.find_elements(By.XPATH, TidesApp.TOO_MANY_SEARCHES_XPATH):
+            raise Throttled(municipality['MUNI'])
+
+        return driver.find_element(By.XPATH, search_results_xpath).get_attribute('href')
 
 
     def mainapp(self):
@@ -429,27 +500,159 @@ class TidesApp:
 
         Parsing the user's command line
         Loading the user's location URLs into the app
-        Initializing the webdriver
-        Calling the weekly tides retriever for each location
+        Calling the weekly tides retriever for each location, concurrently
+        Writing the tides to the output file, if one was given (see tide_records.py)
         """
 
         file = process_command_line()
+        output = output_file()
         self.load_user_locations(file)
-        self.driver = driver = webdriver.Chrome()
-        self.quickwait = WebDriverWait(driver, 5)
-        self.longwait = WebDriverWait(driver, 30)
-        self.weekly_tides = {}
-        if self.mode is Modes.URLs:
-            for URL in self.locations:
-                self.weekly_tides[URL['URL']] = self.get_weekly_tides(URL['URL'])
-        elif self.mode is Modes.MUNIs:
-            for X in self.locations:
-                self.weekly_tides[X['MUNI']] = self.get_weekly_tides_via_search_box(X)
+        cache = TideCache(TidesApp.CACHE_FILE) if TidesApp.CACHE_FILE else None
+        exporter = open_exporter(output) if output else None
+        try:
+            self.retrieve_all_weekly_tides(cache, exporter)
+        finally:
+            if exporter is not None:
+                exporter.close()
+            if cache is not None:
+                cache.close()
+
+    def retrieve_all_weekly_tides(self, cache=None, exporter=None):
+        """
+        Retrieve tide data for every location (see get_all_weekly_tides), with a pool of browsers and
+        an HTTP connection pool which last for this call only.
+
+        Args..
+
+        cache (TideCache): The cache of retrieved tides and resolved URLs (optional)
+
+        exporter (Exporter): The output file's exporter (optional)
+
+        Returns: (nothing)
+        """
+
+        with DriverPool(TidesApp.POOL_SIZE, factory=self.profile.new_session, per_host=TidesApp.MAX_PER_HOST,
+                        rate=TidesApp.RATE_PER_HOST, burst=TidesApp.BURST_PER_HOST) as pool, \
+                HttpFetcher(TidesApp.POOL_SIZE, per_host=TidesApp.MAX_PER_HOST, rate=TidesApp.RATE_PER_HOST,
+                            burst=TidesApp.BURST_PER_HOST) as fetcher:
+            self.get_all_weekly_tides(pool, fetcher if TidesApp.HTTP_FETCH else None, cache, exporter)
+
+    def get_all_weekly_tides(self, pool, fetcher=None, cache=None, exporter=None):
+        """
+        Retrieve tide data for every location, using the browsers in a DriverPool.
+
+        Results are saved to self.weeks (every tide, see tide_parser.py) and self.weekly_tides
+        (the high tides), and failures to self.errors, all keyed by the location's URL
+        (operational mode 1) or MUNI (operational mode 2). A failure at one location does not
+        prevent the others from being retrieved.
+
+        If an exporter is passed in, each location's tides are written to it as soon as they
+        are retrieved.
 
-        # TODO: Do something with the data!!!
+        If an HttpFetcher is passed in, every location whose URL is known is first fetched over
+        HTTP; the browsers are used only for locations whose tide table wasn't in the page's
+        HTML, and for municipalities which have to be searched for. (Browsers are started on
+        demand, so if every page has its table, no browser is ever started.) A municipality whose
+        search is throttled by the site is retried later, with backoff, while the other locations
+        are retrieved (see scheduler.py).
 
-        # That is all for now
-        driver.close()
+        If a cache is passed in, locations whose tides were already retrieved today are taken
+        from the cache, and the tides of the others are saved to it. In operational mode 2, a
+        municipality whose URL was found by an earlier search is retrieved from that URL, as
+        in operational mode 1, rather than searched for again (unless retrieving it fails with an
+        HTTP error, e.g. 404 Not Found, when the municipality is searched for again).
+
+        Args..
+
+        pool (DriverPool): The pool of browsers to be used
+
+        fetcher (HttpFetcher): The HTTP connection pool to be used (optional)
+
+        cache (TideCache): The cache of retrieved tides and resolved URLs (optional)
+
+        exporter (Exporter): The output file's exporter (optional)
+
+        Returns: (nothing)
+        """
+
+        if self.mode is Modes.URLs:
+            key = itemgetter('URL')
+            URLs = {location['URL']: location['URL'] for location in self.locations}
+        elif self.mode is Modes.MUNIs:
+            key = itemgetter('MUNI')
+            URLs = {}
+            if cache is not None:
+                for location in self.locations:
+                    URL = cache.resolve(location['MUNI'], location['HINT'])
+                    if URL is not None:
+                        URLs[location['MUNI']] = URL
+        else:
+            return
+
+        def export(location, week):
+            if exporter is not None and week is not None:
+                exporter.write(key(location), week)
+
+        # (tides are cached by URL wherever the URL is known)
+        fetched, errors = {}, {}
+        pending = self.locations
+        if cache is not None:
+            fetched = {key(location): cache.get(URLs.get(key(location), key(location)))
+                       for location in self.locations}
+            pending = [location for location in self.locations if fetched[key(location)] is None]
+            for location in self.locations:
+                export(location, fetched[key(location)])
+
+        if fetcher is not None:
+            known = [location for location in pending if key(location) in URLs]
+            results, errors = fetcher.map(
+                lambda location: self.get_weekly_tides_via_http(URLs[key(location)], fetcher, cache),
+                known,
+                key=key,
+                done=export,
+                url=lambda location: URLs[key(location)])
+            fetched.update(results)
+            if self.mode is Modes.MUNIs:
+                # (a URL found by an earlier search which now fails is forgotten, and searched for again)
+                for location in known:
+                    if isinstance(errors.get(key(location)), requests.HTTPError):
+                        cache.forget_resolved(location['MUNI'], location['HINT'])
+                        del URLs[key(location)], errors[key(location)]
+            pending = [location for location in pending if results.get(key(location)) is None]
+            pending = [location for location in pending if key(location) not in errors]
+
+        def browse(location, driver):
+            if key(location) in URLs:
+                return self.get_weekly_tides(URLs[key(location)], driver)
+            return self.get_weekly_tides_via_search_box(location, driver, cache)
+
+        browsed, browse_errors = pool.map(
+            browse,
+            pending,
+            key=key,
+            url=lambda location: URLs.get(key(location), TidesApp.BASE_URL),
+            done=export)
+
+        if cache is not None:
+            for location in pending:
+                week = browsed.get(key(location))
+                if week is None:
+                    continue
+                URL = URLs.get(key(location))
+                if URL is None:
+                    URL = cache.resolve(location['MUNI'], location['HINT'])
+                cache.put(URL or key(location), week)
+        fetched.update(browsed)
+        errors.update(browse_errors)
+
+        # (in the order of the user's locations)
+        keys = [key(location) for location in self.locations]
+        self.weeks = {k: fetched[k] for k in keys if fetched.get(k) is not None}
+        self.weekly_tides = {k: week_high_tides(week) for k, week in self.weeks.items()}
+        self.errors = {k: errors[k] for k in keys if k in errors}
+
+        for location, error in self.errors.items():
+            print(f"ERROR: Unable to retrieve tides for {location}: {error!r}")
 
 
 if __name__ == '__main__':